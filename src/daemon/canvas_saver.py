@@ -2,7 +2,6 @@
 import json
 import os
 import tempfile
-import time
 
 import ray
 
@@ -93,9 +92,9 @@ class CanvasSaver(ServerSender):
         if distant_guis:
             for gui_addr in distant_guis:
                 for gpos in self.group_positions_session:
-                    self.send(gui_addr,
-                              '/ray/gui/patchbay/update_group_position',
-                              *gpos.spread())
+                    server.flow_send(gui_addr,
+                                     '/ray/gui/patchbay/update_group_position',
+                                     *gpos.spread())
 
     def send_all_group_positions(self, src_addr):
         if ray.are_on_same_machine(self.get_server_url(), src_addr.url):
@@ -125,17 +124,15 @@ class CanvasSaver(ServerSender):
                       file.name)
             return
 
-        i = 0
+        server = self.get_server()
+        if not server:
+            return
 
+        # messages are sent by the flow queue, as fast as GUI can take them
         for gpos in self.group_positions_session:
-            self.send(src_addr, '/ray/gui/patchbay/update_group_position',
-                      *gpos.spread())
-            i += 1
-            if i == 50:
-                # we need to slow big process of canvas memory
-                # to prevent loss OSC packets
-                time.sleep(0.020)
-                i = 0
+            server.flow_send(src_addr,
+                             '/ray/gui/patchbay/update_group_position',
+                             *gpos.spread())
 
         for gpos_cf in self.group_positions_config:
             for gpos_ss in self.group_positions_session:
@@ -143,21 +140,13 @@ class CanvasSaver(ServerSender):
                         and gpos_ss.group_name == gpos_cf.group_name):
                     break
             else:
-                self.send(src_addr, '/ray/gui/patchbay/update_group_position',
-                          *gpos_cf.spread())
-
-                i += 1
-                if i == 50:
-                    time.sleep(0.020)
-                    i = 0
+                server.flow_send(src_addr,
+                                 '/ray/gui/patchbay/update_group_position',
+                                 *gpos_cf.spread())
 
         for portgroup in self.portgroups:
-            self.send(src_addr, '/ray/gui/patchbay/update_portgroup',
-                      *portgroup.spread())
-
-            i += 1
-            if i == 50:
-                time.sleep(0.020)
+            server.flow_send(src_addr, '/ray/gui/patchbay/update_portgroup',
+                             *portgroup.spread())
 
     def save_group_position(self, *args):
         gp = ray.GroupPosition.new_from(*args)
@@ -1,6 +1,7 @@
 import os
 import shlex
 import shutil
+import math
 import signal
 import subprocess
 import time
@@ -12,9 +13,10 @@ from PyQt5.QtXml import QDomDocument
 import ray
 from server_sender import ServerSender
 from daemon_tools  import (TemplateRoots, Terminal, RS,
-                           get_code_root, highlight_text)
+                           highlight_text)
 from signaler import Signaler
 from scripter import ClientScripter
+from desktop_index import DesktopIndex
 
 NSM_API_VERSION_MAJOR = 1
 NSM_API_VERSION_MINOR = 0
@@ -25,6 +27,11 @@ OSC_SRC_SAVE = 2
 OSC_SRC_SAVE_TP = 3
 OSC_SRC_STOP = 4
 
+# number of durations remembered for each step in client timings
+TIMINGS_HISTORY_LEN = 20
+# under this number of durations, client timings are not used
+TIMINGS_MIN_SAMPLES = 3
+
 _translate = QCoreApplication.translate
 signaler = Signaler.instance()
 
@@ -68,6 +75,11 @@ class Client(ServerSender, ray.ClientData):
     last_dirty = 0.00
     _last_announce_time = 0.00
     last_open_duration = 0.00
+    last_stop_duration = 0.00
+    _stop_request_time = 0.00
+    _start_request_time = 0.00
+    _save_request_time = 0.00
+    launch_priority = 0
 
     has_been_started = False
 
@@ -88,6 +100,10 @@ class Client(ServerSender, ray.ClientData):
         self.custom_data = {}
         self.custom_tmp_data = {}
 
+        # durations history in seconds for
+        # spawn -> announce, announce -> open reply, save -> save reply
+        self.timings = {'announce': [], 'open': [], 'save': []}
+
         self._process = QProcess()
         self._process.started.connect(self._process_started)
         if ray.QT_VERSION >= (5, 6):
@@ -177,6 +193,12 @@ class Client(ServerSender, ray.ClientData):
         self.is_external = False
 
         if self.pending_command == ray.Command.STOP:
+            if self._stop_request_time:
+                self.last_stop_duration = \
+                    time.time() - self._stop_request_time
+                self.message("%s stopped in %.3f s"
+                             % (self.client_id, self.last_stop_duration))
+
             self.send_gui_message(_translate('GUIMSG',
                                     "  %s: terminated by server instruction")
                                     % self.gui_msg_style())
@@ -203,6 +225,9 @@ class Client(ServerSender, ray.ClientData):
         self.active = False
         self.pid = 0
         self.addr = None
+        self._stop_request_time = 0.00
+        self._start_request_time = 0.00
+        self._save_request_time = 0.00
 
         self.session.set_renameable(True)
 
@@ -361,36 +386,9 @@ class Client(ServerSender, ray.ClientData):
         if self.session.wait_for == ray.WaitFor.REPLY:
             self.session.end_timer_if_last_expected(self)
 
-    def _set_infos_from_desktop_contents(self, contents: str):
-        lang = os.getenv('LANG')
-        lang_strs = ("[%s]" % lang[0:5], "[%s]" % lang[0:2], "")
-        all_data = {'Comment': ['', '', ''],
-                    'Name': ['', '', ''],
-                    'Icon': ['', '', '']}
-
-        for line in contents.split('\n'):
-            if line.startswith('[') and line != "[Desktop Entry]":
-                break
-
-            if '=' not in line:
-                continue
-
-            var, egal, value = line.partition('=')
-            found = False
-
-            for searched in all_data:
-                for i in range(len(lang_strs)):
-                    lang_str = lang_strs[i]
-                    if var == searched + lang_str:
-                        all_data[searched][i] = value
-                        found = True
-                        break
-
-                if found:
-                    break
-
-        for data in all_data:
-            for str_value in all_data[data]:
+    def _set_infos_from_desktop_entry(self, entry: dict):
+        for data in ('Comment', 'Name', 'Icon'):
+            for str_value in DesktopIndex.localized(entry, data):
                 if data == "Comment":
                     if str_value and not self.description:
                         self._desktop_description = str_value
@@ -863,6 +861,10 @@ class Client(ServerSender, ray.ClientData):
         if open_duration.replace('.', '', 1).isdigit():
             self.last_open_duration = float(open_duration)
 
+        launch_priority = ctx.attribute('launch_priority')
+        if launch_priority.lstrip('-').isdigit():
+            self.launch_priority = int(launch_priority)
+
         prefix_mode = ctx.attribute('prefix_mode')
 
         if (prefix_mode and prefix_mode.isdigit()
@@ -948,6 +950,16 @@ class Client(ServerSender, ray.ClientData):
                     value = el.attribute(attribute_str)
                     self.custom_data[attribute_str] = value
 
+            elif el.tagName() == 'timings':
+                for key in self.timings:
+                    durations = []
+                    for dur_str in el.attribute(key).split(' '):
+                        try:
+                            durations.append(float(dur_str))
+                        except:
+                            continue
+                    self.timings[key] = durations[- TIMINGS_HISTORY_LEN:]
+
     def write_xml_properties(self, ctx):
         if self.protocol != ray.Protocol.RAY_NET:
             ctx.setAttribute('executable', self.executable_path)
@@ -1026,6 +1038,9 @@ class Client(ServerSender, ray.ClientData):
             ctx.setAttribute('last_open_duration',
                              str(self.last_open_duration))
 
+        if self.launch_priority:
+            ctx.setAttribute('launch_priority', self.launch_priority)
+
         if self.custom_data:
             xml = QDomDocument()
             cdt_xml = xml.createElement('custom_data')
@@ -1033,6 +1048,15 @@ class Client(ServerSender, ray.ClientData):
                 cdt_xml.setAttribute(data, self.custom_data[data])
             ctx.appendChild(cdt_xml)
 
+        if [k for k in self.timings if self.timings[k]]:
+            xml = QDomDocument()
+            timings_xml = xml.createElement('timings')
+            for key, durations in self.timings.items():
+                if durations:
+                    timings_xml.setAttribute(
+                        key, ' '.join(['%.3f' % d for d in durations]))
+            ctx.appendChild(timings_xml)
+
 
     def set_reply(self, errcode, message):
         self._reply_message = message
@@ -1062,6 +1086,13 @@ class Client(ServerSender, ray.ClientData):
         else:
             if self.pending_command == ray.Command.SAVE:
                 self.last_save_time = time.time()
+                if self._save_request_time:
+                    save_duration = (self.last_save_time
+                                     - self._save_request_time)
+                    self._add_timing('save', save_duration)
+                    self._save_request_time = 0.00
+                    self.message("%s saved in %.3fs"
+                                 % (self.name, save_duration))
 
                 self.send_gui_message(
                     _translate('GUIMSG', '  %s: saved')
@@ -1078,6 +1109,7 @@ class Client(ServerSender, ray.ClientData):
 
                 self.last_open_duration = \
                                         time.time() - self._last_announce_time
+                self._add_timing('open', self.last_open_duration)
 
                 self._send_reply_to_caller(OSC_SRC_OPEN, 'client opened')
 
@@ -1105,6 +1137,44 @@ class Client(ServerSender, ray.ClientData):
         if self.session.wait_for == ray.WaitFor.REPLY:
             self.session.end_timer_if_last_expected(self)
 
+    def _add_timing(self, key: str, duration: float):
+        durations = self.timings[key]
+        durations.append(duration)
+        if len(durations) > TIMINGS_HISTORY_LEN:
+            durations.__delitem__(0)
+
+    def timing_percentile(self, key: str, percent=95)->float:
+        durations = sorted(self.timings[key])
+        if not durations:
+            return 0.0
+
+        index = math.ceil(len(durations) * percent / 100) - 1
+        return durations[max(0, min(index, len(durations) - 1))]
+
+    def expected_duration(self, key: str)->float:
+        ''' returns the time (in seconds) after which client is statistically
+        late for key step, or 0.0 if client history is not big enough. '''
+        if len(self.timings[key]) < TIMINGS_MIN_SAMPLES:
+            return 0.0
+
+        return 1.5 * self.timing_percentile(key) + 1.0
+
+    def is_late(self, key: str)->bool:
+        if key == 'announce':
+            ref_time = self._start_request_time
+        elif key == 'open':
+            ref_time = self._last_announce_time
+        elif key == 'save':
+            ref_time = self._save_request_time
+        else:
+            return False
+
+        expected = self.expected_duration(key)
+        if not (ref_time and expected):
+            return False
+
+        return bool(time.time() - ref_time > expected)
+
     def set_label(self, label:str):
         self.label = label
         self.send_gui_client_properties()
@@ -1219,6 +1289,7 @@ class Client(ServerSender, ray.ClientData):
         self.session.set_renameable(False)
 
         self.last_dirty = 0.00
+        self.last_save_time = 0.00
         self.gui_has_been_visible = False
         self.gui_visible = False
         self.show_gui_ordered = False
@@ -1344,6 +1415,7 @@ class Client(ServerSender, ray.ClientData):
         self.session.send_monitor_event(
             'start_request', self.client_id)
 
+        self._start_request_time = time.time()
         self._process.setProcessEnvironment(process_env)
         self._process.start(self.executable_path, arguments)
 
@@ -1426,6 +1498,24 @@ class Client(ServerSender, ray.ClientData):
             return True
         return bool(self._process.state() == 2)
 
+    def is_starting(self)->bool:
+        if self.is_external:
+            return False
+        return bool(self._process.state() == 1)
+
+    def is_jack_host(self)->bool:
+        ''' True if client is known to create a lot of JACK ports,
+        session open is faster if these ones are launched first '''
+        executable = basename(self.executable_path)
+        if executable == 'ray-proxy':
+            executable = self._get_proxy_executable()
+
+        return bool(executable.lower().rstrip('0123456789')
+                    in ('ardour', 'carla', 'carla-jack-multi',
+                        'carla-rack', 'carla-patchbay', 'qtractor',
+                        'non-mixer', 'non-timeline', 'mixbus',
+                        'jack_mixer', 'hydrogen', 'zynaddsubfx'))
+
     def external_finished(self):
         self._process_finished(0, 0)
 
@@ -1500,6 +1590,16 @@ class Client(ServerSender, ray.ClientData):
 
         return bool(self.active and not self.no_save_level)
 
+    def is_clean_since_save(self)->bool:
+        ''' True if client has been saved since its start,
+        and reported it has no unsaved changes since this save. '''
+        if self.is_ray_hack() or not self.is_capable_of(':dirty:'):
+            return False
+
+        return bool(not self.dirty
+                    and self.last_save_time
+                    and self.last_save_time > self.last_dirty)
+
     def save(self, src_addr=None, src_path=''):
         if self.switch_state in (ray.SwitchState.RESERVED,
                                  ray.SwitchState.NEEDED):
@@ -1536,6 +1636,7 @@ class Client(ServerSender, ray.ClientData):
             elif self.can_save_now():
                 self.message("Telling %s to save" % self.name)
                 self.send_to_self_address("/nsm/client/save")
+                self._save_request_time = time.time()
 
                 self.pending_command = ray.Command.SAVE
                 self.set_status(ray.ClientStatus.SAVE)
@@ -1568,6 +1669,9 @@ class Client(ServerSender, ray.ClientData):
             self.pending_command = ray.Command.STOP
             self.set_status(ray.ClientStatus.QUIT)
 
+            if not self._stop_request_time:
+                self._stop_request_time = time.time()
+
             if not self._stopped_timer.isActive():
                 self._stopped_timer.start()
 
@@ -1587,6 +1691,8 @@ class Client(ServerSender, ray.ClientData):
         self.message("Commanding %s to quit" % self.name)
         if self.is_running():
             self.pending_command = ray.Command.STOP
+            if not self._stop_request_time:
+                self._stop_request_time = time.time()
             self.terminate()
             self.set_status(ray.ClientStatus.QUIT)
         else:
@@ -1606,8 +1712,10 @@ class Client(ServerSender, ray.ClientData):
         self.icon = new_client.icon
         self.auto_start = new_client.auto_start
         self.check_last_save = new_client.check_last_save
+        self.launch_priority = new_client.launch_priority
         self.ignored_extensions = new_client.ignored_extensions
         self.custom_data = new_client.custom_data
+        self.timings = new_client.timings
         self.description = new_client.description
         self.jack_naming = new_client.jack_naming
 
@@ -1857,12 +1965,6 @@ net_session_template:%s""" % (self.ray_net.daemon_url,
         if self.icon and self.description and self.label:
             return
 
-        desk_path_list = (
-            '%s/data' % get_code_root(),
-            '%s/.local' % os.getenv('HOME'),
-            '/usr/local',
-            '/usr')
-
         desktop_file = self.desktop_file
         if desktop_file == '//not_found':
             return
@@ -1873,78 +1975,19 @@ net_session_template:%s""" % (self.ray_net.daemon_url,
         if not desktop_file.endswith('.desktop'):
             desktop_file += ".desktop"
 
-        for desk_path in desk_path_list:
-            org_prefixs = ('', 'org.gnome.', 'org.kde.')
-            desk_file = ''
-
-            for org_prefix in org_prefixs:
-                desk_file = "%s/share/applications/%s%s" % (
-                    desk_path, org_prefix, desktop_file)
-
-                if os.path.isfile(desk_file):
-                    break
-            else:
-                continue
-
-            try:
-                file = open(desk_file, 'r')
-                contents = file.read()
-            except:
-                continue
+        desktop_index = DesktopIndex.get_instance()
 
-            self._set_infos_from_desktop_contents(contents)
-            break
+        entry = desktop_index.find_file(desktop_file)
+        if entry is not None:
+            self._set_infos_from_desktop_entry(entry)
+            return
 
+        desk_file, entry = desktop_index.find_executable(self.executable_path)
+        if entry is not None:
+            self.desktop_file = desk_file
+            self._set_infos_from_desktop_entry(entry)
         else:
-            desk_file_found = False
-            for desk_path in desk_path_list:
-                full_desk_path = "%s/share/applications" % desk_path
-                if not os.path.isdir(full_desk_path):
-                    # applications folder doesn't exists
-                    continue
-
-                if not os.access(full_desk_path, os.R_OK):
-                    # no permission to read this applications folder
-                    continue
-
-                for desk_file in os.listdir(full_desk_path):
-                    if not desk_file.endswith('.desktop'):
-                        continue
-
-                    full_desk_file = "%s/share/applications/%s" \
-                                        % (desk_path, desk_file)
-
-                    if os.path.isdir(full_desk_file):
-                        continue
-
-                    try:
-                        file = open(full_desk_file, 'r')
-                        contents = file.read()
-                    except:
-                        continue
-
-                    for line in contents.split('\n'):
-                        if line.startswith('Exec='):
-                            value = line.partition('=')[2]
-                            if (value == self.executable_path
-                                    or value.startswith(
-                                        "%s " % self.executable_path)
-                                    or value.endswith(
-                                        " %s" % self.executable_path)
-                                    or " %s " in value):
-                            #if self.executable_path in value:
-                                desk_file_found = True
-
-                                self.desktop_file = desk_file
-                                self._set_infos_from_desktop_contents(contents)
-                                break
-
-                    if desk_file_found:
-                        break
-                if desk_file_found:
-                    break
-            else:
-                self.desktop_file = '//not_found'
+            self.desktop_file = '//not_found'
 
     def save_as_template(self, template_name, src_addr=None, src_path=''):
         if src_addr:
@@ -2188,6 +2231,10 @@ net_session_template:%s""" % (self.ray_net.daemon_url,
             self.is_external = True
             self.pid = pid
             self.running_executable = executable_path
+        elif self._start_request_time:
+            self._add_timing('announce',
+                             time.time() - self._start_request_time)
+            self._start_request_time = 0.00
 
         if self.executable_path in RS.non_active_clients:
             RS.non_active_clients.remove(self.executable_path)
@@ -1,4 +1,6 @@
 import argparse
+import errno
+import fcntl
 import os
 import sys
 from PyQt5.QtCore import (QCoreApplication, QStandardPaths, QSettings,
@@ -56,6 +58,43 @@ def is_pid_child_of(child_pid, parent_pid)->bool:
 
     return False
 
+# (source device, destination device) where clone is not supported,
+# files are directly copied there.
+_reflink_unsupported = set()
+
+def reflink_file(src: str, dest: str)->bool:
+    ''' makes dest a copy on write clone of src, without data copy.
+    returns False if the filesystem can't do it. '''
+    # FICLONE ioctl, supported by btrfs, xfs, bcachefs...
+    FICLONE = 0x40049409
+
+    try:
+        devices = (os.stat(src).st_dev,
+                   os.stat(os.path.dirname(dest) or '.').st_dev)
+    except:
+        return False
+
+    if devices in _reflink_unsupported:
+        return False
+
+    try:
+        with open(src, 'rb') as src_file:
+            with open(dest, 'wb') as dest_file:
+                fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+    except BaseException as e:
+        if isinstance(e, OSError) and e.errno in (
+                errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV,
+                errno.EINVAL, errno.ENOSYS):
+            _reflink_unsupported.add(devices)
+
+        try:
+            os.remove(dest)
+        except:
+            pass
+        return False
+
+    return True
+
 def highlight_text(string)->str:
     if "'" in string:
         return '"%s"' % string
@@ -0,0 +1,250 @@
+
+import json
+import os
+import time
+import xdg.BaseDirectory
+
+from daemon_tools import dirname, get_code_root
+
+instance = None
+
+# minimum time in seconds between two checks of applications folders
+CHECK_INTERVAL = 2.0
+
+
+def _parse_desktop_file(full_path: str):
+    try:
+        with open(full_path, 'r') as file:
+            contents = file.read()
+    except:
+        return None
+
+    entry = {'exec': '', 'nsm_capable': None,
+             'Name': {}, 'Comment': {}, 'Icon': {}}
+
+    for line in contents.split('\n'):
+        if line.startswith('[') and line != "[Desktop Entry]":
+            break
+
+        if '=' not in line:
+            continue
+
+        var, egal, value = line.partition('=')
+
+        if var == 'Exec':
+            if not entry['exec']:
+                entry['exec'] = value.strip()
+        elif var.lower() == 'x-nsm-capable':
+            entry['nsm_capable'] = bool(value.strip().lower() == 'true')
+        else:
+            key, bracket, lang = var.partition('[')
+            if key in ('Name', 'Comment', 'Icon'):
+                lang_str = '[' + lang if bracket else ''
+                entry[key][lang_str] = value
+
+    return entry
+
+
+class DesktopIndex:
+    ''' Index of the XDG applications desktop files,
+    shared by clients and the client templates database.
+    A folder is only read again if its mtime changed,
+    a desktop file is only parsed again if its mtime changed.
+    The index is saved in the XDG cache, so executables without
+    desktop file are also known without reading anything. '''
+
+    def __init__(self):
+        self._cache_path = (xdg.BaseDirectory.xdg_cache_home
+                            + "/RaySession/desktop_index.json")
+
+        # key is a folder full path, value is a dict with
+        # 'mtime', 'subdirs' and 'files' (a dict of desktop files entries)
+        self._dirs = {}
+        self._modified = False
+        self._last_check = 0.0
+        self._exec_maps = {}
+
+        self._load_cache_file()
+
+    @staticmethod
+    def get_instance():
+        global instance
+
+        if instance is None:
+            instance = DesktopIndex()
+        return instance
+
+    @staticmethod
+    def desk_paths(with_code_root=True)->list:
+        desk_path_list = ['%s/.local' % os.getenv('HOME'),
+                          '/usr/local',
+                          '/usr']
+
+        if with_code_root:
+            desk_path_list.insert(0, '%s/data' % get_code_root())
+
+        return ["%s/share/applications" % p for p in desk_path_list]
+
+    @staticmethod
+    def localized(entry: dict, key: str)->list:
+        ''' returns values of key in the preferred languages order '''
+        lang = os.getenv('LANG', '')
+        values = []
+        for lang_str in ("[%s]" % lang[0:5], "[%s]" % lang[0:2], ""):
+            value = entry[key].get(lang_str)
+            if value:
+                values.append(value)
+        return values
+
+    def _load_cache_file(self):
+        if not os.path.isfile(self._cache_path):
+            return
+
+        try:
+            with open(self._cache_path, 'r') as f:
+                dirs = json.load(f)
+        except:
+            # cache file load failed, desktop files will be read again
+            return
+
+        if isinstance(dirs, dict):
+            self._dirs = dirs
+
+    def save_cache_file(self):
+        if not self._modified:
+            return
+
+        cache_dir = dirname(self._cache_path)
+        if not os.path.exists(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except:
+                return
+
+        try:
+            with open(self._cache_path, 'w') as f:
+                json.dump(self._dirs, f)
+            self._modified = False
+        except:
+            pass
+
+    def _scan_dir(self, dir_path: str):
+        try:
+            mtime = os.path.getmtime(dir_path)
+        except:
+            if self._dirs.pop(dir_path, None) is not None:
+                self._modified = True
+            return
+
+        if not os.access(dir_path, os.R_OK):
+            # no permission to read this applications folder
+            return
+
+        dir_dict = self._dirs.get(dir_path)
+        if dir_dict is None or dir_dict['mtime'] != mtime:
+            try:
+                names = sorted(os.listdir(dir_path))
+            except:
+                return
+
+            old_files = dir_dict['files'] if dir_dict else {}
+            dir_dict = {'mtime': mtime, 'subdirs': [], 'files': {}}
+
+            for name in names:
+                full_path = os.path.join(dir_path, name)
+                if os.path.isdir(full_path):
+                    dir_dict['subdirs'].append(name)
+                elif name.endswith('.desktop'):
+                    dir_dict['files'][name] = old_files.get(
+                        name, {'mtime': 0.0})
+
+            self._dirs[dir_path] = dir_dict
+            self._exec_maps.clear()
+            self._modified = True
+
+        for name, entry in dir_dict['files'].items():
+            full_path = os.path.join(dir_path, name)
+            try:
+                file_mtime = os.path.getmtime(full_path)
+            except:
+                continue
+
+            if entry['mtime'] == file_mtime:
+                continue
+
+            new_entry = _parse_desktop_file(full_path)
+            if new_entry is None:
+                continue
+
+            new_entry['mtime'] = file_mtime
+            dir_dict['files'][name] = new_entry
+            self._exec_maps.clear()
+            self._modified = True
+
+        for subdir in dir_dict['subdirs']:
+            self._scan_dir(os.path.join(dir_path, subdir))
+
+    def refresh(self, force=False):
+        if not force and time.time() - self._last_check < CHECK_INTERVAL:
+            return
+
+        for dir_path in self.desk_paths():
+            self._scan_dir(dir_path)
+
+        self._last_check = time.time()
+        self.save_cache_file()
+
+    def entries(self, dir_path: str, recursive=False)->list:
+        ''' returns a list of tuples (desktop file name, entry) '''
+        self.refresh()
+
+        dir_dict = self._dirs.get(dir_path)
+        if dir_dict is None:
+            return []
+
+        entries = [(name, entry) for name, entry in dir_dict['files'].items()
+                   if 'exec' in entry]
+
+        if recursive:
+            for subdir in dir_dict['subdirs']:
+                entries += self.entries(os.path.join(dir_path, subdir), True)
+
+        return entries
+
+    def find_file(self, desktop_file: str):
+        ''' returns the entry of the first desktop file named desktop_file
+        (or prefixed with 'org.gnome.' or 'org.kde.'), or None '''
+        self.refresh()
+
+        for dir_path in self.desk_paths():
+            dir_dict = self._dirs.get(dir_path)
+            if dir_dict is None:
+                continue
+
+            for org_prefix in ('', 'org.gnome.', 'org.kde.'):
+                entry = dir_dict['files'].get(org_prefix + desktop_file)
+                if entry is not None and 'exec' in entry:
+                    return entry
+        return None
+
+    def find_executable(self, executable: str):
+        ''' returns a tuple (desktop file name, entry) of the first
+        desktop file launching executable, or (None, None) '''
+        self.refresh()
+
+        if not self._exec_maps:
+            for dir_path in self.desk_paths():
+                dir_dict = self._dirs.get(dir_path)
+                if dir_dict is None:
+                    continue
+
+                for name, entry in dir_dict['files'].items():
+                    if not entry.get('exec'):
+                        continue
+
+                    words = entry['exec'].split(' ')
+                    for word in [entry['exec']] + words:
+                        if word and word not in self._exec_maps:
+                            self._exec_maps[word] = (name, entry)
+
+        return self._exec_maps.get(executable, (None, None))
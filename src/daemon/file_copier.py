@@ -1,18 +1,244 @@
 import os
 import shutil
-import subprocess
-import warnings
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from PyQt5.QtCore import QProcess, QTimer
+from PyQt5.QtCore import QTimer, QCoreApplication
+from daemon_tools import Terminal, reflink_file
 from osc_server_thread import OscServerThread
 from server_sender import ServerSender
+from signaler import Signaler
 import ray
 
-class CopyFile:
-    orig_path = ""
-    dest_path = ""
-    state = 0
-    size = 0
+_translate = QCoreApplication.translate
+signaler = Signaler.instance()
+
+# size of each copy system call,
+# copied size is counted and abort is checked between them
+COPY_CHUNK_SIZE = 8 * 1024**2
+
+# number of files copied at the same time
+COPY_WORKERS = 4
+
+# copy threads are niced as 'nice -n 15 cp' was
+COPY_NICENESS = 15
+
+
+def _size_string(size: int)->str:
+    return "%.1f MB" % (size / 1024**2)
+
+def _nice_thread():
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(),
+                       COPY_NICENESS)
+    except:
+        pass
+
+
+class CopyEngine:
+    ''' Copies files in worker threads, as 'cp -R' does.
+    Copied bytes are counted while they are written,
+    so progress is known without reading the destination.
+    Copy can be aborted at any time, even in the middle of a file,
+    then all started destinations are removed.
+    Files are cloned when the filesystem supports it (btrfs, xfs...),
+    then no data is written. With link_read_only, files without
+    any write permission are hardlinked.
+    signaler.copy_finished is emitted with this engine once done. '''
+
+    def __init__(self, copy_list: list, link_read_only=False):
+        # list of tuples (orig_path, dest_path)
+        self._copy_list = copy_list
+        self._link_read_only = link_read_only
+        self._lock = threading.Lock()
+        self._aborted = False
+
+        self.total_size = 0
+        self.copied_size = 0
+        self.written_size = 0
+        self.cloned_size = 0
+        self.linked_size = 0
+        self.started_paths = []
+        self.remove_failed_paths = []
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def abort(self):
+        self._aborted = True
+
+    def is_aborted(self)->bool:
+        return self._aborted
+
+    def _scan(self, orig_path: str, dest_path: str,
+              dirs: list, files: list, links: list):
+        paths = [(orig_path, dest_path)]
+
+        while paths:
+            if self._aborted:
+                return
+
+            orig, dest = paths.pop()
+
+            if os.path.islink(orig):
+                links.append((orig, dest))
+                continue
+
+            if os.path.isdir(orig):
+                dirs.append((orig, dest))
+                try:
+                    with os.scandir(orig) as entries:
+                        for entry in entries:
+                            paths.append((entry.path,
+                                          "%s/%s" % (dest, entry.name)))
+                except:
+                    sys.stderr.write("Unable to read %s\n" % orig)
+                continue
+
+            if not os.path.isfile(orig):
+                # fifo, socket, device, not copied
+                continue
+
+            try:
+                stat = os.stat(orig)
+            except:
+                sys.stderr.write("Unable to read %s\n" % orig)
+                continue
+
+            files.append((orig, dest, stat))
+            self.total_size += stat.st_size
+
+    def _copy_file(self, orig: str, dest: str, stat: os.stat_result):
+        if self._aborted:
+            return
+
+        if self._link_read_only and not stat.st_mode & 0o222:
+            try:
+                os.link(orig, dest)
+            except:
+                pass
+            else:
+                with self._lock:
+                    self.linked_size += stat.st_size
+                    self.copied_size += stat.st_size
+                return
+
+        if reflink_file(orig, dest):
+            try:
+                shutil.copymode(orig, dest)
+            except:
+                pass
+
+            with self._lock:
+                self.cloned_size += stat.st_size
+                self.copied_size += stat.st_size
+            return
+
+        try:
+            with open(orig, 'rb') as orig_file:
+                with open(dest, 'wb') as dest_file:
+                    in_fd = orig_file.fileno()
+                    out_fd = dest_file.fileno()
+                    mode = 0
+
+                    while not self._aborted:
+                        try:
+                            if mode == 0:
+                                n_bytes = os.copy_file_range(
+                                    in_fd, out_fd, COPY_CHUNK_SIZE)
+                            elif mode == 1:
+                                n_bytes = os.sendfile(
+                                    out_fd, in_fd, None, COPY_CHUNK_SIZE)
+                            else:
+                                data = orig_file.read(COPY_CHUNK_SIZE)
+                                dest_file.write(data)
+                                n_bytes = len(data)
+                        except (AttributeError, OSError):
+                            # not supported here, try a simpler way
+                            if mode == 2:
+                                raise
+                            mode += 1
+                            continue
+
+                        if not n_bytes:
+                            break
+
+                        with self._lock:
+                            self.written_size += n_bytes
+                            self.copied_size += n_bytes
+
+            shutil.copymode(orig, dest)
+        except:
+            sys.stderr.write("Unable to copy %s to %s\n" % (orig, dest))
+
+    def _remove_started_paths(self):
+        for dest_path in self.started_paths:
+            if not os.path.lexists(dest_path):
+                continue
+
+            try:
+                if os.path.isdir(dest_path) and not os.path.islink(dest_path):
+                    shutil.rmtree(dest_path)
+                else:
+                    os.remove(dest_path)
+            except:
+                self.remove_failed_paths.append(dest_path)
+
+    def _run(self):
+        _nice_thread()
+
+        dirs = []
+        files = []
+        links = []
+
+        for orig_path, dest_path in self._copy_list:
+            self.started_paths.append(dest_path)
+
+            # as cp, copy into dest_path if it is an existing folder
+            if os.path.isdir(dest_path) and not os.path.islink(dest_path):
+                dest_path = "%s/%s" % (dest_path, os.path.basename(orig_path))
+
+            self._scan(orig_path, dest_path, dirs, files, links)
+
+        # parent directories are always before their children
+        for orig, dest in dirs:
+            if self._aborted:
+                break
+
+            try:
+                os.makedirs(dest, exist_ok=True)
+            except:
+                sys.stderr.write("Unable to create folder %s\n" % dest)
+
+        for orig, dest in links:
+            if self._aborted:
+                break
+
+            try:
+                os.symlink(os.readlink(orig), dest)
+            except:
+                sys.stderr.write("Unable to copy link %s\n" % orig)
+
+        if not self._aborted:
+            with ThreadPoolExecutor(max_workers=COPY_WORKERS,
+                                    initializer=_nice_thread) as executor:
+                for orig, dest, stat in files:
+                    executor.submit(self._copy_file, orig, dest, stat)
+
+        if self._aborted:
+            self._remove_started_paths()
+        else:
+            for orig, dest in dirs:
+                try:
+                    shutil.copymode(orig, dest)
+                except:
+                    pass
+
+        signaler.copy_finished.emit(self)
+
 
 class FileCopier(ServerSender):
     def __init__(self, session):
@@ -23,57 +249,27 @@ class FileCopier(ServerSender):
         self._next_function = None
         self._abort_function = None
         self._next_args = []
-        self._copy_files = []
-        self._copy_size = 0
-        self._aborted = False
+        self._engine = None
         self._is_active = False
 
-        self._process = QProcess()
-        self._process.finished.connect(self._process_finished)
-        if ray.QT_VERSION >= (5, 6):
-            self._process.errorOccurred.connect(self._error_occurred)
-
         self._timer = QTimer()
         self._timer.setInterval(250)
-        self._timer.setSingleShot(True)
         self._timer.timeout.connect(self._check_progress_size)
 
         self._abort_src_addr = None
         self._abort_src_path = ''
 
-    def _get_file_size(self, filepath):
-        if not os.path.exists(filepath):
-            return 0
-
-        try:
-            du_full = subprocess.check_output(
-                ['nice', '-n', '15', 'du', '-sb', filepath]).decode()
-        except:
-            warnings.warn('unable to decode size of file %s' % filepath)
-            du_full = ""
-
-        if not du_full:
-            return 0
-
-        du_str = du_full.split('\t')[0]
-        if not du_str.isdigit():
-            return 0
-
-        return int(du_str)
+        signaler.copy_finished.connect(self._copy_finished)
 
     def _check_progress_size(self):
-        current_size = 0
-        self._timer.stop()
+        if self._engine is None:
+            return
 
-        for copy_file in self._copy_files:
-            if copy_file.state == 2:
-                current_size += copy_file.size
-            elif copy_file.state == 1:
-                current_size += self._get_file_size(copy_file.dest_path)
-                break
+        current_size = self._engine.copied_size
+        copy_size = self._engine.total_size
 
-        if current_size and self._copy_size:
-            progress = float(current_size/self._copy_size)
+        if current_size and copy_size:
+            progress = float(current_size/copy_size)
 
             if self._client_id:
                 self.send_gui('/ray/gui/client/progress',
@@ -86,72 +282,43 @@ class FileCopier(ServerSender):
 
             self.session.osc_reply('/ray/net_daemon/duplicate_state', progress)
 
-        self._timer.start()
+    def _copy_finished(self, engine: CopyEngine):
+        if engine is not self._engine:
+            return
 
-    def _process_finished(self, exit_code, exit_status):
         self._timer.stop()
+        self._engine = None
+        self._is_active = False
+        self._send_copy_state_to_gui(0)
 
-        for copy_file in self._copy_files:
-            if copy_file.state == 1:
-                copy_file.state = 2
-                break
-
-        if self._aborted:
-            ##remove all created files
-            for copy_file in self._copy_files:
-                if copy_file.state > 0:
-                    file_to_remove = copy_file.dest_path
+        if engine.is_aborted():
+            if self._abort_src_addr and self._abort_src_path:
+                for file_to_remove in engine.remove_failed_paths:
+                    self.send(self._abort_src_addr, '/error_minor',
+                              self._abort_src_path,
+                              ray.Err.SUBPROCESS_CRASH,
+                              "%s hasn't been removed !" % file_to_remove)
 
-                    if os.path.exists(file_to_remove):
-                        try:
-                            if os.path.isfile(file_to_remove):
-                                os.remove(file_to_remove)
-                            elif os.path.isdir(file_to_remove):
-                                shutil.rmtree(file_to_remove)
-                        except:
-                            if self._abort_src_addr and self._abort_src_path:
-                                self.send(self._abort_src_addr,
-                                          '/error_minor',
-                                          self._abort_src_path,
-                                          ray.Err.SUBPROCESS_CRASH,
-                                          "%s hasn't been removed !")
-
-            self._is_active = False
-            self._send_copy_state_to_gui(0)
             self._abort_function(*self._next_args)
             return
 
-        # run next_function if copy is terminated
-        for copy_file in self._copy_files:
-            if copy_file.state != 2:
-                break
-        else:
-            self._is_active = False
-            self._send_copy_state_to_gui(0)
-
-            if self._next_function:
-                self._next_function(*self._next_args)
-
-            return
-
-        self._next_process()
-
-    def _error_occurred(self):
-        #todo make something else
-        self._process_finished(0, 0)
-
-    def _next_process(self):
-        self._is_active = True
-
-        for copy_file in self._copy_files:
-            if copy_file.state == 0:
-                copy_file.state = 1
-                self._process.start('nice',
-                                   ['-n', '+15', 'cp', '-R',
-                                    copy_file.orig_path, copy_file.dest_path])
-                break
-
-        self._timer.start()
+        report = "%s copied, %s written" % (
+            _size_string(engine.copied_size),
+            _size_string(engine.written_size))
+        if engine.cloned_size or engine.linked_size:
+            report += ", %s cloned, %s hardlinked" % (
+                _size_string(engine.cloned_size),
+                _size_string(engine.linked_size))
+        Terminal.message(report)
+
+        if engine.written_size < engine.copied_size:
+            self.send_gui_message(
+                _translate('GUIMSG', 'Copy done, %s written instead of %s')
+                % (_size_string(engine.written_size),
+                   _size_string(engine.copied_size)))
+
+        if self._next_function:
+            self._next_function(*self._next_args)
 
     def _start(self, src_list, dest_dir, next_function,
                abort_function, next_args=[]):
@@ -159,10 +326,6 @@ class FileCopier(ServerSender):
         self._next_function = next_function
         self._next_args = next_args
 
-        self._aborted = False
-        self._copy_size = 0
-        self._copy_files.clear()
-
         dest_path_exists = bool(os.path.exists(dest_dir))
         if dest_path_exists:
             if not os.path.isdir(dest_dir):
@@ -198,28 +361,29 @@ class FileCopier(ServerSender):
                     self._abort_function(*self._next_args)
                     return
 
-        for orig_path in src_list:
-            copy_file = CopyFile()
-            copy_file.state = 0
-            copy_file.orig_path = orig_path
-            copy_file.size = self._get_file_size(orig_path)
-
-            self._copy_size += copy_file.size
+        copy_list = []
 
+        for orig_path in src_list:
             if dest_path_exists:
-                copy_file.dest_path = "%s/%s" % (dest_dir,
-                                                 os.path.basename(orig_path))
+                dest_path = "%s/%s" % (dest_dir, os.path.basename(orig_path))
             else:
                 #WARNING works only with one file !!!
-                copy_file.dest_path = dest_dir
+                dest_path = dest_dir
 
-            self._copy_files.append(copy_file)
+            copy_list.append((orig_path, dest_path))
 
-        if self._copy_files:
-            self._send_copy_state_to_gui(1)
-            self._next_process()
-        else:
+        if not copy_list:
             self._next_function(*self._next_args)
+            return
+
+        self._is_active = True
+        self._send_copy_state_to_gui(1)
+        self._engine = CopyEngine(
+            copy_list,
+            link_read_only=self.has_server_option(
+                ray.Option.HARDLINK_READ_ONLY))
+        self._engine.start()
+        self._timer.start()
 
     def _send_copy_state_to_gui(self, state:int):
         if self.session.session_id:
@@ -247,9 +411,8 @@ class FileCopier(ServerSender):
 
         self._timer.stop()
 
-        if self._process.state() == QProcess.Running:
-            self._aborted = True
-            self._process.terminate()
+        if self._engine is not None:
+            self._engine.abort()
 
     def is_active(self, client_id=''):
         if client_id and client_id != self._client_id:
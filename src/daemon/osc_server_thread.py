@@ -3,13 +3,15 @@ import sys
 import random
 import shutil
 import subprocess
+import threading
 import time
 import liblo
 
-from PyQt5.QtCore import QCoreApplication
+from PyQt5.QtCore import QCoreApplication, QTimer
 from PyQt5.QtXml import QDomDocument
 
 import ray
+from osc_flow import FlowQueue, ACK_PATH
 from signaler import Signaler
 from multi_daemon_file import MultiDaemonFile
 from daemon_tools import (TemplateRoots, CommandLineArgs, Terminal, RS,
@@ -19,6 +21,14 @@ instance = None
 signaler = Signaler.instance()
 _translate = QCoreApplication.translate
 
+# max size of an OSC bundle sent to GUIs and controllers,
+# keep it under the usual ethernet MTU
+BUNDLE_MAX_SIZE = 1400
+
+# all paths decorated with ray_method,
+# used by the session to build its dispatch table
+RAY_METHOD_PATHS = set()
+
 def _path_is_valid(path: str)->bool:
     if path.startswith(('./', '../')):
         return False
@@ -31,7 +41,33 @@ def _path_is_valid(path: str)->bool:
         return False
     return True
 
+def _osc_padded(size: int)->int:
+    return size + 4 - size % 4
+
+def _osc_message_size(path: str, args: tuple)->int:
+    ''' returns the approximative size in bytes of an OSC message '''
+    size = _osc_padded(len(path.encode())) + _osc_padded(len(args) + 1)
+
+    for arg in args:
+        arg_type = ''
+        if isinstance(arg, tuple) and len(arg) == 2:
+            arg_type, arg = arg
+
+        if isinstance(arg, str):
+            size += _osc_padded(len(arg.encode()))
+        elif isinstance(arg, (bytes, list)):
+            size += 4 + _osc_padded(len(arg))
+        elif arg_type in ('h', 'd', 't'):
+            size += 8
+        elif isinstance(arg, int) and not isinstance(arg, bool):
+            size += 8 if abs(arg) >= 2**31 else 4
+        elif isinstance(arg, float):
+            size += 4
+    return size
+
 def ray_method(path, types):
+    RAY_METHOD_PATHS.add(path)
+
     def decorated(func):
         @liblo.make_method(path, types)
         def wrapper(*args, **kwargs):
@@ -340,7 +376,10 @@ class OscServerThread(ClientCommunicating):
             'desktops_memory': ray.Option.DESKTOPS_MEMORY,
             'snapshots': ray.Option.SNAPSHOTS,
             'session_scripts': ray.Option.SESSION_SCRIPTS,
-            'gui_states': ray.Option.GUI_STATES}
+            'gui_states': ray.Option.GUI_STATES,
+            'snapshot_big_files': ray.Option.SNAPSHOT_BIG_FILES,
+            'hardlink_read_only': ray.Option.HARDLINK_READ_ONLY,
+            'skip_clean_clients': ray.Option.SKIP_CLEAN_SAVE}
 
         self.options = RS.settings.value(
             'daemon/options',
@@ -368,6 +407,20 @@ class OscServerThread(ClientCommunicating):
 
         self.session_to_preview = ''
 
+        # messages sent from the main thread to GUIs and controllers
+        # are grouped per destination in OSC bundles,
+        # sent at the end of the current event loop iteration.
+        self._bundles = {}
+        self._bundles_flush_pending = False
+
+        # bulk transfers to GUIs wait receiver acknowledgements,
+        # flow queue is processed in the main thread
+        self.flow_queue = FlowQueue(self._flow_send)
+        self._flow_timer = QTimer()
+        self._flow_timer.setInterval(5)
+        self._flow_timer.timeout.connect(self._process_flow_queue)
+        signaler.flow_queue_filled.connect(self._start_flow_timer)
+
         global instance
         instance = self
 
@@ -410,6 +463,7 @@ class OscServerThread(ClientCommunicating):
             return False
 
         self.gui_list.remove(addr)
+        self.flow_queue.forget(addr.url)
 
         if src_addr.url == self._nsm_locker_url:
             self.net_daemon_id = random.randint(1, 999999999)
@@ -422,6 +476,11 @@ class OscServerThread(ClientCommunicating):
         if multi_daemon_file:
             multi_daemon_file.update()
 
+    @ray_method(ACK_PATH, 'i')
+    def rayFlowAck(self, path, args, types, src_addr):
+        self.flow_queue.ack(src_addr.url, args[0])
+        return False
+
     @ray_method('/ray/server/ask_for_patchbay', '')
     def rayServerGetPatchbayPort(self, path, args, types, src_addr):
         patchbay_file = '/tmp/RaySession/patchbay_daemons/' + str(self.port)
@@ -804,6 +863,11 @@ class OscServerThread(ClientCommunicating):
                         self.send(src_addr, '/minor_error', path,
                             "git is not present. Impossible to activate 'snapshots' option")
                         continue
+                    if (option == ray.Option.SNAPSHOT_BIG_FILES
+                            and not self.options & ray.Option.HAS_GIT):
+                        self.send(src_addr, '/minor_error', path,
+                            "git is not present. Impossible to activate 'snapshot_big_files' option")
+                        continue
 
                 if not option_value:
                     option = -option
@@ -837,6 +901,10 @@ class OscServerThread(ClientCommunicating):
         self.client_templates_database['user'].clear()
         self.send(src_addr, '/reply', path, 'database cleared')
 
+    @ray_method('/ray/server/get_dispatch_stats', '')
+    def rayServerGetDispatchStats(self, path, args, types, src_addr):
+        pass
+
     @ray_method('/ray/server/open_file_manager_at', 's')
     def rayServerOpenFileManagerAt(self, path, args, types, src_addr):
         folder_path = args[0]
@@ -1083,6 +1151,14 @@ class OscServerThread(ClientCommunicating):
     def rayServerListSnapshots(self, path, args, types, src_addr):
         pass
 
+    @ray_method('/ray/session/list_snapshots', 'ii')
+    def rayServerListSnapshotsPaged(self, path, args, types, src_addr):
+        pass
+
+    @ray_method('/ray/session/get_snapshots_stats', '')
+    def rayServerGetSnapshotsStats(self, path, args, types, src_addr):
+        pass
+
     @ray_method('/ray/session/set_auto_snapshot', 'i')
     def rayServerSetAutoSnapshot(self, path, args, types, src_addr):
         pass
@@ -1239,6 +1315,10 @@ class OscServerThread(ClientCommunicating):
     def rayClientListSnapshots(self, path, args, types, src_addr):
         pass
 
+    @ray_method('/ray/client/list_snapshots', 'sii')
+    def rayClientListSnapshotsPaged(self, path, args, types, src_addr):
+        pass
+
     @ray_method('/ray/client/open_snapshot', 'ss')
     def rayClientLoadSnapshot(self, path, args, types, src_addr):
         pass
@@ -1339,13 +1419,112 @@ class OscServerThread(ClientCommunicating):
         else:
             self.options &= ~abs(option)
 
-    def send(self, *args):
+    def _is_bundled_addr(self, addr)->bool:
+        if not isinstance(addr, liblo.Address):
+            return False
+
+        for gui_addr in self.gui_list:
+            if gui_addr.url == addr.url:
+                return True
+
+        for controller in self.controller_list:
+            if controller.addr is not None and controller.addr.url == addr.url:
+                return True
+        return False
+
+    def flush_bundles(self, url=''):
+        ''' sends now the messages waiting to be bundled,
+        only for url destination if url is given. '''
+        if url:
+            urls = [url] if url in self._bundles else []
+        else:
+            urls = list(self._bundles.keys())
+            self._bundles_flush_pending = False
+
+        for dest_url in urls:
+            addr, messages, size = self._bundles.pop(dest_url)
+
+            if len(messages) == 1:
+                ClientCommunicating.send(self, addr, *messages[0])
+                continue
+
+            bundle = liblo.Bundle(
+                *[liblo.Message(*message) for message in messages])
+            ClientCommunicating.send(self, addr, bundle)
+
+    def _start_flow_timer(self):
+        if not self._flow_timer.isActive():
+            self._flow_timer.start()
+
+    def _process_flow_queue(self):
+        if not self.flow_queue.process():
+            self._flow_timer.stop()
+
+    def _flow_send(self, *args):
         if CommandLineArgs.debug:
             sys.stderr.write(
                 '\033[96mOSC::daemon sends\033[0m ' + str(args[1:]) + '\n')
 
         ClientCommunicating.send(self, *args)
 
+    def flow_send(self, addr, *args):
+        ''' sends a message of a bulk transfer,
+        without blocking and without saturating the receiver. '''
+        if threading.current_thread() is threading.main_thread():
+            self.flush_bundles(addr.url)
+
+        self.flow_queue.add(addr, *args)
+        signaler.flow_queue_filled.emit()
+
+    def send(self, *args):
+        if (len(args) >= 2 and isinstance(args[0], liblo.Address)
+                and isinstance(args[1], str)
+                and self.flow_queue.has_pending(args[0].url)):
+            # keep messages order with a running bulk transfer
+            self.flow_send(*args)
+            return
+
+        if CommandLineArgs.debug:
+            sys.stderr.write(
+                '\033[96mOSC::daemon sends\033[0m ' + str(args[1:]) + '\n')
+
+        if (len(args) < 2
+                or threading.current_thread() is not threading.main_thread()
+                or not self._is_bundled_addr(args[0])):
+            ClientCommunicating.send(self, *args)
+            return
+
+        addr = args[0]
+
+        if not isinstance(args[1], str):
+            # already a liblo Message or Bundle, keep messages order
+            self.flush_bundles(addr.url)
+            ClientCommunicating.send(self, *args)
+            return
+
+        # OSC bundle header is 16 bytes, each element has a 4 bytes size
+        msg_size = _osc_message_size(args[1], args[2:]) + 4
+        if msg_size + 16 > BUNDLE_MAX_SIZE:
+            self.flush_bundles(addr.url)
+            ClientCommunicating.send(self, *args)
+            return
+
+        bundle = self._bundles.get(addr.url)
+        if bundle is not None and bundle[2] + msg_size > BUNDLE_MAX_SIZE:
+            self.flush_bundles(addr.url)
+            bundle = None
+
+        if bundle is None:
+            bundle = [addr, [], 16]
+            self._bundles[addr.url] = bundle
+
+        bundle[1].append(args[1:])
+        bundle[2] += msg_size
+
+        if not self._bundles_flush_pending:
+            self._bundles_flush_pending = True
+            QTimer.singleShot(0, self.flush_bundles)
+
     def send_gui(self, *args):
         for gui_addr in self.gui_list:
             self.send(gui_addr, *args)
@@ -130,6 +130,9 @@ if __name__ == '__main__':
     app.exec()
     #app is stopped
 
+    # send last messages waiting to be bundled
+    server.flush_bundles()
+
     #update multi_daemon_file without this server
     multi_daemon_file.quit()
 
@@ -145,6 +148,7 @@ if __name__ == '__main__':
     
     # save sessions infos in cache
     session.save_folder_sizes_cache_file()
+    session.session_index.save_cache_file()
 
     RS.settings.sync()
 
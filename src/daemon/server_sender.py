@@ -33,6 +33,13 @@ class ServerSender(QObject):
 
         server.send(*args)
 
+    def flow_send_even_dummy(self, *args):
+        server = OscServerThread.getInstance()
+        if not server:
+            return
+
+        server.flow_send(*args)
+
     def send_gui(self, *args):
         if self.is_dummy:
             return
@@ -23,6 +23,8 @@ from file_copier import FileCopier
 from client import Client
 from scripter import StepScripter
 from canvas_saver import CanvasSaver
+from template_probes import TemplateProbes
+from desktop_index import DesktopIndex
 from daemon_tools import (
     TemplateRoots, RS, Terminal, get_git_default_un_and_ignored,
     dirname, basename, highlight_text)
@@ -30,6 +32,12 @@ from daemon_tools import (
 _translate = QCoreApplication.translate
 signaler = Signaler.instance()
 
+# seconds a launch slot is held by a client which doesn't announce
+LAUNCH_SLOT_TIME = 0.500
+
+# ms to wait after a save before taking the auto snapshot
+DEFERRED_SNAPSHOT_DELAY = 5000
+
 
 class Session(ServerSender):
     def __init__(self, root, session_id=0):
@@ -106,6 +114,9 @@ class Session(ServerSender):
         self.name = session_name
 
     def _set_path(self, session_path, session_name=''):
+        if session_path != self.path:
+            self.snapshoter.stop_maintenance()
+
         if not self.is_dummy:
             if self.path:
                 self.bookmarker.remove_all(self.path)
@@ -635,91 +646,39 @@ class Session(ServerSender):
                  'nsm_capable': True,
                  'skipped': False} '''
 
-            desk_path_list = (
-                '%s/.local' % os.getenv('HOME'),
-                '/usr/local',
-                '/usr')
-
             application_dicts = []
-            
-            lang = os.getenv('LANG')
-            lang_strs = ("[%s]" % lang[0:5], "[%s]" % lang[0:2], "")
-
-            for desk_path in desk_path_list:
-                full_desk_path = "%s/share/applications" % desk_path
-
-                if not os.path.isdir(full_desk_path):
-                    # applications folder doesn't exists
-                    continue
-
-                if not os.access(full_desk_path, os.R_OK):
-                    # no permission to read this applications folder
-                    continue
+            desktop_index = DesktopIndex.get_instance()
+
+            for full_desk_path in desktop_index.desk_paths(
+                    with_code_root=False):
+                for f, entry in desktop_index.entries(full_desk_path,
+                                                      recursive=True):
+                    if f in [apd['desktop_file'] for apd in application_dicts]:
+                        # desktop file already seen in a prior desk_path
+                        continue
 
-                for root, dirs, files in os.walk(full_desk_path):
-                    for f in files:
-                        if not f.endswith('.desktop'):
-                            continue
+                    executable = entry['exec'].partition(' ')[0]
 
-                        if f in [apd['desktop_file'] for apd in application_dicts]:
-                            # desktop file already seen in a prior desk_path
+                    if (entry['nsm_capable'] is not None and executable
+                            and shutil.which(executable)):
+                        # prevent several desktop files with same executable
+                        if executable in [apd['executable']
+                                          for apd in application_dicts]:
                             continue
 
-                        full_desk_file = os.path.join(root, f)
-                        
-                        try:
-                            file = open(full_desk_file, 'r')
-                            contents = file.read()
-                        except:
-                            continue
-
-                        executable = ''
-                        has_nsm_mention = False
-                        nsm_capable = True
-                        name = ''
-                        
-                        for line in contents.splitlines():
-                            if line.startswith('Exec='):
-                                executable_and_args = line.partition('=')[2].strip()
-                                executable = executable_and_args.partition(' ')[0]
-                            
-                            elif line.lower().startswith('x-nsm-capable='):
-                                has_nsm_mention = True
-                                value = line.partition('=')[2]
-                                nsm_capable = bool(value.strip().lower() == 'true')
-                            
-                            elif line.startswith('Name='):
-                                name = line.partition('=')[2].strip()
-
-                        if (has_nsm_mention and executable
-                                and shutil.which(executable)):
-                            # prevent several desktop files with same executable
-                            if executable in [apd['executable']
-                                              for apd in application_dicts]:
-                                continue
-
-                            name = executable
-                            name_found = False
-                            
-                            for lang_str in lang_strs:
-                                for line in contents.splitlines():
-                                    if line.startswith('Name%s=' % lang_str):
-                                        name = line.partition('=')[2].strip()
-                                        name_found = True
-                                        break
-                                if name_found:
-                                    break
-
-                            # 'skipped' key may be set to True later,
-                            # if a template does not want to be erased
-                            # by the template created
-                            # with this .desktop file.
-                            application_dicts.append(
-                                {'executable': executable,
-                                 'name': name,
-                                 'desktop_file': f,
-                                 'nsm_capable': nsm_capable,
-                                 'skipped': False})
+                        names = DesktopIndex.localized(entry, 'Name')
+                        name = names[0].strip() if names else executable
+
+                        # 'skipped' key may be set to True later,
+                        # if a template does not want to be erased
+                        # by the template created
+                        # with this .desktop file.
+                        application_dicts.append(
+                            {'executable': executable,
+                             'name': name,
+                             'desktop_file': f,
+                             'nsm_capable': entry['nsm_capable'],
+                             'skipped': False})
             
             return [a for a in application_dicts if a['nsm_capable']]
         
@@ -737,6 +696,46 @@ class Session(ServerSender):
         search_paths = self._get_search_template_dirs(factory)
         file_rewritten = False
 
+        which_results = {}
+        def which(executable: str)->str:
+            if executable not in which_results:
+                which_results[executable] = shutil.which(executable)
+            return which_results[executable]
+
+        # execute all needed executable probes in parallel
+        # before reading templates, results are cached on disk
+        template_probes = TemplateProbes.get_instance()
+        nsm_bin_execs = set()
+        version_execs = set()
+
+        for search_path in search_paths:
+            templates_file = "%s/%s" % (search_path, 'client_templates.xml')
+
+            try:
+                file = open(templates_file, 'r')
+                xml = QDomDocument()
+                xml.setContent(file.read())
+                file.close()
+            except:
+                continue
+
+            nodes = xml.documentElement().childNodes()
+            for i in range(nodes.count()):
+                ct = nodes.at(i).toElement()
+                if ct.tagName() != 'Client-Template':
+                    continue
+
+                exec_path = which(ct.attribute('executable'))
+                if not exec_path:
+                    continue
+
+                if ct.attribute('check_nsm_bin') in ("1", "true"):
+                    nsm_bin_execs.add(exec_path)
+                if ct.attribute('needed-version'):
+                    version_execs.add(exec_path)
+
+        template_probes.prefetch(nsm_bin_execs, version_execs)
+
         for search_path in search_paths:
             templates_file = "%s/%s" % (search_path, 'client_templates.xml')
 
@@ -840,7 +839,7 @@ class Session(ServerSender):
                     try_exec_ok = True
 
                     for try_exec in try_exec_list:
-                        if not shutil.which(try_exec):
+                        if not which(try_exec):
                             try_exec_ok = False
                             break
                     
@@ -851,10 +850,7 @@ class Session(ServerSender):
                     # search for '/nsm/server/announce' in executable binary
                     # if it is asked by "check_nsm_bin" key
                     if ct.attribute('check_nsm_bin') in  ("1", "true"):
-                        result = QProcess.execute(
-                            'grep', ['-q', '/nsm/server/announce',
-                                    shutil.which(executable)])
-                        if result:
+                        if not template_probes.is_nsm_bin(which(executable)):
                             continue
 
                     # check if a version is at least required for this template
@@ -868,34 +864,8 @@ class Session(ServerSender):
                         needed_version = ''
 
                     if needed_version:
-                        version_process = QProcess()
-                        version_process.start(executable, ['--version'])
-                        version_process.waitForFinished(500)
-
-                        # do not allow program --version to be longer than 500ms
-                        if version_process.state():
-                            version_process.terminate()
-                            version_process.waitForFinished(500)
-                            continue
-
-                        full_program_version = str(
-                            version_process.readAllStandardOutput(),
-                            encoding='utf-8')
-
-                        previous_is_digit = False
-                        program_version = ''
-
-                        for character in full_program_version:
-                            if character.isdigit():
-                                program_version += character
-                                previous_is_digit = True
-                            elif character == '.':
-                                if previous_is_digit:
-                                    program_version += character
-                                previous_is_digit = False
-                            else:
-                                if program_version:
-                                    break
+                        program_version = template_probes.program_version(
+                            which(executable))
 
                         if not program_version:
                             continue
@@ -956,6 +926,8 @@ class Session(ServerSender):
             template_names.add(template_name)
             templates_database.append(template_dict)
 
+        template_probes.save_cache_file()
+
         if file_rewritten:
             try:
                 file = open(templates_file, 'w')
@@ -975,15 +947,45 @@ class OperatingSession(Session):
         self.timer_redondant = False
         self.expected_clients = []
 
+        # clients are launched in parallel, ordered by launch_priority
+        # (JACK hosts first), a launch slot is released when client
+        # process is started. Clients with a higher priority keep it
+        # until they announce, die or after LAUNCH_SLOT_TIME.
         self.timer_launch = QTimer()
-        self.timer_launch.setInterval(100)
+        self.timer_launch.setInterval(20)
         self.timer_launch.timeout.connect(self._timer_launch_timeout)
         self.clients_to_launch = []
+        self._launching_clients = {}
+        self.launch_parallelism = RS.settings.value(
+            'daemon/launch_parallelism', 4, type=int)
 
+        # clients are stopped in parallel, each one is killed
+        # if it is still alive after its own quit deadline.
         self.timer_quit = QTimer()
-        self.timer_quit.setInterval(100)
+        self.timer_quit.setInterval(20)
         self.timer_quit.timeout.connect(self._timer_quit_timeout)
         self.clients_to_quit = []
+        self._quitting_clients = {}
+        self._quit_deadline = 5000
+        self.quit_parallelism = RS.settings.value(
+            'daemon/quit_parallelism', 16, type=int)
+
+        # during announce and reply waits, clients with a timings history
+        # stop to be expected once they are statistically late
+        self.timer_deadlines = QTimer()
+        self.timer_deadlines.setInterval(100)
+        self.timer_deadlines.timeout.connect(self._check_expected_deadlines)
+
+        # auto snapshot after a simple save is taken later,
+        # in background, with all saves done during the delay.
+        self.timer_deferred_snapshot = QTimer()
+        self.timer_deferred_snapshot.setSingleShot(True)
+        self.timer_deferred_snapshot.setInterval(DEFERRED_SNAPSHOT_DELAY)
+        self.timer_deferred_snapshot.timeout.connect(
+            self._timer_deferred_snapshot_timeout)
+        self._deferred_snapshot_path = ''
+        self._background_snapshot_running = False
+        self._snapshot_waiting = None
 
         self.timer_waituser_progress = QTimer()
         self.timer_waituser_progress.setInterval(500)
@@ -1077,6 +1079,9 @@ class OperatingSession(Session):
             self.timer.setSingleShot(True)
             self.timer.timeout.connect(follow)
             self.timer.start(duration)
+
+            if wait_for in (ray.WaitFor.ANNOUNCE, ray.WaitFor.REPLY):
+                self.timer_deadlines.start()
         else:
             follow()
 
@@ -1100,6 +1105,28 @@ class OperatingSession(Session):
 
             self.timer_waituser_progress.stop()
 
+    def _check_expected_deadlines(self):
+        if (self.wait_for not in (ray.WaitFor.ANNOUNCE, ray.WaitFor.REPLY)
+                or not self.expected_clients):
+            self.timer_deadlines.stop()
+            return
+
+        for client in self.expected_clients.copy():
+            if self.wait_for == ray.WaitFor.ANNOUNCE:
+                step = 'announce'
+            elif client.pending_command == ray.Command.OPEN:
+                step = 'open'
+            else:
+                # a saving client is never left behind, next steps
+                # (snapshot, stop) would see its files half written.
+                continue
+
+            if client.is_late(step):
+                self.send_gui_message(
+                    _translate('GUIMSG', "  %s: is late, don't wait for it.")
+                    % client.gui_msg_style())
+                self.end_timer_if_last_expected(client)
+
     def _clean_expected(self):
         if self.expected_clients:
             client_names = []
@@ -1178,20 +1205,91 @@ class OperatingSession(Session):
         self.steps_order.__delitem__(0)
         next_function(*arguments)
 
+    def _start_launch_scheduler(self):
+        # sort is stable, so clients order is kept for equal priorities
+        self.clients_to_launch.sort(
+            key=lambda c: (- c.launch_priority, not c.is_jack_host()))
+        self._launching_clients.clear()
+        self.timer_launch.start()
+
     def _timer_launch_timeout(self):
+        now = time.time()
+
+        next_priority = None
         if self.clients_to_launch:
-            self.clients_to_launch[0].start()
+            next_priority = self.clients_to_launch[0].launch_priority
+
+        for client, launch_time in list(self._launching_clients.items()):
+            if (client.did_announce
+                    or not (client.is_running() or client.is_starting())
+                    or now - launch_time >= LAUNCH_SLOT_TIME):
+                del self._launching_clients[client]
+
+            elif (client.is_running()
+                    and (next_priority is None
+                         or client.launch_priority <= next_priority)):
+                # process is started, only clients with a higher priority
+                # keep their slot until they announce.
+                del self._launching_clients[client]
+
+        while self.clients_to_launch:
+            if len(self._launching_clients) >= max(1, self.launch_parallelism):
+                break
+
+            client = self.clients_to_launch[0]
+
+            # wait for all clients with a higher priority to be launched
+            if [c for c in self._launching_clients
+                    if c.launch_priority > client.launch_priority]:
+                break
+
             self.clients_to_launch.__delitem__(0)
+            if not client in self.clients:
+                continue
+
+            self._launching_clients[client] = now
+            client.start()
 
         if not self.clients_to_launch:
+            self._launching_clients.clear()
             self.timer_launch.stop()
 
+    def _start_quit_scheduler(self, deadline: int)->int:
+        ''' starts to stop clients_to_quit, each client is killed
+        if still running 'deadline' ms after its stop.
+        returns the maximum time needed to stop all clients. '''
+        self._quit_deadline = deadline
+        self._quitting_clients.clear()
+        self.timer_quit.start()
+
+        parallelism = max(1, self.quit_parallelism)
+        n_waves = math.ceil(len(self.clients_to_quit) / parallelism)
+        return deadline * max(1, n_waves) + 1000
+
     def _timer_quit_timeout(self):
-        if self.clients_to_quit:
+        now = time.time()
+
+        for client, stop_time in list(self._quitting_clients.items()):
+            if not client.is_running():
+                del self._quitting_clients[client]
+
+            elif now - stop_time >= self._quit_deadline / 1000:
+                self.send_gui_message(
+                    _translate('GUIMSG', '  %s: still alive after %.1f s, kill it !')
+                    % (client.gui_msg_style(), now - stop_time))
+                client.kill()
+                del self._quitting_clients[client]
+
+        while (self.clients_to_quit
+                and len(self._quitting_clients) < max(1, self.quit_parallelism)):
             client = self.clients_to_quit.pop(0)
             client.stop()
 
-        if not self.clients_to_quit:
+            if (client.is_running()
+                    and client.switch_state != ray.SwitchState.NEEDED):
+                self._quitting_clients[client] = now
+
+        if not (self.clients_to_quit or self._quitting_clients):
             self.timer_quit.stop()
 
     def _timer_wait_user_progress_timeOut(self):
@@ -1364,8 +1462,16 @@ class OperatingSession(Session):
         self.send_gui_message(_translate('GUIMSG', '-- Saving session %s --')
                                 % highlight_text(self.get_short_path()))
 
+        skip_clean = self.has_server_option(ray.Option.SKIP_CLEAN_SAVE)
+
         for client in self.clients:
             if client.can_save_now():
+                if skip_clean and client.is_clean_since_save():
+                    self.send_gui_message(
+                        _translate('GUIMSG', '  %s: clean, not saved')
+                            % client.gui_msg_style())
+                    continue
+
                 self.expected_clients.append(client)
             client.save()
 
@@ -1379,7 +1485,16 @@ class OperatingSession(Session):
                     _translate('GUIMSG', 'waiting for %i clients to save...')
                         % len(self.expected_clients))
 
-        self._wait_and_go_to(10000, (self.save_substep1, outing), ray.WaitFor.REPLY)
+        # any saving client can take up to 10 seconds,
+        # longer if its save history says so.
+        wait_time = 0
+        for client in self.expected_clients:
+            wait_time = max(
+                10000, int(1000 * client.expected_duration('save')),
+                wait_time)
+
+        self._wait_and_go_to(wait_time, (self.save_substep1, outing),
+                             ray.WaitFor.REPLY)
 
     def save_substep1(self, outing=False):
         self._clean_expected()
@@ -1447,13 +1562,33 @@ class OperatingSession(Session):
 
     def snapshot(self, snapshot_name='', rewind_snapshot='',
                  force=False, outing=False):
+        # a deferred snapshot is taken with this one
+        self.timer_deferred_snapshot.stop()
+
+        if self._background_snapshot_running:
+            self._snapshot_waiting = (self.snapshot, snapshot_name,
+                                      rewind_snapshot, force, outing)
+            return
+
         if not force:
             if not (self.has_server_option(ray.Option.SNAPSHOTS)
-                    and not self.snapshoter.is_auto_snapshot_prevented()
-                    and self.snapshoter.has_changes()):
+                    and not self.snapshoter.is_auto_snapshot_prevented()):
                 self.next_function()
                 return
 
+            # changes are listed without blocking the daemon
+            self.snapshoter.check_changes(
+                self.snapshot_substep0, snapshot_name, rewind_snapshot, outing)
+            return
+
+        self.snapshot_substep0(True, snapshot_name, rewind_snapshot, outing)
+
+    def snapshot_substep0(self, has_changes: bool, snapshot_name: str,
+                          rewind_snapshot: str, outing: bool):
+        if not has_changes:
+            self.next_function()
+            return
+
         if outing:
             self.set_server_status(ray.ServerStatus.OUT_SNAPSHOT)
         else:
@@ -1471,11 +1606,77 @@ class OperatingSession(Session):
         self.send_gui_message(_translate('GUIMSG', '...Snapshot finished.'))
         self.next_function()
 
+    def deferred_snapshot(self):
+        if (self.has_server_option(ray.Option.SNAPSHOTS)
+                and not self.snapshoter.is_auto_snapshot_prevented()):
+            self._deferred_snapshot_path = self.path
+            # restarted at each save, so pending saves
+            # are coalesced in one snapshot
+            self.timer_deferred_snapshot.start()
+
+        self.next_function()
+
+    def flush_deferred_snapshot(self):
+        ''' takes now a pending deferred snapshot
+        or waits for the background one. '''
+        if self._background_snapshot_running:
+            self.timer_deferred_snapshot.stop()
+            self._snapshot_waiting = (self.next_function,)
+            return
+
+        if (self.timer_deferred_snapshot.isActive()
+                and self._deferred_snapshot_path == self.path):
+            self.snapshot()
+            return
+
+        self.timer_deferred_snapshot.stop()
+        self.next_function()
+
+    def _timer_deferred_snapshot_timeout(self):
+        if not self.path or self.path != self._deferred_snapshot_path:
+            return
+
+        if self.steps_order or self.snapshoter.is_busy():
+            # an operation is running, retry later
+            self.timer_deferred_snapshot.start()
+            return
+
+        self._background_snapshot_running = True
+        self.snapshoter.check_changes(self._background_snapshot_substep1)
+
+    def _background_snapshot_substep1(self, has_changes: bool):
+        if not has_changes or self.path != self._deferred_snapshot_path:
+            self._background_snapshot_end()
+            return
+
+        self.snapshoter.save(next_function=self._background_snapshot_end,
+                             error_function=self._background_snapshot_error,
+                             low_priority=True)
+
+    def _background_snapshot_end(self, aborted=False):
+        self._background_snapshot_running = False
+
+        if aborted:
+            self.message('Snapshot aborted')
+            self.send_gui_message(_translate('GUIMSG', 'Snapshot aborted!'))
+
+        if self._snapshot_waiting is not None:
+            function, *args = self._snapshot_waiting
+            self._snapshot_waiting = None
+            function(*args)
+
+    def _background_snapshot_error(self, err_snapshot, info_str=''):
+        m = self._snapshot_error_message(err_snapshot, info_str)
+        self.message(m)
+        self.send_gui_message(m)
+        self._background_snapshot_end()
+
     def snapshot_done(self):
         self.set_server_status(ray.ServerStatus.READY)
         self._send_reply("Snapshot taken.")
 
-    def snapshot_error(self, err_snapshot, info_str=''):
+    @staticmethod
+    def _snapshot_error_message(err_snapshot, info_str='')->str:
         m = _translate('Snapshot Error', "Unknown error")
         if err_snapshot == ray.Err.SUBPROCESS_UNTERMINATED:
             m = _translate('Snapshot Error',
@@ -1486,6 +1687,10 @@ class OperatingSession(Session):
         elif err_snapshot == ray.Err.SUBPROCESS_EXITCODE:
             m = _translate('Snapshot Error',
                            "git exit with an error code.\n%s") % info_str
+        return m
+
+    def snapshot_error(self, err_snapshot, info_str=''):
+        m = self._snapshot_error_message(err_snapshot, info_str)
         self.message(m)
         self.send_gui_message(m)
 
@@ -1605,12 +1810,13 @@ class OperatingSession(Session):
 
             for client in self.expected_clients.__reversed__():
                 self.clients_to_quit.append(client)
-            self.timer_quit.start()
+
+        wait_time = self._start_quit_scheduler(30000)
 
         self.trashed_clients.clear()
         self.send_gui('/ray/gui/trash/clear')
 
-        self._wait_and_go_to(30000, (self.close_substep1, clear_all_clients),
+        self._wait_and_go_to(wait_time, (self.close_substep1, clear_all_clients),
                          ray.WaitFor.QUIT)
 
     def close_substep1(self, clear_all_clients=False):
@@ -1693,8 +1899,8 @@ for better organization.""")
 
     def init_snapshot(self, spath, snapshot):
         self.set_server_status(ray.ServerStatus.REWIND)
-        if self.snapshoter.load(spath, snapshot, self.init_snapshot_error):
-            self.next_function()
+        self.snapshoter.load(spath, snapshot, self.next_function,
+                             self.init_snapshot_error)
 
     def init_snapshot_error(self, err, info_str=''):
         m = _translate('Snapshot Error', "Snapshot error")
@@ -2268,8 +2474,9 @@ for better organization.""")
             else:
                 client.switch_state = ray.SwitchState.NEEDED
 
-        self.timer_quit.start()
-        self._wait_and_go_to(5000, (self.load_substep2, open_off), ray.WaitFor.QUIT)
+        wait_time = self._start_quit_scheduler(5000)
+        self._wait_and_go_to(wait_time, (self.load_substep2, open_off),
+                             ray.WaitFor.QUIT)
 
     def load_substep2(self, open_off):
         for client in self.expected_clients:
@@ -2379,7 +2586,7 @@ for better organization.""")
         #* dumb clients will never send an 'announce message', so we need
         #* to give up waiting on them fairly soon. */
 
-        self.timer_launch.start()
+        self._start_launch_scheduler()
 
         wait_time = 4000 + len(self.expected_clients) * 1000
 
@@ -2417,7 +2624,9 @@ for better organization.""")
 
         wait_time = 8000 + len(self.expected_clients) * 2000
         for client in self.expected_clients:
-            wait_time = int(max(2 * 1000 * client.last_open_duration, wait_time))
+            wait_time = int(max(2 * 1000 * client.last_open_duration,
+                                1000 * client.expected_duration('open'),
+                                wait_time))
 
         self._wait_and_go_to(wait_time, self.load_substep5, ray.WaitFor.REPLY)
 
@@ -2598,10 +2807,13 @@ for better organization.""")
 
     def load_client_snapshot(self, client_id, snapshot):
         self.set_server_status(ray.ServerStatus.REWIND)
-        if self.snapshoter.load_client_exclusive(
-                client_id, snapshot, self.load_client_snapshot_error):
-            self.set_server_status(ray.ServerStatus.READY)
-            self.next_function()
+        self.snapshoter.load_client_exclusive(
+            client_id, snapshot, self.load_client_snapshot_substep1,
+            self.load_client_snapshot_error)
+
+    def load_client_snapshot_substep1(self):
+        self.set_server_status(ray.ServerStatus.READY)
+        self.next_function()
 
     def load_client_snapshot_error(self, err, info_str=''):
         m = _translate('Snapshot Error', "Snapshot error")
@@ -2658,10 +2870,10 @@ for better organization.""")
                 self.clients_to_quit.append(client)
                 self.expected_clients.append(client)
 
-        self.timer_quit.start()
+        wait_time = self._start_quit_scheduler(5000)
 
         self._wait_and_go_to(
-            5000,
+            wait_time,
             (self.clear_clients_substep2, src_addr, src_path),
             ray.WaitFor.QUIT)
 
@@ -2677,7 +2889,7 @@ for better organization.""")
     def clear_clients_substep3(self, src_addr, src_path):
         self.answer(src_addr, src_path, 'Clients cleared')
         
-    def send_preview(self, src_addr, folder_sizes:list):
+    def send_preview(self, src_addr, size_calculator):
         # prevent long list of OSC sends if preview order already changed
         server = self.get_server_even_dummy()
         if server and server.session_to_preview != self.get_short_path():
@@ -2705,79 +2917,25 @@ for better organization.""")
                     src_addr, '/ray/gui/preview/client/ray_net_update',
                     client.client_id, *client.ray_net.spread())
 
-        i = 0
+        # snapshots can be many, flow queue sends them
+        # as fast as GUI can take them
         for snapshot in self.snapshoter.list():
-            self.send_even_dummy(
+            self.flow_send_even_dummy(
                 src_addr, '/ray/gui/preview/snapshot', snapshot)
-            
-            i += 1
-            if i == 100:
-                # slow package send to try to prevent UDP loss
-                # and check if preview is still wanted on this session
-                if server and server.session_to_preview != self.get_short_path():
-                    return
-                time.sleep(0.010)
-                i = 0
 
         # re check here if preview didn't change before calculate session size
         if server and server.session_to_preview != self.get_short_path():
             return
 
-        total_size = 0
-        size_unreadable = False
+        # session size is calculated in a worker thread.
+        # If size is already known, preview is sent now
+        # and session size will be corrected if needed.
+        total_size = size_calculator.get_cached_size(self.path)
+        size_calculator.request(self.path)
 
-        # get last modified session folder to prevent recalculate
-        # if we already know its size
-        modified = int(os.path.getmtime(self.path))
-
-        # check if size is already in memory
-        for folder_size in folder_sizes:
-            if folder_size['path'] == self.path:
-                if folder_size['modified'] == modified:
-                    total_size = folder_size['size']
-                break
-
-        # calculate session size
-        if not total_size:
-            for root, dirs, files in os.walk(self.path):
-                # check each loop if it is still pertinent to walk
-                if server and server.session_to_preview != self.get_short_path():
-                    return
-
-                # exclude symlinks directories from count
-                dirs[:] = [dir for dir in dirs
-                        if not os.path.islink(os.path.join(root, dir))]
-
-                for file_path in files:
-                    full_file_path = os.path.join(root, file_path)
-                    
-                    # ignore file if it is a symlink
-                    if os.path.islink(os.path.join(root, file_path)):
-                        continue
-
-                    file_size = 0
-                    try:
-                        file_size = os.path.getsize(full_file_path)
-                    except:
-                        sys.stderr.write("Unable to read %s size\n"
-                                        % full_file_path)
-                        size_unreadable = True
-                        break
-
-                    total_size += os.path.getsize(full_file_path)
-                
-                if size_unreadable:
-                    total_size = -1
-                    break
-        
-        for folder_size in folder_sizes:
-            if folder_size['path'] == self.path:
-                folder_size['modified'] = modified
-                folder_size['size'] = total_size
-                break
-        else:
-            folder_sizes.append(
-                {'path': self.path, 'modified': modified, 'size': total_size})
+        if total_size is None:
+            # preview reply will be sent once size is calculated
+            return
 
         self.send_even_dummy(
             src_addr, '/ray/gui/preview/session_size', total_size)
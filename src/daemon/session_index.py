@@ -0,0 +1,321 @@
+
+import json
+import os
+import xdg.BaseDirectory
+
+from PyQt5.QtCore import QFileSystemWatcher, QTimer
+
+import ray
+
+from daemon_tools import dirname, Terminal
+from multi_daemon_file import MultiDaemonFile
+from server_sender import ServerSender
+
+
+class SessionIndex(ServerSender):
+    ''' Index of all sessions under the session root.
+    Each folder is only re-read when its mtime changed,
+    the index is kept current with a QFileSystemWatcher (inotify)
+    while the daemon runs and saved in the XDG cache at exit. '''
+
+    def __init__(self, session):
+        ServerSender.__init__(self)
+        self.session = session
+
+        self._cache_path = (xdg.BaseDirectory.xdg_cache_home
+                            + "/RaySession/session_index.json")
+
+        # dict of roots, each root is a dict where
+        # key is the folder path relative to root ('' for root itself)
+        self._roots = {}
+        self._root = ''
+        self._dirs = {}
+        self._verified = False
+        self._changed_dirs = set()
+
+        self._watcher = QFileSystemWatcher()
+        self._watcher.directoryChanged.connect(self._directory_changed)
+
+        # inotify events are coalesced, a save can modify many files
+        self._refresh_timer = QTimer()
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.setInterval(300)
+        self._refresh_timer.timeout.connect(self._refresh_and_send_deltas)
+
+        self._load_cache_file()
+
+    def _load_cache_file(self):
+        if not os.path.isfile(self._cache_path):
+            return
+
+        try:
+            with open(self._cache_path, 'r') as f:
+                roots = json.load(f)
+        except:
+            # cache file load failed, index will be rebuilt
+            return
+
+        if isinstance(roots, dict):
+            self._roots = roots
+
+    def save_cache_file(self):
+        if self._root:
+            self._roots[self._root] = self._dirs
+
+        cache_dir = dirname(self._cache_path)
+        if not os.path.exists(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except:
+                # can't save cache file, this is really not strong
+                return
+
+        try:
+            with open(self._cache_path, 'w') as f:
+                json.dump(self._roots, f)
+        except:
+            Terminal.message("Failed to save session index cache file")
+
+    def _set_root(self, root: str):
+        if root == self._root:
+            return
+
+        if self._root:
+            self._roots[self._root] = self._dirs
+
+        watched = self._watcher.directories()
+        if watched:
+            self._watcher.removePaths(watched)
+
+        self._root = root
+        self._dirs = self._roots.get(root, {})
+        if not isinstance(self._dirs, dict):
+            self._dirs = {}
+        self._verified = False
+        self._changed_dirs.clear()
+
+    def _full_path(self, rel_path: str)->str:
+        if rel_path:
+            return "%s/%s" % (self._root, rel_path)
+        return self._root
+
+    def _scan_dir(self, rel_path: str):
+        full_path = self._full_path(rel_path)
+        scripts_path = "%s/%s" % (full_path, ray.SCRIPTS_DIR)
+
+        try:
+            mtime = os.path.getmtime(full_path)
+        except:
+            return None
+
+        scripts_mtime = 0.0
+        if os.path.isdir(scripts_path):
+            try:
+                scripts_mtime = os.path.getmtime(scripts_path)
+            except:
+                pass
+
+        entry = self._dirs.get(rel_path)
+        if (entry and entry['mtime'] == mtime
+                and entry['scripts_mtime'] == scripts_mtime):
+            return entry
+
+        try:
+            names = os.listdir(full_path)
+        except:
+            return None
+
+        files = set()
+        subdirs = []
+
+        for name in names:
+            if name.startswith('.'):
+                continue
+
+            if os.path.isdir("%s/%s" % (full_path, name)):
+                subdirs.append(name)
+            else:
+                files.add(name)
+
+        scripts = -1
+        if ray.SCRIPTS_DIR in subdirs:
+            scripts = ray.ScriptFile.PREVENT
+            for action in ('load', 'save', 'close'):
+                if os.access("%s/%s.sh" % (scripts_path, action), os.X_OK):
+                    scripts += ray.ScriptFile.by_string(action)
+
+        return {'mtime': mtime,
+                'scripts_mtime': scripts_mtime,
+                'subdirs': sorted(subdirs),
+                'is_session': bool(
+                    'raysession.xml' in files or 'session.nsm' in files),
+                'has_notes': bool(ray.NOTES_PATH in files),
+                'scripts': scripts}
+
+    def refresh(self, root: str):
+        ''' walks the root folder, only folders with a changed mtime
+        are listed again. returns the list of changed folders. '''
+        self._set_root(root)
+
+        if not self._root or not os.path.isdir(self._root):
+            self._dirs = {}
+            return []
+
+        new_dirs = {}
+        changed = []
+        rel_paths = ['']
+
+        while rel_paths:
+            rel_path = rel_paths.pop(0)
+            entry = self._scan_dir(rel_path)
+            if entry is None:
+                continue
+
+            if self._dirs.get(rel_path) is not entry:
+                changed.append(rel_path)
+
+            new_dirs[rel_path] = entry
+
+            if rel_path and entry['is_session']:
+                # prevent search in sub directories
+                continue
+
+            for subdir in entry['subdirs']:
+                if rel_path:
+                    rel_paths.append("%s/%s" % (rel_path, subdir))
+                else:
+                    rel_paths.append(subdir)
+
+        self._dirs = new_dirs
+        self._verified = True
+        self._changed_dirs.clear()
+        self._update_watched()
+
+        return changed
+
+    def _remove_tree(self, rel_path: str):
+        for path in list(self._dirs):
+            if (path == rel_path or not rel_path
+                    or path.startswith("%s/" % rel_path)):
+                del self._dirs[path]
+
+    def _refresh_dirs(self, rel_paths: list)->list:
+        ''' lists again only the given folders,
+        and the new sub folders found. returns the list of changed folders. '''
+        changed = []
+        rel_paths = sorted(rel_paths)
+
+        while rel_paths:
+            rel_path = rel_paths.pop(0)
+            old_entry = self._dirs.get(rel_path)
+            entry = self._scan_dir(rel_path)
+            if entry is None:
+                self._remove_tree(rel_path)
+                continue
+
+            if entry is old_entry:
+                continue
+
+            changed.append(rel_path)
+            self._dirs[rel_path] = entry
+
+            old_subdirs = []
+            if old_entry and not (rel_path and old_entry['is_session']):
+                old_subdirs = old_entry['subdirs']
+
+            new_subdirs = []
+            if not (rel_path and entry['is_session']):
+                new_subdirs = entry['subdirs']
+
+            for subdir in old_subdirs:
+                if subdir not in new_subdirs:
+                    self._remove_tree(
+                        "%s/%s" % (rel_path, subdir) if rel_path else subdir)
+
+            for subdir in new_subdirs:
+                sub_path = "%s/%s" % (rel_path, subdir) if rel_path else subdir
+                if subdir not in old_subdirs or sub_path not in self._dirs:
+                    rel_paths.append(sub_path)
+
+        self._update_watched()
+        return changed
+
+    def _update_watched(self):
+        watched = set(self._watcher.directories())
+        wanted = set()
+        for rel_path in self._dirs:
+            wanted.add(self._full_path(rel_path))
+
+        if watched - wanted:
+            self._watcher.removePaths(list(watched - wanted))
+        if wanted - watched:
+            self._watcher.addPaths(list(wanted - watched))
+
+    def is_verified(self, root: str)->bool:
+        return bool(self._verified and root == self._root
+                    and not self._changed_dirs)
+
+    def sessions(self)->list:
+        return [r for r in self._dirs
+                if r and self._dirs[r]['is_session']]
+
+    @staticmethod
+    def locked_paths()->set:
+        ''' returns paths of sessions loaded by any daemon,
+        to read once for all listed sessions. '''
+        multi_daemon_file = MultiDaemonFile.get_instance()
+        if multi_daemon_file is None:
+            return set()
+        return set(multi_daemon_file.get_all_session_paths())
+
+    def session_details(self, rel_path: str, locked_paths: set)->tuple:
+        entry = self._dirs[rel_path]
+        return (rel_path, int(entry['has_notes']), int(entry['mtime']),
+                int(self._full_path(rel_path) in locked_paths))
+
+    def scripted_dirs(self)->list:
+        return [(r, self._dirs[r]['scripts']) for r in self._dirs
+                if r and self._dirs[r]['scripts'] >= 0]
+
+    def _directory_changed(self, path: str):
+        if not self._root:
+            return
+
+        if path == self._root:
+            self._changed_dirs.add('')
+        elif path.startswith("%s/" % self._root):
+            self._changed_dirs.add(path[len(self._root) + 1:])
+        else:
+            return
+
+        self._refresh_timer.start()
+
+    def _refresh_and_send_deltas(self):
+        old_sessions = set(self.sessions())
+
+        if not self._verified or not os.path.isdir(self._root):
+            changed = self.refresh(self._root)
+        else:
+            changed = self._refresh_dirs(list(self._changed_dirs))
+            self._changed_dirs.clear()
+
+        # removed folders, or folders which are not sessions anymore
+        for rel_path in sorted(old_sessions - set(self.sessions())):
+            self.send_gui('/ray/gui/listed_session/removed', rel_path)
+
+        locked_paths = None
+
+        for rel_path in changed:
+            entry = self._dirs[rel_path]
+            if not rel_path:
+                continue
+
+            if entry['scripts'] >= 0:
+                self.send_gui('/ray/gui/listed_session/scripted_dir',
+                              rel_path, entry['scripts'])
+
+            if entry['is_session']:
+                if locked_paths is None:
+                    locked_paths = self.locked_paths()
+                self.send_gui('/ray/gui/listed_session/details',
+                              *self.session_details(rel_path, locked_paths))
@@ -1,5 +1,4 @@
 
-import json
 import os
 import shutil
 import subprocess
@@ -17,7 +16,10 @@ from multi_daemon_file import MultiDaemonFile
 from signaler import Signaler
 from daemon_tools import (Terminal, RS, dirname,
                           is_pid_child_of, highlight_text)
+from osc_server_thread import RAY_METHOD_PATHS
 from session import OperatingSession
+from session_index import SessionIndex
+from size_calculator import SizeCalculator
 
 _translate = QCoreApplication.translate
 signaler = Signaler.instance()
@@ -80,6 +82,10 @@ class SignaledSession(OperatingSession):
     def __init__(self, root):
         OperatingSession.__init__(self, root)
 
+        # path: [number of calls, cumulative handler time in seconds]
+        self._dispatch_stats = {}
+        self._build_dispatch_table()
+
         signaler.osc_recv.connect(self.osc_receive)
         signaler.dummy_load_and_template.connect(self.dummy_load_and_template)
 
@@ -91,19 +97,15 @@ class SignaledSession(OperatingSession):
         self.dummy_sessions = []
         self._next_session_id = 1
         
-        self._folder_sizes_and_dates = []
-        
-        self._cache_folder_sizes_path = \
-            xdg.BaseDirectory.xdg_cache_home + "/RaySession/folder_sizes.json"
+        self.session_index = SessionIndex(self)
+
+        self.size_calculator = SizeCalculator(
+            xdg.BaseDirectory.xdg_cache_home + "/RaySession/folder_sizes.json")
+        signaler.folder_size_calculated.connect(self._folder_size_calculated)
+        self._preview_size_path = ''
+        self._preview_size_addr = None
+        self._preview_cached_size = None
 
-        if os.path.isfile(self._cache_folder_sizes_path):
-            try:
-                self._folder_sizes_and_dates = json.load(
-                    self._cache_folder_sizes_path)
-            except:
-                # cache file load failed and this is really not strong
-                pass
-    
     def _get_new_dummy_session_id(self)->int:
         to_return = self._next_session_id
         self._next_session_id += 1
@@ -115,23 +117,33 @@ class SignaledSession(OperatingSession):
         return new_dummy
 
     def save_folder_sizes_cache_file(self):
-        cache_dir = dirname(self._cache_folder_sizes_path)
-        if not os.path.exists(cache_dir):
-            try:
-                os.makedirs(cache_dir)
-            except:
-                # can't save cache file, this is really not strong
-                return
-        
-        try:
-            file = open(self._cache_folder_sizes_path, 'w')
-            json.dump(self._folder_sizes_and_dates, file)
-            file.close()
-        except:
-            # cache file save failed, not strong
-            pass
+        self.size_calculator.save_cache_file()
 
-    def osc_receive(self, path, args, types, src_addr):
+    def _folder_size_calculated(self, path: str, total_size: int):
+        if path != self._preview_size_path:
+            return
+
+        server = self.get_server()
+        if (server is None
+                or server.session_to_preview != self._preview_size_path.replace(
+                    self.root + '/', '', 1)):
+            return
+
+        cached_size = self._preview_cached_size
+        self._preview_size_path = ''
+
+        if total_size == cached_size:
+            return
+
+        self.send(self._preview_size_addr,
+                  '/ray/gui/preview/session_size', total_size)
+
+        if cached_size is None:
+            # preview was waiting for the session size
+            self.send(self._preview_size_addr,
+                      '/reply', '/ray/server/get_session_preview')
+
+    def _build_dispatch_table(self):
         nsm_equivs = {"/nsm/server/add" : "/ray/session/add_executable",
                       "/nsm/server/save": "/ray/session/save",
                       "/nsm/server/open": "/ray/server/open_session",
@@ -143,14 +155,27 @@ class SignaledSession(OperatingSession):
                       # /nsm/server/list is not used here because it doesn't
                       # works as /ray/server/list_sessions
 
-        nsm_path = nsm_equivs.get(path)
-        func_path = nsm_path if nsm_path else path
+        self._dispatch_table = {}
+
+        for path in RAY_METHOD_PATHS:
+            func_path = nsm_equivs.get(path, path)
+            function = getattr(self, func_path.replace('/', '_'), None)
+            if function is not None:
+                self._dispatch_table[path] = function
+
+    def osc_receive(self, path, args, types, src_addr):
+        function = self._dispatch_table.get(path)
+        if function is None:
+            return
 
-        func_name = func_path.replace('/', '_')
+        start_time = time.perf_counter()
+        function(path, args, src_addr)
 
-        if func_name in self.__dir__():
-            function = self.__getattribute__(func_name)
-            function(path, args, src_addr)
+        stats = self._dispatch_stats.get(path)
+        if stats is None:
+            stats = self._dispatch_stats[path] = [0, 0.0]
+        stats[0] += 1
+        stats[1] += time.perf_counter() - start_time
 
     def send_error_no_client(self, src_addr, path, client_id):
         self.send(src_addr, "/error", path, ray.Err.CREATE_FAILED,
@@ -302,6 +327,12 @@ class SignaledSession(OperatingSession):
                 break
         self.send(src_addr, '/reply', path, 'Parrallel copy aborted')
 
+    def _ray_server_get_dispatch_stats(self, path, args, src_addr):
+        for osc_path, stats in sorted(self._dispatch_stats.items()):
+            self.send(src_addr, '/reply', path, osc_path, stats[0], stats[1])
+
+        self.send(src_addr, '/reply', path)
+
     def _ray_server_abort_snapshot(self, path, args, src_addr):
         self.snapshoter.abort()
 
@@ -450,35 +481,22 @@ class SignaledSession(OperatingSession):
                       "no session root, so no sessions to list")
             return
 
+        if not self.session_index.is_verified(self.root):
+            self.session_index.refresh(self.root)
+
         session_list = []
-        sessions_set = set()
         n = 0
 
-        for root, dirs, files in os.walk(self.root):
-            #exclude hidden files and dirs
-            files = [f for f in files if not f.startswith('.')]
-            dirs[:] = [d for d in dirs  if not d.startswith('.')]
+        for basefolder in self.session_index.sessions():
+            session_list.append(basefolder)
+            n += len(basefolder)
 
-            if root == self.root:
-                continue
-
-            for file in files:
-                if file in ('raysession.xml', 'session.nsm'):
-                    # prevent search in sub directories
-                    dirs.clear()
+            if n >= 10000 or time.time() - last_sent_time > 0.300:
+                last_sent_time = time.time()
+                self.send(src_addr, "/reply", path, *session_list)
 
-                    basefolder = root.replace(self.root + '/', '', 1)
-                    session_list.append(basefolder)
-                    sessions_set.add(basefolder)
-                    n += len(basefolder)
-
-                    if n >= 10000 or time.time() - last_sent_time > 0.300:
-                        last_sent_time = time.time()
-                        self.send(src_addr, "/reply", path, *session_list)
-
-                        session_list.clear()
-                        n = 0
-                    break
+                session_list.clear()
+                n = 0
 
         if session_list:
             self.send(src_addr, "/reply", path, *session_list)
@@ -494,63 +512,28 @@ class SignaledSession(OperatingSession):
                 break
             search_scripts_dir = dirname(search_scripts_dir)
 
-        locked_sessions = []
-        multi_daemon_file = MultiDaemonFile.get_instance()
-        if multi_daemon_file is not None:
-            locked_sessions = multi_daemon_file.get_all_session_paths()
-
-        for root, dirs, files in os.walk(self.root):
-            #exclude hidden files and dirs
-            files = [f for f in files if not f.startswith('.')]
-            dirs[:] = [d for d in dirs  if not d.startswith('.')]
-
-            if root == self.root:
-                if has_general_scripts:
-                    self.send(src_addr, '/ray/gui/listed_session/scripted_dir',
-                              '', ray.ScriptFile.PARENT)
-                continue
-            
-            basefolder = root.replace(self.root + '/', '', 1)
-            
-            if ray.SCRIPTS_DIR in dirs:
-                script_files = ray.ScriptFile.PREVENT
-                
-                for action in ('load', 'save', 'close'):
-                    if os.access(
-                            "%s/%s/%s.sh" % (root, ray.SCRIPTS_DIR, action),
-                            os.X_OK):
-                        script_files += ray.ScriptFile.by_string(action)
-
-                self.send(src_addr, '/ray/gui/listed_session/scripted_dir',
-                          basefolder, script_files)
-            
-            if basefolder not in sessions_set:
-                continue
+        if has_general_scripts:
+            self.send(src_addr, '/ray/gui/listed_session/scripted_dir',
+                      '', ray.ScriptFile.PARENT)
 
-            has_notes = bool(ray.NOTES_PATH in files)
-            last_modified = int(os.path.getmtime(root))
-            locked = bool(root in locked_sessions)
+        for basefolder, script_files in self.session_index.scripted_dirs():
+            self.send(src_addr, '/ray/gui/listed_session/scripted_dir',
+                      basefolder, script_files)
 
-            self.send(src_addr, '/ray/gui/listed_session/details',
-                      basefolder, int(has_notes), last_modified, int(locked))
+        locked_paths = self.session_index.locked_paths()
 
-            # prevent search in sub directories
-            dirs.clear()        
+        for basefolder in self.session_index.sessions():
+            self.send(src_addr, '/ray/gui/listed_session/details',
+                      *self.session_index.session_details(basefolder,
+                                                          locked_paths))
 
     def _nsm_server_list(self, path, args, src_addr):
         if self.root:
-            for root, dirs, files in os.walk(self.root):
-                #exclude hidden files and dirs
-                files = [f for f in files if not f.startswith('.')]
-                dirs[:] = [d for d in dirs  if not d.startswith('.')]
+            if not self.session_index.is_verified(self.root):
+                self.session_index.refresh(self.root)
 
-                if root == self.root:
-                    continue
-
-                for file in files:
-                    if file in ('raysession.xml', 'session.nsm'):
-                        basefolder = root.replace(self.root + '/', '', 1)
-                        self.send(src_addr, '/reply', path, basefolder)
+            for basefolder in self.session_index.sessions():
+                self.send(src_addr, '/reply', path, basefolder)
 
         self.send(src_addr, '/reply', path, "")
 
@@ -650,6 +633,7 @@ class SignaledSession(OperatingSession):
                                  template_name, True)]
 
         self.steps_order += [(self.preload, session_name),
+                             self.flush_deferred_snapshot,
                              (self.close, open_off),
                              self.take_place,
                              (self.load, open_off),
@@ -710,10 +694,15 @@ class SignaledSession(OperatingSession):
             # changed the session to preview
             return
 
+        self._preview_size_path = "%s/%s" % (self.root, session_name)
+        self._preview_size_addr = src_addr
+        self._preview_cached_size = self.size_calculator.get_cached_size(
+            self._preview_size_path)
+
         del self.preview_dummy_session
         self.preview_dummy_session = DummySession(self.root)
         self.preview_dummy_session.ray_server_get_session_preview(
-            path, args, src_addr, self._folder_sizes_and_dates)
+            path, args, src_addr, self.size_calculator)
 
     def _ray_server_set_option(self, path, args, src_addr):
         option = args[0]
@@ -733,7 +722,7 @@ class SignaledSession(OperatingSession):
 
     @session_operation
     def _ray_session_save(self, path, args, src_addr):
-        self.steps_order = [self.save, self.snapshot, self.save_done]
+        self.steps_order = [self.save, self.deferred_snapshot, self.save_done]
 
     @session_operation
     def _ray_session_save_as_template(self, path, args, src_addr):
@@ -775,6 +764,7 @@ class SignaledSession(OperatingSession):
         self.steps_order = [(self.save, True),
                             self.close_no_save_clients,
                             self.snapshot,
+                            self.flush_deferred_snapshot,
                             (self.close, True),
                             self.close_done]
 
@@ -819,7 +809,8 @@ class SignaledSession(OperatingSession):
                                     'abort ordered from elsewhere, sorry !'))
 
         self.remember_osc_args(path, args, src_addr)
-        self.steps_order = [(self.close, True), self.abort_done]
+        self.steps_order = [self.flush_deferred_snapshot,
+                            (self.close, True), self.abort_done]
 
         if self.file_copier.is_active():
             self.file_copier.abort(self.next_function, [])
@@ -829,6 +820,7 @@ class SignaledSession(OperatingSession):
     def _ray_server_quit(self, path, args, src_addr):
         self.remember_osc_args(path, args, src_addr)
         self.steps_order = [self.terminate_step_scripter,
+                            self.flush_deferred_snapshot,
                             self.close, self.exit_now]
 
         if self.file_copier.is_active():
@@ -1199,26 +1191,31 @@ class SignaledSession(OperatingSession):
                       "no session to list snapshots")
             return
 
-        auto_snapshot = not self.snapshoter.is_auto_snapshot_prevented()
-        self.send_gui('/ray/gui/session/auto_snapshot', int(auto_snapshot))
+        offset = 0
+        count = 0
+        if len(args) >= 2:
+            offset, count = args[-2:]
+
+        if not offset:
+            auto_snapshot = not self.snapshoter.is_auto_snapshot_prevented()
+            self.send_gui('/ray/gui/session/auto_snapshot', int(auto_snapshot))
 
-        snapshots = self.snapshoter.list(client_id)
+        snapshots = self.snapshoter.list(client_id, max(offset, 0), count)
 
-        i = 0
-        snap_send = []
+        for i in range(0, len(snapshots), 20):
+            self.send(src_addr, '/reply', path, *snapshots[i:i+20])
 
-        for snapshot in snapshots:
-            if i == 20:
-                self.send(src_addr, '/reply', path, *snap_send)
+        self.send(src_addr, '/reply', path)
 
-                snap_send.clear()
-                i = 0
-            else:
-                snap_send.append(snapshot)
-                i += 1
+    def _ray_session_get_snapshots_stats(self, path, args, src_addr):
+        if not self.path:
+            self.send(src_addr, '/error', path, ray.Err.NO_SESSION_OPEN,
+                      "no session to get snapshots stats")
+            return
+
+        for row in self.snapshoter.get_stats():
+            self.send(src_addr, '/reply', path, *row)
 
-        if snap_send:
-            self.send(src_addr, '/reply', path, *snap_send)
         self.send(src_addr, '/reply', path)
 
     def _ray_session_set_auto_snapshot(self, path, args, src_addr):
@@ -1601,7 +1598,7 @@ class SignaledSession(OperatingSession):
                 "client is not running, impossible to get its pid")
 
     def _ray_client_list_snapshots(self, path, args, src_addr):
-        self._ray_session_list_snapshots(path, [], src_addr, args[0])
+        self._ray_session_list_snapshots(path, args[1:], src_addr, args[0])
 
     @session_operation
     def _ray_client_open_snapshot(self, path, args, src_addr):
@@ -1837,6 +1834,7 @@ class SignaledSession(OperatingSession):
 
         self.terminated_yet = True
         self.steps_order = [self.terminate_step_scripter,
+                            self.flush_deferred_snapshot,
                             self.close, self.exit_now]
         self.next_function()
 
@@ -1894,12 +1892,12 @@ class DummySession(OperatingSession):
         self.next_function()
     
     def ray_server_get_session_preview(self, path, args, src_addr,
-                                       folder_sizes:list):
+                                       size_calculator):
         session_name = args[0]
         self.steps_order = [(self.preload, session_name, False),
                             self.take_place,
                             self.load,
-                            (self.send_preview, src_addr, folder_sizes)]
+                            (self.send_preview, src_addr, size_calculator)]
         self.next_function()
     
     def dummy_load(self, session_name):
@@ -5,6 +5,9 @@ instance = None
 class Signaler(QObject):
     osc_recv = pyqtSignal(str, list, str, object)
     dummy_load_and_template = pyqtSignal(str, str, str)
+    folder_size_calculated = pyqtSignal(str, object)
+    flow_queue_filled = pyqtSignal()
+    copy_finished = pyqtSignal(object)
 
     @staticmethod
     def instance():
@@ -0,0 +1,166 @@
+
+import json
+import os
+import queue
+import sys
+import threading
+
+from daemon_tools import dirname
+from signaler import Signaler
+
+signaler = Signaler.instance()
+
+
+class SizeCalculator:
+    ''' Calculates folder sizes in a worker thread.
+    Size of the files directly contained in each folder is cached
+    with the folder mtime, so only modified folders are read again.
+    When a calculation is finished, signaler.folder_size_calculated
+    is emitted with the folder path and its size (-1 if unreadable). '''
+
+    def __init__(self, cache_path: str):
+        self._cache_path = cache_path
+
+        # key is the full folder path,
+        # value is [mtime, files_size, subdirs]
+        self._dirs = {}
+
+        # key is the full path of requested folders, value is total size
+        self._totals = {}
+
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._wanted_path = ''
+
+        self._load_cache_file()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _load_cache_file(self):
+        if not os.path.isfile(self._cache_path):
+            return
+
+        try:
+            with open(self._cache_path, 'r') as f:
+                cache = json.load(f)
+        except:
+            # cache file load failed and this is really not strong
+            return
+
+        # older versions saved a list of dicts here
+        if not isinstance(cache, dict):
+            return
+
+        dirs = cache.get('dirs')
+        totals = cache.get('totals')
+        if isinstance(dirs, dict) and isinstance(totals, dict):
+            self._dirs = dirs
+            self._totals = totals
+
+    def save_cache_file(self):
+        cache_dir = dirname(self._cache_path)
+        if not os.path.exists(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except:
+                # can't save cache file, this is really not strong
+                return
+
+        with self._lock:
+            contents = json.dumps({'dirs': self._dirs,
+                                   'totals': self._totals})
+
+        try:
+            with open(self._cache_path, 'w') as f:
+                f.write(contents)
+        except:
+            # cache file save failed, not strong
+            pass
+
+    def get_cached_size(self, path: str):
+        ''' returns the last known size of path, or None '''
+        with self._lock:
+            return self._totals.get(path)
+
+    def request(self, path: str):
+        ''' asks for a size calculation of path.
+        Any previous not finished request is abandoned. '''
+        self._wanted_path = path
+        self._queue.put(path)
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            if path != self._wanted_path:
+                continue
+
+            total_size = self._calculate(path)
+            if total_size is None:
+                # calculation abandoned, another path is wanted
+                continue
+
+            with self._lock:
+                self._totals[path] = total_size
+
+            signaler.folder_size_calculated.emit(path, total_size)
+
+    def _calculate(self, path: str):
+        total_size = 0
+        seen_dirs = set()
+        dir_paths = [path]
+
+        while dir_paths:
+            if self._wanted_path != path:
+                return None
+
+            dir_path = dir_paths.pop()
+
+            try:
+                mtime = os.stat(dir_path).st_mtime
+            except:
+                sys.stderr.write("Unable to read %s\n" % dir_path)
+                return -1
+
+            seen_dirs.add(dir_path)
+
+            with self._lock:
+                cached = self._dirs.get(dir_path)
+
+            if cached and cached[0] == mtime:
+                files_size, subdirs = cached[1], cached[2]
+            else:
+                files_size = 0
+                subdirs = []
+
+                try:
+                    with os.scandir(dir_path) as entries:
+                        for entry in entries:
+                            # exclude symlinks from count
+                            if entry.is_symlink():
+                                continue
+
+                            if entry.is_dir():
+                                subdirs.append(entry.name)
+                            else:
+                                files_size += entry.stat().st_size
+                except:
+                    sys.stderr.write("Unable to read %s size\n" % dir_path)
+                    return -1
+
+                with self._lock:
+                    self._dirs[dir_path] = [mtime, files_size, subdirs]
+
+            total_size += files_size
+
+            for subdir in subdirs:
+                dir_paths.append(os.path.join(dir_path, subdir))
+
+        # forget removed sub folders
+        with self._lock:
+            for dir_path in [d for d in self._dirs
+                             if d.startswith(path + '/')
+                                and d not in seen_dirs]:
+                self._dirs.pop(dir_path)
+
+        return total_size
@@ -1,11 +1,53 @@
 
+import json
 import os
+import shutil
 import socket
-from PyQt5.QtCore import QProcess, QObject, QDateTime
+import time
+from PyQt5.QtCore import (QProcess, QObject, QDateTime, QTimer,
+                          QCoreApplication)
 from PyQt5.QtXml import QDomDocument
 
 import ray
 from daemon_tools import Terminal
+from file_copier import CopyEngine
+from signaler import Signaler
+
+_translate = QCoreApplication.translate
+signaler = Signaler.instance()
+
+# short git commands are terminated if they take more time (ms)
+GIT_TIMEOUT = 60000
+
+# these git commands read or write all session files,
+# they can take a long time and are never timed out.
+GIT_LONG_COMMANDS = ('add', 'checkout', 'reset', 'hash-object',
+                     'fast-import')
+
+# a terminated git command is killed after this time (ms)
+GIT_KILL_DELAY = 5000
+
+# how git process standard output is treated
+OUTPUT_PRINT = 0
+OUTPUT_CAPTURE = 1
+OUTPUT_PROGRESS = 2
+
+# snapshot progress sent to GUIs at each phase
+PROGRESS_ADD_START = 0.05
+PROGRESS_ADD_END = 0.85
+PROGRESS_COMMIT = 0.90
+PROGRESS_TAG = 0.95
+
+# repository maintenance is done after this idle time (ms)
+# following a snapshot
+MAINTENANCE_IDLE_DELAY = 60000
+
+# git gc is launched from these numbers of loose objects or packs
+MAINTENANCE_LOOSE_OBJECTS = 2000
+MAINTENANCE_PACKS = 20
+
+# number of snapshots costs kept in repository stats
+STATS_SNAPSHOTS_MAX = 200
 
 def git_stringer(string:str)->str:
     for char in (' ', '*', '?', '[', ']', '(', ')'):
@@ -31,49 +73,126 @@ class Snapshoter(QObject):
         self._gitdir = '.ray-snapshots'
         self._exclude_path = 'info/exclude'
         self._history_path = "session_history.xml"
+        self._history_index_path = 'history_index.json'
+        self._history_index = None
+        self._big_files_cache_path = 'big_files.json'
+        self._big_store_path = 'big_files_store'
+        self._big_store_cache_path = 'big_files_store.json'
+        self._repo_stats_path = 'repo_stats.json'
         self._max_file_size = 50 #in Mb
 
         self._next_snapshot_name = ''
         self._rw_snapshot = ''
 
-        self._changes_checker = QProcess()
-        self._changes_checker.readyReadStandardOutput.connect(
-            self._changes_checker_standard_output)
-
-        self._adder_process = QProcess()
-        self._adder_process.finished.connect(self._save_step_1)
-        self._adder_process.readyReadStandardOutput.connect(
-            self._adder_standard_output)
-
-        self._adder_aborted = False
-
+        # all git commands are executed one by one by this process,
+        # the daemon never waits for them.
         self._git_process = QProcess()
         self._git_process.readyReadStandardOutput.connect(self._standard_output)
         self._git_process.readyReadStandardError.connect(self._standard_error)
+        self._git_process.finished.connect(self._git_process_finished)
+        if ray.QT_VERSION >= (5, 6):
+            self._git_process.errorOccurred.connect(self._git_process_error)
         self._git_command = ''
+        self._output_mode = OUTPUT_PRINT
+        self._git_output = b''
+        self._git_timed_out = False
+        # with it, a git exit code is not an error for the next step
+        self._git_exit_code_allowed = False
+        self._git_exit_code = 0
+
+        self._git_timer = QTimer()
+        self._git_timer.setSingleShot(True)
+        self._git_timer.setInterval(GIT_TIMEOUT)
+        self._git_timer.timeout.connect(self._git_process_timeout)
+
+        # steps of the running operation, each step is a function
+        # or a tuple (function, *args), and has to call self._next_step
+        # once it is done.
+        self._steps = []
+        self._steps_path = ''
+        self._snapshot_ref = ''
+        self._saving = False
+        self._low_priority = False
+        self._low_priority_prefix = []
+        if shutil.which('ionice') and shutil.which('nice'):
+            self._low_priority_prefix = ['ionice', '-c', '3',
+                                         'nice', '-n', '19']
+        self._aborted = False
 
         self._n_file_changed = 0
         self._n_file_treated = 0
         self._changes_counted = False
+        self._changed_paths = None
+        self._changes_duration = 0.0
+        self._changes_next = None
+
+        # files too big for git, optionally kept in the big files store
+        self._too_big_files = []
+        self._big_files_to_hash = []
+        self._big_files_refs = {}
+        self._big_files_changed = False
+        self._big_store_cache = None
+        self._copy_engine = None
+        self._copy_temps = []
+        self._copy_failed = set()
+        signaler.copy_finished.connect(self._copy_finished)
+
+        # list of tuples (phase name, duration) of the current snapshot
+        self._phase_times = []
+        self._phase_name = ''
+        self._phase_start = 0.0
+        self.last_phase_times = {}
 
         self._next_function = None
         self._error_function = None
 
-    def _changes_checker_standard_output(self):
-        standard_output = self._changes_checker.readAllStandardOutput().data()
-        self._n_file_changed += len(standard_output.splitlines()) -1
-
-    def _adder_standard_output(self):
-        standard_output = self._adder_process.readAllStandardOutput().data()
-        Terminal.snapshoter_message(standard_output, ' add -A -v')
-
-        if not self._n_file_changed:
+        # repository maintenance has its own process, at low priority,
+        # git allows it to run during a snapshot.
+        self._maintenance_process = QProcess()
+        self._maintenance_process.readyReadStandardError.connect(
+            self._maintenance_standard_error)
+        self._maintenance_process.finished.connect(
+            self._maintenance_process_finished)
+        if ray.QT_VERSION >= (5, 6):
+            self._maintenance_process.errorOccurred.connect(
+                self._maintenance_process_error)
+        self._maintenance_steps = []
+        self._maintenance_path = ''
+        self._maintenance_task = ''
+        self._maintenance_start = 0.0
+        self._maintenance_duration = 0.0
+        self._maintenance_output = b''
+
+        self._maintenance_timer = QTimer()
+        self._maintenance_timer.setSingleShot(True)
+        self._maintenance_timer.setInterval(MAINTENANCE_IDLE_DELAY)
+        self._maintenance_timer.timeout.connect(self._maintenance_timeout)
+
+    def _phase(self, name=''):
+        ''' ends the current snapshot phase and starts the name one '''
+        now = time.perf_counter()
+        if self._phase_name:
+            self._phase_times.append(
+                (self._phase_name, now - self._phase_start))
+
+        self._phase_name = name
+        self._phase_start = now
+
+    def _report_phase_times(self):
+        self._phase()
+        if not self._phase_times:
             return
 
-        self._n_file_treated += len(standard_output.splitlines()) -1
+        self.last_phase_times = dict(self._phase_times)
+        Terminal.message(
+            "snapshot timings: %s, total %.3fs"
+            % (', '.join(["%s %.3fs" % pt for pt in self._phase_times]),
+               sum([pt[1] for pt in self._phase_times])))
+        self._phase_times.clear()
 
-        self.session.send_gui('/ray/gui/server/progress',
-                              self._n_file_treated / self._n_file_changed)
+    def _send_progress(self, progress: float):
+        if self._saving and not self._low_priority:
+            self.session.send_gui('/ray/gui/server/progress', progress)
 
     def _standard_error(self):
         standard_error = self._git_process.readAllStandardError().data()
@@ -81,33 +200,174 @@ class Snapshoter(QObject):
 
     def _standard_output(self):
         standard_output = self._git_process.readAllStandardOutput().data()
+
+        if self._output_mode == OUTPUT_CAPTURE:
+            self._git_output += standard_output
+            return
+
         Terminal.snapshoter_message(standard_output, self._git_command)
 
-    def _run_git_process(self, *all_args):
-        return self._run_git_process_at(self.session.path, *all_args)
+        if self._output_mode == OUTPUT_PROGRESS and self._n_file_changed:
+            self._n_file_treated += len(standard_output.splitlines())
+            self._send_progress(
+                PROGRESS_ADD_START
+                + (PROGRESS_ADD_END - PROGRESS_ADD_START)
+                  * min(self._n_file_treated / self._n_file_changed, 1.0))
+
+    def _start_steps(self, spath: str, steps: list,
+                     next_function, error_function):
+        if self.is_busy():
+            # should not happen, session operations are not simultaneous
+            Terminal.message("snapshoter is busy, operation refused")
+            if error_function:
+                error_function(ray.Err.OPERATION_PENDING)
+            return
 
-    def _run_git_process_at(self, spath, *all_args):
+        self._steps_path = spath
+        self._steps = list(steps)
+        self._next_function = next_function
+        self._error_function = error_function
+        self._aborted = False
+        self._next_step()
+
+    def _end_steps(self):
+        self._steps.clear()
+        self._report_phase_times()
+        if self._saving:
+            self._record_snapshot_cost()
+            self._maintenance_timer.start(MAINTENANCE_IDLE_DELAY)
+        self._saving = False
+        self._low_priority = False
+        self._next_snapshot_name = ''
+        self._rw_snapshot = ''
+
+    def _next_step(self):
+        if self._aborted:
+            next_function = self._next_function
+            self._end_steps()
+            self._next_function = None
+            self._error_function = None
+            if next_function:
+                next_function(aborted=True)
+            return
+
+        if not self._steps:
+            next_function = self._next_function
+            self._end_steps()
+            self._next_function = None
+            self._error_function = None
+            if next_function:
+                next_function()
+            return
+
+        step = self._steps.pop(0)
+        if isinstance(step, tuple):
+            step[0](*step[1:])
+        else:
+            step()
+
+    def _step_error(self, err: int, info_str=''):
+        error_function = self._error_function
+        self._end_steps()
+        self._next_function = None
+        self._error_function = None
+        if error_function:
+            error_function(err, info_str)
+
+    def _run_git(self, *all_args):
         self._git_command = ''
         for arg in all_args:
             self._git_command += ' %s' % arg
 
+        self._git_output = b''
+        self._git_timed_out = False
+        self._git_exit_code = 0
+
+        git_args = self._get_git_command_list_at(self._steps_path, *all_args)
+        self._git_process.setWorkingDirectory(self._steps_path)
+
+        if self._low_priority and self._low_priority_prefix:
+            # idle I/O priority, git doesn't slow down audio clients
+            self._git_process.start(
+                self._low_priority_prefix[0],
+                self._low_priority_prefix[1:] + [self._git_exec] + git_args)
+        else:
+            self._git_process.start(self._git_exec, git_args)
+
+        if all_args[0] not in GIT_LONG_COMMANDS:
+            self._git_timer.start(GIT_TIMEOUT)
+
+    def _run_git_with_input(self, input_data: bytes, *all_args):
+        self._run_git(*all_args)
+        self._git_process.write(input_data)
+        self._git_process.closeWriteChannel()
+
+    def _git_process_finished(self, exit_code: int, exit_status: int):
+        self._git_timer.stop()
+        output_mode = self._output_mode
+        self._output_mode = OUTPUT_PRINT
+        exit_code_allowed = self._git_exit_code_allowed
+        self._git_exit_code_allowed = False
+
+        if self._git_timed_out or exit_status:
+            self._remove_stale_index_lock()
+
+        if self._aborted:
+            self._next_step()
+            return
+
         err = ray.Err.OK
+        if self._git_timed_out:
+            err = ray.Err.SUBPROCESS_UNTERMINATED
+        elif exit_status:
+            err = ray.Err.SUBPROCESS_CRASH
+        elif exit_code and exit_code_allowed:
+            self._git_exit_code = exit_code
+        elif exit_code:
+            err = ray.Err.SUBPROCESS_EXITCODE
+
+        if err:
+            self._step_error(err, self._git_command.strip())
+            return
+
+        if output_mode == OUTPUT_CAPTURE:
+            # remaining output is read now
+            self._git_output += \
+                self._git_process.readAllStandardOutput().data()
+
+        self._next_step()
+
+    def _git_process_error(self, error: int):
+        if error != QProcess.FailedToStart:
+            return
 
-        git_args = self._get_git_command_list_at(spath, *all_args)
-        self._git_process.start(self._git_exec, git_args)
-        if not self._git_process.waitForFinished(2000):
+        self._git_timer.stop()
+        self._output_mode = OUTPUT_PRINT
+        self._git_exit_code_allowed = False
+        self._step_error(ray.Err.LAUNCH_FAILED, self._git_command.strip())
+
+    def _git_process_timeout(self):
+        if self._git_timed_out:
+            # git didn't quit after terminate
             self._git_process.kill()
-            err = ray.Err.SUBPROCESS_UNTERMINATED
-        else:
-            if self._git_process.exitStatus():
-                err = ray.Err.SUBPROCESS_CRASH
-            elif self._git_process.exitCode():
-                err = ray.Err.SUBPROCESS_EXITCODE
+            return
 
-        if err and self._error_function:
-            self._error_function(err, ' '.join(all_args))
+        # git removes its lock files when it is terminated
+        self._git_timed_out = True
+        self._git_process.terminate()
+        self._git_timer.start(GIT_KILL_DELAY)
 
-        return not bool(err)
+    def _remove_stale_index_lock(self):
+        # git commands are never run at the same time here,
+        # a lock left by an interrupted one would block all next snapshots.
+        lock_path = "%s/%s/index.lock" % (self._steps_path, self._gitdir)
+        if not os.path.exists(lock_path):
+            return
+
+        try:
+            os.remove(lock_path)
+        except:
+            Terminal.message("Unable to remove %s" % lock_path)
 
     def _get_git_command_list(self, *args):
         return self._get_git_command_list_at(self.session.path, *args)
@@ -118,15 +378,17 @@ class Snapshoter(QObject):
 
         return first_args + list(args)
 
-    def _get_history_full_path(self):
-        return "%s/%s/%s" % (
-                        self.session.path, self._gitdir, self._history_path)
+    def _get_history_full_path(self, spath=''):
+        if not spath:
+            spath = self.session.path
 
-    def _get_history_xml_document_element(self):
-        if not self._is_init():
+        return "%s/%s/%s" % (spath, self._gitdir, self._history_path)
+
+    def _get_history_xml_document_element(self, spath=''):
+        if not self._is_init(spath):
             return None
 
-        file_path = self._get_history_full_path()
+        file_path = self._get_history_full_path(spath)
 
         xml = QDomDocument()
 
@@ -143,6 +405,131 @@ class Snapshoter(QObject):
 
         return SNS_xml
 
+    def _get_history_index_full_path(self, spath='')->str:
+        if not spath:
+            spath = self.session.path
+
+        return "%s/%s/%s" % (spath, self._gitdir, self._history_index_path)
+
+    def _get_history_stat(self, spath=''):
+        try:
+            stat = os.stat(self._get_history_full_path(spath))
+        except:
+            return None
+        return [stat.st_mtime, stat.st_size]
+
+    def _parse_history_file(self, spath='')->list:
+        SNS_xml = self._get_history_xml_document_element(spath)
+        if not SNS_xml:
+            return []
+
+        snapshots = []
+        nodes = SNS_xml.childNodes()
+
+        for i in range(nodes.count()):
+            node = nodes.at(i)
+            el = node.toElement()
+
+            clients = {}
+            big_files = {}
+            client_nodes = node.childNodes()
+            for j in range(client_nodes.count()):
+                client_node = client_nodes.at(j)
+                client_el = client_node.toElement()
+
+                if client_el.tagName() == 'big_file':
+                    big_files[client_el.attribute('path')] = \
+                        client_el.attribute('hash')
+                    continue
+
+                client_id = client_el.attribute('client_id')
+
+                file_paths = clients.setdefault(client_id, [])
+                file_nodes = client_node.childNodes()
+                for k in range(file_nodes.count()):
+                    file_path = file_nodes.at(k).toElement().attribute('path')
+                    if file_path:
+                        file_paths.append(file_path)
+
+            snapshots.append({'ref': el.attribute('ref'),
+                              'name': el.attribute('name'),
+                              'rewind_snapshot': el.attribute('rewind_snapshot'),
+                              'session_name': el.attribute('session_name'),
+                              'clients': clients,
+                              'big_files': big_files})
+        return snapshots
+
+    def _write_history_index(self):
+        try:
+            with open(self._get_history_index_full_path(
+                    self._history_index['path']), 'w') as f:
+                json.dump({'stat': self._history_index['stat'],
+                           'snapshots': self._history_index['snapshots']}, f)
+        except:
+            # index will be rebuilt from history file
+            pass
+
+    def _get_history_index(self, spath='')->list:
+        ''' returns the snapshots of the history file as a list of dicts,
+        index is rebuilt only when history file changed. '''
+        if not spath:
+            spath = self.session.path
+
+        if not self._is_init(spath):
+            return []
+
+        stat = self._get_history_stat(spath)
+        if stat is None:
+            self._history_index = None
+            return []
+
+        index = self._history_index
+        if (index is not None and index['path'] == spath
+                and index['stat'] == stat):
+            return index['snapshots']
+
+        snapshots = None
+
+        try:
+            with open(self._get_history_index_full_path(spath), 'r') as f:
+                disk_index = json.load(f)
+            if (isinstance(disk_index, dict)
+                    and disk_index.get('stat') == stat
+                    and isinstance(disk_index.get('snapshots'), list)):
+                snapshots = disk_index['snapshots']
+        except:
+            pass
+
+        rewrite = bool(snapshots is None)
+        if snapshots is None:
+            snapshots = self._parse_history_file(spath)
+
+        self._history_index = {'path': spath, 'stat': stat,
+                               'snapshots': snapshots,
+                               'refs': {}}
+        for snapshot in snapshots:
+            self._history_index['refs'].setdefault(
+                snapshot['ref'], []).append(snapshot)
+
+        if rewrite:
+            self._write_history_index()
+
+        return snapshots
+
+    def _add_to_history_index(self, snapshot: dict):
+        # index must be up to date with previous history file
+        self._history_index['snapshots'].append(snapshot)
+        self._history_index['refs'].setdefault(
+            snapshot['ref'], []).append(snapshot)
+
+        stat = self._get_history_stat(self._steps_path)
+        if stat is None:
+            self._history_index = None
+            return
+
+        self._history_index['stat'] = stat
+        self._write_history_index()
+
     def _get_tag_date(self)->str:
         date_time = QDateTime.currentDateTimeUtc()
         date = date_time.date()
@@ -155,10 +542,28 @@ class Snapshoter(QObject):
         return tagdate
 
     def _write_history_file(self, date_str, snapshot_name='', rewind_snapshot=''):
-        if not self.session.path:
+        if not self._steps_path:
             return ray.Err.NO_SESSION_OPEN
 
-        file_path = self._get_history_full_path()
+        file_path = self._get_history_full_path(self._steps_path)
+
+        # be sure index matches the history file before it changes
+        self._get_history_index(self._steps_path)
+
+        # session may have been closed or renamed while git was running,
+        # its clients do not belong to this snapshot anymore
+        session_name = self.session.name
+        clients = self.session.clients + self.session.trashed_clients
+        if self._steps_path != self.session.path:
+            session_name = os.path.basename(self._steps_path)
+            clients = []
+
+        index_snapshot = {'ref': date_str,
+                          'name': snapshot_name,
+                          'rewind_snapshot': rewind_snapshot,
+                          'session_name': session_name,
+                          'clients': {},
+                          'big_files': dict(self._big_files_refs)}
 
         xml = QDomDocument()
 
@@ -179,23 +584,33 @@ class Snapshoter(QObject):
         snapshot_el.setAttribute('ref', date_str)
         snapshot_el.setAttribute('name', snapshot_name)
         snapshot_el.setAttribute('rewind_snapshot', rewind_snapshot)
-        snapshot_el.setAttribute('session_name', self.session.name)
+        snapshot_el.setAttribute('session_name', session_name)
         snapshot_el.setAttribute('VERSION', ray.VERSION)
 
-        for client in self.session.clients + self.session.trashed_clients:
+        for client in clients:
             client_el = xml.createElement('client')
             client.write_xml_properties(client_el)
             client_el.setAttribute('client_id', client.client_id)
+            index_files = index_snapshot['clients'].setdefault(
+                client.client_id, [])
 
             for client_file_path in client.get_project_files():
                 base_path = client_file_path.replace(
-                    "%s/" % self.session.path, '', 1)
+                    "%s/" % self._steps_path, '', 1)
+                if base_path:
+                    index_files.append(base_path)
                 file_xml = xml.createElement('file')
                 file_xml.setAttribute('path', base_path)
                 client_el.appendChild(file_xml)
 
             snapshot_el.appendChild(client_el)
 
+        for rel_path, obj_hash in sorted(self._big_files_refs.items()):
+            big_file_el = xml.createElement('big_file')
+            big_file_el.setAttribute('path', rel_path)
+            big_file_el.setAttribute('hash', obj_hash)
+            snapshot_el.appendChild(big_file_el)
+
         SNS_xml.appendChild(snapshot_el)
 
         try:
@@ -203,13 +618,17 @@ class Snapshoter(QObject):
             history_file.write(xml.toString())
             history_file.close()
         except:
+            self._history_index = None
             return ray.Err.CREATE_FAILED
 
+        if self._history_index is not None:
+            self._add_to_history_index(index_snapshot)
+
         return ray.Err.OK
 
     def _get_exclude_file_full_path(self)->str:
         return "%s/%s/%s" % (
-                        self.session.path, self._gitdir, self._exclude_path)
+                        self._steps_path, self._gitdir, self._exclude_path)
 
     def _write_exclude_file(self)->int:
         file_path = self._get_exclude_file_full_path()
@@ -276,163 +695,672 @@ class Snapshoter(QObject):
         contents += '\n'
         contents += "# Too big Files\n"
 
-        no_check_list = (self._gitdir)
-        # check too big files
-        for foldername, subfolders, filenames in os.walk(self.session.path):
-            subfolders[:] = [d for d in subfolders if d not in no_check_list]
+        self._too_big_files = self._find_too_big_files(
+            contents, session_ign_list)
+
+        for rel_path in self._too_big_files:
+            contents += "%s\n" % git_stringer(rel_path)
+
+        try:
+            exclude_file.write(contents)
+            exclude_file.close()
+        except:
+            return ray.Err.CREATE_FAILED
+
+        return ray.Err.OK
+
+    def _get_big_files_cache_full_path(self)->str:
+        return "%s/%s/%s" % (
+            self._steps_path, self._gitdir, self._big_files_cache_path)
+
+    def _get_gitignore_mtime(self)->float:
+        try:
+            return os.path.getmtime("%s/.gitignore" % self._steps_path)
+        except:
+            return 0.0
+
+    def _read_big_files_cache(self, rules: str):
+        ''' returns the too big files list found at previous snapshot,
+        or None if it can't be used with the current rules. '''
+        try:
+            with open(self._get_big_files_cache_full_path(), 'r') as f:
+                cache = json.load(f)
+        except:
+            return None
+
+        if (not isinstance(cache, dict)
+                or cache.get('max_file_size') != self._max_file_size
+                or cache.get('rules') != rules
+                or cache.get('gitignore_mtime') != self._get_gitignore_mtime()
+                or not isinstance(cache.get('files'), list)):
+            return None
+
+        return cache['files']
+
+    def _write_big_files_cache(self, rules: str, big_files: list):
+        try:
+            with open(self._get_big_files_cache_full_path(), 'w') as f:
+                json.dump({'max_file_size': self._max_file_size,
+                           'rules': rules,
+                           'gitignore_mtime': self._get_gitignore_mtime(),
+                           'files': big_files}, f)
+        except:
+            # no cache, next snapshot will walk the whole session
+            pass
 
-            if foldername == "%s/%s" % (self.session.path, self._gitdir):
+    def _is_too_big(self, rel_path: str, session_ign_list: tuple)->bool:
+        # file with extension globally ignored but
+        # unignored by its client will not be ignored
+        # and that is well as this.
+        if rel_path.endswith(session_ign_list):
+            return False
+
+        full_path = "%s/%s" % (self._steps_path, rel_path)
+        if os.path.islink(full_path):
+            return False
+
+        try:
+            file_size = os.path.getsize(full_path)
+        except:
+            return False
+
+        return bool(file_size > self._max_file_size*1024**2)
+
+    def _walk_too_big_files(self, session_ign_list: tuple)->set:
+        max_size = self._max_file_size*1024**2
+        big_files = set()
+        rel_dirs = ['']
+
+        while rel_dirs:
+            rel_dir = rel_dirs.pop()
+            if rel_dir:
+                full_dir = "%s/%s" % (self._steps_path, rel_dir)
+            else:
+                full_dir = self._steps_path
+
+            try:
+                with os.scandir(full_dir) as entries:
+                    for entry in entries:
+                        if rel_dir:
+                            rel_path = "%s/%s" % (rel_dir, entry.name)
+                        else:
+                            rel_path = entry.name
+
+                        if entry.is_symlink():
+                            continue
+
+                        if entry.is_dir():
+                            if rel_path != self._gitdir:
+                                rel_dirs.append(rel_path)
+                            continue
+
+                        if entry.name.endswith(session_ign_list):
+                            continue
+
+                        try:
+                            if entry.stat().st_size > max_size:
+                                big_files.add(rel_path)
+                        except:
+                            continue
+            except:
                 continue
 
-            for filename in filenames:
-                if filename.endswith(session_ign_list):
-                    if os.path.islink(filename):
-                        short_folder = foldername.replace(
-                                        self.session.path + '/', '', 1)
-                        line = git_stringer("%s/%s" % (short_folder, filename))
-                        contents += '!%s\n' % line
-                    # file with extension globally ignored but
-                    # unignored by its client will not be ignored
-                    # and that is well as this.
-                    continue
+        return big_files
 
-                if os.path.islink(filename):
-                    continue
+    def _find_too_big_files(self, rules: str, session_ign_list: tuple)->list:
+        ''' returns the sorted list of too big files paths.
+        Session is walked only when there is no usable result
+        from previous snapshot, else only previous too big files
+        and files git sees as changed are checked. '''
+        cached_files = self._read_big_files_cache(rules)
 
-                try:
-                    file_size = os.path.getsize(os.path.join(foldername,
-                                                             filename))
-                except:
-                    continue
+        if cached_files is None or self._changed_paths is None:
+            big_files = self._walk_too_big_files(session_ign_list)
+        else:
+            big_files = set()
+            for rel_path in set(cached_files) | self._changed_paths:
+                if self._is_too_big(rel_path, session_ign_list):
+                    big_files.add(rel_path)
+
+        big_files = sorted(big_files)
+        self._write_big_files_cache(rules, big_files)
 
-                if file_size > self._max_file_size*1024**2:
-                    if foldername == self.session.path:
-                        line = git_stringer(filename)
-                    else:
-                        short_folder = foldername.replace(
-                                        self.session.path + '/', '', 1)
-                        line = git_stringer("%s/%s" % (short_folder, filename))
+        if self._changed_paths is not None:
+            # too big files will not be added, don't count them
+            self._n_file_changed = len(self._changed_paths - set(big_files))
 
-                    contents += "%s\n" % line
+        return big_files
 
+    def _get_big_object_path(self, spath: str, obj_hash: str)->str:
+        return "%s/%s/%s/%s/%s" % (spath, self._gitdir, self._big_store_path,
+                                   obj_hash[:2], obj_hash)
+
+    def _read_big_store_cache(self, spath: str)->dict:
+        ''' returns known stats of session big files and stored objects,
+        'files' values are [size, mtime_ns, inode, hash],
+        'objects' values are [size, mtime_ns]. '''
         try:
-            exclude_file.write(contents)
-            exclude_file.close()
+            with open("%s/%s/%s" % (spath, self._gitdir,
+                                    self._big_store_cache_path), 'r') as f:
+                cache = json.load(f)
+            if (isinstance(cache.get('files'), dict)
+                    and isinstance(cache.get('objects'), dict)):
+                return cache
         except:
-            return ray.Err.CREATE_FAILED
+            pass
 
-        return ray.Err.OK
+        return {'files': {}, 'objects': {}}
 
-    def _is_init(self)->bool:
-        if not self.session.path:
+    def _write_big_store_cache(self, spath: str, cache: dict):
+        try:
+            with open("%s/%s/%s" % (spath, self._gitdir,
+                                    self._big_store_cache_path), 'w') as f:
+                json.dump(cache, f)
+        except:
+            # all big files will be hashed again at next snapshot
+            pass
+
+    @staticmethod
+    def _get_file_stat(full_path: str):
+        try:
+            stat = os.stat(full_path)
+        except:
+            return None
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+    def _is_big_object_valid(self, obj_path: str, cache: dict)->bool:
+        # an object modified or partially written
+        # has not the stat it had when stored
+        obj_stat = self._get_file_stat(obj_path)
+        record = cache['objects'].get(os.path.basename(obj_path))
+        return bool(obj_stat is not None and obj_stat[:2] == record)
+
+    def _is_big_copy_done(self, src: str, dest: str)->bool:
+        if dest in self._copy_failed:
+            return False
+
+        src_stat = self._get_file_stat(src)
+        dest_stat = self._get_file_stat(dest)
+        return bool(src_stat is not None and dest_stat is not None
+                    and src_stat[0] == dest_stat[0])
+
+    def _copy_big_files(self, copy_list: list):
+        ''' copies (src, dest) files without blocking, with a reflink
+        if possible. Stored objects never share their data with session
+        files, so a client writing its file in place can't alter them.
+        Files are copied to a temporary name and replace dest
+        only once complete, a failed copy keeps the previous dest.
+        Next step is run once copy is finished. '''
+        self._copy_temps = []
+        self._copy_failed = set()
+        engine_list = []
+
+        for src, dest in copy_list:
+            tmp_path = "%s/.%s.raytmp" % (os.path.dirname(dest),
+                                          os.path.basename(dest))
+            try:
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                if os.path.lexists(tmp_path):
+                    os.remove(tmp_path)
+            except:
+                self._copy_failed.add(dest)
+                continue
+
+            engine_list.append((src, tmp_path))
+            self._copy_temps.append((src, tmp_path, dest))
+
+        if not engine_list:
+            self._next_step()
+            return
+
+        self._copy_engine = CopyEngine(engine_list)
+        self._copy_engine.start()
+
+    def _copy_finished(self, engine: CopyEngine):
+        if engine is not self._copy_engine:
+            return
+
+        self._copy_engine = None
+
+        for src, tmp_path, dest in self._copy_temps:
+            try:
+                if (not engine.is_aborted()
+                        and self._is_big_copy_done(src, tmp_path)):
+                    os.replace(tmp_path, dest)
+                    continue
+            except:
+                pass
+
+            self._copy_failed.add(dest)
+            try:
+                if os.path.lexists(tmp_path):
+                    os.remove(tmp_path)
+            except:
+                pass
+
+        self._copy_temps = []
+        self._next_step()
+
+    def _is_init(self, spath='')->bool:
+        if not spath:
+            spath = self._steps_path
+
+        if not spath:
             return False
 
         return os.path.isfile("%s/%s/%s" % (
-                self.session.path, self._gitdir, self._exclude_path))
+                spath, self._gitdir, self._exclude_path))
 
-    def _can_save(self):
-        if not self.session.path:
+    def _get_user_identity(self)->tuple:
+        user_name = os.getenv('USER')
+        if not user_name:
+            user_name = 'someone'
+
+        machine_name = socket.gethostname()
+        if not machine_name:
+            machine_name = 'somewhere'
+
+        return (user_name, '%s@%s' % (user_name, machine_name))
+
+    def _has_head_commit(self)->bool:
+        gitdir = "%s/%s" % (self._steps_path, self._gitdir)
+
+        try:
+            with open("%s/HEAD" % gitdir, 'r') as f:
+                head = f.read().strip()
+        except:
             return False
 
-        if not self._is_init():
-            if not self._run_git_process('init'):
-                return False
+        if not head.startswith('ref: '):
+            # detached HEAD, after a snapshot load
+            return bool(head)
 
-            user_name = os.getenv('USER')
-            if not user_name:
-                user_name = 'someone'
+        ref = head.partition(' ')[2]
+        if os.path.isfile("%s/%s" % (gitdir, ref)):
+            return True
 
-            machine_name = socket.gethostname()
-            if not machine_name:
-                machine_name = 'somewhere'
+        try:
+            with open("%s/packed-refs" % gitdir, 'r') as f:
+                for line in f.readlines():
+                    if line.rstrip('\n').endswith(' %s' % ref):
+                        return True
+        except:
+            pass
 
-            if not self._run_git_process(
-                'config', 'user.email', '%s@%s' % (user_name, machine_name)):
-                return False
+        return False
 
-            user_name = os.getenv('USER')
-            if not user_name:
-                user_name = 'someone'
+    def _init_steps(self)->list:
+        user_name, user_email = self._get_user_identity()
 
-            if not self._run_git_process('config', 'user.name', user_name):
-                return False
+        return [(self._run_git, 'init'),
+                (self._run_git, 'config', 'user.email', user_email),
+                (self._run_git, 'config', 'user.name', user_name),
+                self._check_init]
 
-        if not self._is_init():
+    def _check_init(self):
+        if not self._is_init(self._steps_path):
+            Terminal.message("can't snapshot")
+            self._step_error(ray.Err.CREATE_FAILED)
+            return
+
+        self._next_step()
+
+    def _list_changes(self):
+        if self._saving:
+            self._phase('changes')
+
+        self._n_file_changed = 0
+        self._n_file_treated = 0
+        self._changed_paths = None
+        self._changes_duration = time.perf_counter()
+        self._output_mode = OUTPUT_CAPTURE
+        self._run_git(
+            'ls-files', '-z', '--exclude-standard', '--others', '--modified')
+
+    def _read_changes(self):
+        # a file can be listed twice, as modified and other
+        self._changed_paths = set()
+        for path in self._git_output.split(b'\0'):
+            if path and not path.startswith(self._gitdir.encode() + b'/'):
+                self._changed_paths.add(path.decode(errors='surrogateescape'))
+
+        self._git_output = b''
+        self._n_file_changed = len(self._changed_paths)
+        self._changes_counted = True
+        self._changes_duration = time.perf_counter() - self._changes_duration
+        self._next_step()
+
+    def _big_files_modified(self)->bool:
+        # stored big files are excluded, git can't see their changes
+        if not self.session.has_server_option(ray.Option.SNAPSHOT_BIG_FILES):
             return False
 
-        return True
+        files_cache = self._read_big_store_cache(self._steps_path)['files']
+        for rel_path, cached in files_cache.items():
+            if cached[:3] != self._get_file_stat(
+                    "%s/%s" % (self._steps_path, rel_path)):
+                return True
+        return False
+
+    def _changes_checked(self):
+        next_function, args = self._changes_next
+        self._changes_next = None
+        next_function(bool(self._n_file_changed
+                           or self._big_files_modified()), *args)
+
+    def _changes_check_error(self, err, info_str=''):
+        # changes not counted, the snapshot will try again
+        # and show the error.
+        next_function, args = self._changes_next
+        self._changes_next = None
+        next_function(True, *args)
+
+    def _save_start(self, name: str, rewind_snapshot: str):
+        self._next_snapshot_name = name
+        self._rw_snapshot = rewind_snapshot
+        self._snapshot_ref = ''
+        self._saving = True
+
+        # changes can have been listed just before
+        if self._changes_counted:
+            self._phase_times.append(('changes', self._changes_duration))
+        else:
+            self._steps.insert(0, self._read_changes)
+            self._steps.insert(0, self._list_changes)
 
-    def _error_quit(self, err):
-        if self._error_function:
-            self._error_function(err)
-        self._error_function = None
+        self._changes_counted = False
+        self._next_step()
 
-    def _save_step_1(self):
-        if self._adder_aborted:
-            if self._next_function:
-                self._next_function(aborted=True)
+    def _save_exclude(self):
+        # changes were listed with the previous exclude file,
+        # they are the only files checked for the new one.
+        self._phase('exclude')
+        err = self._write_exclude_file()
+        self._changed_paths = None
+        if err:
+            self._step_error(err)
             return
 
-        if self._n_file_changed:
-            if not self._run_git_process('commit', '-m', 'ray'):
-                return
+        self._next_step()
 
+    def _save_add(self):
+        if not self._n_file_changed:
+            self._next_step()
+            return
 
+        self._phase('add')
+        self._send_progress(PROGRESS_ADD_START)
+        self._output_mode = OUTPUT_PROGRESS
+        self._run_git('add', '-A', '-v')
 
-        if (self._n_file_changed
-                or self._next_snapshot_name or self._rw_snapshot):
-            ref = self._get_tag_date()
+    def _save_big_files(self):
+        self._big_files_refs = {}
+        self._big_files_changed = False
+
+        if not self.session.has_server_option(ray.Option.SNAPSHOT_BIG_FILES):
+            self._next_step()
+            return
+
+        self._phase('big files')
+        self._big_store_cache = self._read_big_store_cache(self._steps_path)
+        files_cache = self._big_store_cache['files']
+        self._big_files_to_hash = []
+
+        # only new or modified big files are read to get their hash
+        for rel_path in self._too_big_files:
+            file_stat = self._get_file_stat(
+                "%s/%s" % (self._steps_path, rel_path))
+            if file_stat is None:
+                continue
+
+            cached = files_cache.get(rel_path)
+            if cached and cached[:3] == file_stat:
+                self._big_files_refs[rel_path] = cached[3]
+            elif not '\n' in rel_path:
+                self._big_files_to_hash.append(rel_path)
+
+        self._steps.insert(0, self._save_big_files_store)
 
-            if not self._run_git_process('tag', '-a', ref, '-m', 'ray'):
+        if not self._big_files_to_hash:
+            self._next_step()
+            return
+
+        self._hash_big_files()
+
+    def _hash_big_files(self):
+        # git stops at the first file it can't read,
+        # hashes of previous files are given anyway.
+        self._output_mode = OUTPUT_CAPTURE
+        self._git_exit_code_allowed = True
+        self._run_git_with_input(
+            ''.join(["%s\n" % rel_path
+                     for rel_path in self._big_files_to_hash]).encode(
+                         errors='surrogateescape'),
+            'hash-object', '--no-filters', '--stdin-paths')
+
+    def _save_big_files_store(self):
+        obj_hashes = self._git_output.decode().split()
+        self._git_output = b''
+
+        for rel_path, obj_hash in zip(self._big_files_to_hash, obj_hashes):
+            self._big_files_refs[rel_path] = obj_hash
+
+        if (self._git_exit_code
+                and len(obj_hashes) < len(self._big_files_to_hash)):
+            # only the unreadable file is skipped, others are hashed again
+            Terminal.message("impossible to hash big file %s"
+                             % self._big_files_to_hash[len(obj_hashes)])
+            self._big_files_to_hash = \
+                self._big_files_to_hash[len(obj_hashes) + 1:]
+
+            if self._big_files_to_hash:
+                self._steps.insert(0, self._save_big_files_store)
+                self._hash_big_files()
                 return
 
-            err = self._write_history_file(ref, self._next_snapshot_name,
-                                    self._rw_snapshot)
-            if err:
-                if self._error_function:
-                    self._error_function(err)
+        self._big_files_to_hash = []
 
-            # not really a reply, not strong.
-            self.session.send_gui('/reply', '/ray/session/list_snapshots',
-                                full_ref_for_gui(ref, self._next_snapshot_name,
-                                            self._rw_snapshot))
-        self._error_function = None
-        self._next_snapshot_name = ''
-        self._rw_snapshot = ''
+        # identical files share the same object
+        to_store = {}
+        for rel_path, obj_hash in self._big_files_refs.items():
+            obj_path = self._get_big_object_path(self._steps_path, obj_hash)
+            if not self._is_big_object_valid(obj_path, self._big_store_cache):
+                to_store[obj_path] = "%s/%s" % (self._steps_path, rel_path)
 
-        if self._next_function:
-            self._next_function()
+        self._steps.insert(0, self._save_big_files_stored)
+        self._copy_big_files(
+            [(full_path, obj_path) for obj_path, full_path in to_store.items()])
 
-    def list(self, client_id=""):
-        SNS_xml = self._get_history_xml_document_element()
-        if not SNS_xml:
-            return []
+    def _save_big_files_stored(self):
+        cache = self._big_store_cache
+        files_cache = {}
 
-        nodes = SNS_xml.childNodes()
+        for rel_path, obj_hash in list(self._big_files_refs.items()):
+            full_path = "%s/%s" % (self._steps_path, rel_path)
+            obj_path = self._get_big_object_path(self._steps_path, obj_hash)
+
+            if not self._is_big_object_valid(obj_path, cache):
+                if not self._is_big_copy_done(full_path, obj_path):
+                    Terminal.message(
+                        "impossible to store big file %s" % rel_path)
+                    self._big_files_refs.pop(rel_path)
+                    continue
+
+                cache['objects'][obj_hash] = \
+                    self._get_file_stat(obj_path)[:2]
+
+            file_stat = self._get_file_stat(full_path)
+            if file_stat is not None:
+                files_cache[rel_path] = file_stat + [obj_hash]
+
+        # removed files are forgotten
+        cache['files'] = files_cache
+        self._write_big_store_cache(self._steps_path, cache)
+        self._big_store_cache = None
+
+        snapshots = self._get_history_index(self._steps_path)
+        last_big_files = snapshots[-1].get('big_files', {}) if snapshots else {}
+        self._big_files_changed = bool(self._big_files_refs != last_big_files)
+        self._next_step()
+
+    def _restore_big_files(self, spath: str, snapshot_ref: str,
+                           client_id=''):
+        ''' places stored big files of the snapshot at their paths.
+        with client_id, only files of this client are restored. '''
+        big_files = {}
+
+        if self._get_history_index(spath):
+            for snapshot in self._history_index['refs'].get(snapshot_ref, []):
+                client_paths = snapshot['clients'].get(client_id, [])
+                client_dirs = tuple(["%s/" % cp for cp in client_paths])
+
+                for rel_path, obj_hash in snapshot.get(
+                        'big_files', {}).items():
+                    if (client_id
+                            and not rel_path in client_paths
+                            and not rel_path.startswith(client_dirs)):
+                        continue
+                    big_files[rel_path] = obj_hash
+
+        if not big_files:
+            self._next_step()
+            return
+
+        cache = self._read_big_store_cache(spath)
+        not_restored = []
+        to_restore = []
+
+        for rel_path, obj_hash in big_files.items():
+            full_path = "%s/%s" % (spath, rel_path)
+            obj_path = self._get_big_object_path(spath, obj_hash)
+
+            if not self._is_big_object_valid(obj_path, cache):
+                not_restored.append(rel_path)
+                continue
+
+            cached = cache['files'].get(rel_path)
+            if (cached and cached[3] == obj_hash
+                    and cached[:3] == self._get_file_stat(full_path)):
+                continue
+
+            to_restore.append(rel_path)
+
+        self._steps.insert(0, (self._big_files_restored, spath, big_files,
+                               to_restore, not_restored))
+        self._copy_big_files(
+            [(self._get_big_object_path(spath, big_files[rel_path]),
+              "%s/%s" % (spath, rel_path)) for rel_path in to_restore])
+
+    def _big_files_restored(self, spath: str, big_files: dict,
+                            to_restore: list, not_restored: list):
+        cache = self._read_big_store_cache(spath)
+
+        for rel_path in to_restore:
+            full_path = "%s/%s" % (spath, rel_path)
+            obj_path = self._get_big_object_path(spath, big_files[rel_path])
+
+            if not self._is_big_copy_done(obj_path, full_path):
+                not_restored.append(rel_path)
+                continue
+
+            cache['files'][rel_path] = \
+                self._get_file_stat(full_path) + [big_files[rel_path]]
+
+        self._write_big_store_cache(spath, cache)
+
+        if not_restored:
+            Terminal.message("big files not restored: %s"
+                             % ', '.join(not_restored))
+            self.session.send_gui_message(
+                _translate('GUIMSG', 'big files not restored: %s')
+                    % ', '.join(not_restored))
+
+        self._next_step()
+
+    def _save_tree(self):
+        if not self._n_file_changed:
+            self._next_step()
+            return
+
+        self._phase('commit')
+        self._send_progress(PROGRESS_COMMIT)
+        self._output_mode = OUTPUT_CAPTURE
+        self._run_git('write-tree')
+
+    def _save_commit(self):
+        if not (self._n_file_changed or self._big_files_changed
+                or self._next_snapshot_name or self._rw_snapshot):
+            self._next_step()
+            return
+
+        self._snapshot_ref = self._get_tag_date()
+
+        if not self._n_file_changed:
+            self._phase('tag')
+            self._send_progress(PROGRESS_TAG)
+            self._run_git('tag', '-a', self._snapshot_ref, '-m', 'ray')
+            return
 
+        # commit and tag are written by one fast-import process
+        # from the tree of the index, contrary to 'git commit'
+        # it doesn't check again all files of the session.
+        tree = self._git_output.decode().strip()
+        self._git_output = b''
+
+        user_name, user_email = self._get_user_identity()
+        identity = "%s <%s> %i %s" % (user_name, user_email,
+                                      int(time.time()), time.strftime('%z'))
+
+        stream = "commit HEAD\n"
+        stream += "committer %s\n" % identity
+        stream += "data 3\nray\n"
+        if self._has_head_commit():
+            stream += "from HEAD^0\n"
+        stream += 'M 040000 %s ""\n\n' % tree
+        stream += "tag %s\n" % self._snapshot_ref
+        stream += "from HEAD\n"
+        stream += "tagger %s\n" % identity
+        stream += "data 3\nray\n"
+
+        self._send_progress(PROGRESS_TAG)
+        self._run_git_with_input(stream.encode(), 'fast-import', '--quiet')
+
+    def _save_history(self):
+        if not self._snapshot_ref:
+            self._next_step()
+            return
+
+        self._phase('history')
+        err = self._write_history_file(self._snapshot_ref,
+                                       self._next_snapshot_name,
+                                       self._rw_snapshot)
+        if err:
+            self._step_error(err)
+            return
+
+        # not a reply, GUIs have to know it is not in a listed page
+        self.session.send_gui('/ray/gui/session/snapshot_taken',
+                              full_ref_for_gui(self._snapshot_ref,
+                                               self._next_snapshot_name,
+                                               self._rw_snapshot))
+        self._send_progress(1.0)
+        self._next_step()
+
+    def list(self, client_id="", offset=0, count=0)->list:
+        ''' returns snapshots texts for GUI, newest first.
+        if count is set, only count snapshots from offset are returned. '''
         all_tags = []
-        all_snaps = []
+        rw_names = {}
         prv_session_name = self.session.name
 
-        for i in range(nodes.count()):
-            node = nodes.at(i)
-            el = node.toElement()
-
-            if client_id:
-                client_nodes = node.childNodes()
-                for j in range(client_nodes.count()):
-                    client_node = client_nodes.at(j)
-                    client_el = client_node.toElement()
-                    if client_el.attribute('client_id') == client_id:
-                        break
-                else:
-                    continue
+        for snapshot in self._get_history_index():
+            if client_id and client_id not in snapshot['clients']:
+                continue
 
-            ref = el.attribute('ref')
-            name = el.attribute('name')
-            rw_sn = el.attribute('rewind_snapshot')
-            rw_name = ""
-            session_name = el.attribute('session_name')
+            ref = snapshot['ref']
+            name = snapshot['name']
+            rw_sn = snapshot['rewind_snapshot']
+            session_name = snapshot['session_name']
 
             # don't list snapshot from client before session renamed
             if client_id and session_name != self.session.name:
@@ -457,137 +1385,287 @@ class Snapshoter(QObject):
             if not rw_sn.replace('_', '').isdigit():
                 rw_sn = ""
 
-            if rw_sn:
-                for snap in all_snaps:
-                    if snap[0] == rw_sn and not '\n' in snap[1]:
-                        rw_name = snap[1]
-                        break
+            rw_name = rw_names.get(rw_sn, '') if rw_sn else ''
 
-            all_snaps.append((ref, name))
-            snapsss = full_ref_for_gui(ref, name, rw_sn, rw_name, ss_name)
-            all_tags.append(snapsss)
+            # rewind references point to the first snapshot with this ref
+            rw_names.setdefault(ref, name)
+            all_tags.append(
+                full_ref_for_gui(ref, name, rw_sn, rw_name, ss_name))
 
         all_tags.reverse()
+
+        if count > 0:
+            return all_tags[offset:offset + count]
         return all_tags
 
-    def has_changes(self):
-        if not self.session.path:
-            return False
+    def _get_repo_stats_full_path(self, spath='')->str:
+        if not spath:
+            spath = self.session.path
 
-        if not self._is_init():
-            return True
+        return "%s/%s/%s" % (spath, self._gitdir, self._repo_stats_path)
 
-        if self._changes_checker.state():
-            self._changes_checker.kill()
+    def _read_repo_stats(self, spath='')->dict:
+        try:
+            with open(self._get_repo_stats_full_path(spath), 'r') as f:
+                stats = json.load(f)
+            if isinstance(stats, dict):
+                return stats
+        except:
+            pass
 
-        self._n_file_changed = 0
-        self._n_file_treated = 0
-        self._changes_counted = True
+        return {}
 
-        args = self._get_git_command_list(
-            'ls-files', '--exclude-standard', '--others', '--modified')
-        self._changes_checker.start(self._git_exec, args)
-        self._changes_checker.waitForFinished(2000)
+    def _write_repo_stats(self, stats: dict, spath=''):
+        try:
+            with open(self._get_repo_stats_full_path(spath), 'w') as f:
+                json.dump(stats, f)
+        except:
+            pass
 
-        return bool(self._n_file_changed)
+    def _record_snapshot_cost(self):
+        if not self._is_init(self._steps_path):
+            return
 
-    def save(self, name='', rewind_snapshot='',
-             next_function=None, error_function=None):
-        self._next_snapshot_name = name
-        self._rw_snapshot = rewind_snapshot
-        self._next_function = next_function
-        self._error_function = error_function
+        stats = self._read_repo_stats(self._steps_path)
+        snapshots = stats.get('snapshots')
+        if not isinstance(snapshots, list):
+            snapshots = stats['snapshots'] = []
+
+        snapshots.append([int(time.time()),
+                          round(sum(self.last_phase_times.values()), 3),
+                          self._n_file_changed])
+        del snapshots[:-STATS_SNAPSHOTS_MAX]
+        self._write_repo_stats(stats, self._steps_path)
+
+    @staticmethod
+    def _parse_count_objects(output: bytes)->dict:
+        repo = {}
+        for line in output.decode(errors='replace').splitlines():
+            key, colon, value = line.partition(':')
+            value = value.strip()
+            if colon and value.isdigit():
+                repo[key.strip().replace('-', '_')] = int(value)
+        return repo
+
+    def _maintenance_timeout(self):
+        if not self._is_init():
+            return
 
-        if not self._can_save():
-            Terminal.message("can't snapshot")
+        if self.session.steps_order or self.is_busy():
+            # wait for the session to be idle
+            self._maintenance_timer.start(MAINTENANCE_IDLE_DELAY)
             return
 
-        err = self._write_exclude_file()
-        if err:
-            self._error_quit(err)
+        if self._maintenance_steps:
             return
 
-        self._adder_aborted = False
+        self._maintenance_path = self.session.path
+        self._maintenance_task = ''
+        self._maintenance_steps = [self._maintenance_check]
+        self._run_maintenance_git('count-objects', '-v')
+
+    def _run_maintenance_git(self, *args):
+        self._maintenance_output = b''
+        git_args = self._get_git_command_list_at(self._maintenance_path,
+                                                 *args)
+        self._maintenance_process.setWorkingDirectory(self._maintenance_path)
+
+        if self._low_priority_prefix:
+            self._maintenance_process.start(
+                self._low_priority_prefix[0],
+                self._low_priority_prefix[1:] + [self._git_exec] + git_args)
+        else:
+            self._maintenance_process.start(self._git_exec, git_args)
 
-        if not self._changes_counted:
-            self.has_changes()
+    def _maintenance_standard_error(self):
+        Terminal.snapshoter_message(
+            self._maintenance_process.readAllStandardError().data(),
+            ' maintenance')
 
-        self._changes_counted = False
+    def _maintenance_process_finished(self, exit_code: int, exit_status: int):
+        if not self._maintenance_steps:
+            # maintenance has been stopped
+            return
 
-        if self._n_file_changed:
-            all_args = self._get_git_command_list('add', '-A', '-v')
-            self._adder_process.start(self._git_exec, all_args)
+        if exit_status or exit_code:
+            Terminal.message("snapshots maintenance failed")
+            self._maintenance_steps.clear()
+            return
+
+        self._maintenance_output = \
+            self._maintenance_process.readAllStandardOutput().data()
+        self._maintenance_steps.pop(0)()
+
+    def _maintenance_process_error(self, error: int):
+        if error == QProcess.FailedToStart:
+            self._maintenance_steps.clear()
+
+    def _maintenance_check(self):
+        repo = self._parse_count_objects(self._maintenance_output)
+
+        if (repo.get('count', 0) >= MAINTENANCE_LOOSE_OBJECTS
+                or repo.get('packs', 0) >= MAINTENANCE_PACKS):
+            # gc also writes the commit graph
+            self._maintenance_task = 'gc'
+            git_args = ('gc', '--quiet')
+        elif not os.path.exists("%s/%s/objects/info/commit-graph"
+                                % (self._maintenance_path, self._gitdir)):
+            self._maintenance_task = 'commit-graph'
+            git_args = ('commit-graph', 'write', '--reachable')
         else:
-            self._save_step_1()
+            self._maintenance_end()
+            return
 
-        # self.adder_process.finished is connected to self._save_step_1
+        self._maintenance_start = time.perf_counter()
+        self._maintenance_steps = [self._maintenance_count,
+                                   self._maintenance_end]
+        self._run_maintenance_git(*git_args)
 
-    def load(self, spath, snapshot, error_function):
-        self._error_function = error_function
+    def _maintenance_count(self):
+        self._maintenance_duration = \
+            time.perf_counter() - self._maintenance_start
+        self._run_maintenance_git('count-objects', '-v')
 
-        snapshot_ref = snapshot.partition('\n')[0].partition(':')[0]
+    def _maintenance_end(self):
+        self._maintenance_steps.clear()
 
-        if not self._run_git_process_at(spath, 'reset', '--hard'):
-            return False
+        stats = self._read_repo_stats(self._maintenance_path)
+        stats['repo'] = self._parse_count_objects(self._maintenance_output)
+        stats['repo_time'] = int(time.time())
 
-        if not self._run_git_process_at(spath, 'checkout', snapshot_ref):
-            return False
-        return True
+        if self._maintenance_task:
+            stats['maintenance'] = [int(time.time()),
+                                    round(self._maintenance_duration, 3),
+                                    self._maintenance_task]
+            Terminal.message("snapshots maintenance: %s %.3fs"
+                             % (self._maintenance_task,
+                                self._maintenance_duration))
 
-    def load_client_exclusive(self, client_id, snapshot, error_function):
-        self._error_function = error_function
+        self._write_repo_stats(stats, self._maintenance_path)
 
-        SNS_xml = self._get_history_xml_document_element()
-        if not SNS_xml:
-            self._error_function(ray.Err.NO_SUCH_FILE,
-                                self._get_history_full_path())
-            return False
+    def stop_maintenance(self):
+        self._maintenance_timer.stop()
+        if not self._maintenance_steps:
+            return
 
-        nodes = SNS_xml.childNodes()
+        self._maintenance_steps.clear()
+        if self._maintenance_process.state():
+            self._maintenance_process.terminate()
 
-        client_path_list = []
+    def get_stats(self)->list:
+        ''' returns rows of repository stats and snapshots costs.
+        repository stats are updated at idle time after a snapshot,
+        this request never starts a maintenance. '''
+        stats = self._read_repo_stats()
+        rows = []
 
-        for i in range(nodes.count()):
-            node = nodes.at(i)
-            el = node.toElement()
+        repo = stats.get('repo')
+        if isinstance(repo, dict):
+            rows.append(['repo_time', stats.get('repo_time', 0)])
+            for key, value in repo.items():
+                rows.append(['repo', key, value])
 
-            if el.attribute('ref') != snapshot:
-                continue
+        maintenance = stats.get('maintenance')
+        if isinstance(maintenance, list):
+            rows.append(['maintenance'] + maintenance)
 
-            client_nodes = node.childNodes()
+        for snapshot_cost in stats.get('snapshots', []):
+            rows.append(['snapshot'] + snapshot_cost)
 
-            for j in range(client_nodes.count()):
-                client_node = client_nodes.at(j)
-                client_el = client_node.toElement()
+        return rows
 
-                if client_el.attribute('client_id') != client_id:
-                    continue
+    def check_changes(self, next_function, *args):
+        ''' lists changes without blocking,
+        then calls next_function(has_changes, *args) '''
+        if not self.session.path:
+            next_function(False, *args)
+            return
 
-                file_nodes = client_node.childNodes()
+        if not self._is_init():
+            next_function(True, *args)
+            return
 
-                for k in range(file_nodes.count()):
-                    file_node = file_nodes.at(k)
-                    file_el = file_node.toElement()
-                    file_path = file_el.attribute('path')
-                    if file_path:
-                        client_path_list.append(file_path)
+        self._changes_next = (next_function, args)
+        self._start_steps(self.session.path,
+                          [self._list_changes, self._read_changes],
+                          self._changes_checked, self._changes_check_error)
 
-        if not self._run_git_process('reset', '--hard'):
-            return False
+    def is_busy(self)->bool:
+        return bool(self._steps or self._git_process.state())
 
-        if not self._run_git_process('checkout', snapshot, '--',
-                                  *client_path_list):
-            return False
-        return True
+    def save(self, name='', rewind_snapshot='',
+             next_function=None, error_function=None, low_priority=False):
+        ''' takes a snapshot without blocking, next_function is called
+        once done, with aborted=True if snapshot has been aborted.
+        With low_priority, git runs with idle I/O priority
+        and no progress is sent to GUIs. '''
+        if not self.session.path:
+            Terminal.message("can't snapshot")
+            return
+
+        if self.is_busy():
+            Terminal.message("snapshoter is busy, operation refused")
+            if error_function:
+                error_function(ray.Err.OPERATION_PENDING)
+            return
+
+        self._low_priority = low_priority
+
+        self._phase_times.clear()
+        self._phase_name = ''
+
+        steps = []
+        if not self._is_init():
+            steps += self._init_steps()
+            self._changes_counted = False
+
+        steps += [(self._save_start, name, rewind_snapshot),
+                  self._save_exclude, self._save_add, self._save_big_files,
+                  self._save_tree, self._save_commit, self._save_history]
+
+        self._start_steps(self.session.path, steps,
+                          next_function, error_function)
+
+    def load(self, spath, snapshot, next_function, error_function):
+        snapshot_ref = snapshot.partition('\n')[0].partition(':')[0]
+
+        self._start_steps(spath,
+                          [(self._run_git, 'checkout', '-f', snapshot_ref),
+                           (self._restore_big_files, spath, snapshot_ref)],
+                          next_function, error_function)
+
+    def load_client_exclusive(self, client_id, snapshot,
+                              next_function, error_function):
+        snapshots = self._get_history_index()
+        if not snapshots:
+            error_function(ray.Err.NO_SUCH_FILE,
+                           self._get_history_full_path())
+            return
+
+        client_path_list = []
+
+        for snapshot_dict in self._history_index['refs'].get(snapshot, []):
+            client_path_list += snapshot_dict['clients'].get(client_id, [])
+
+        self._start_steps(self.session.path,
+                          [(self._run_git, 'reset', '--hard'),
+                           (self._run_git, 'checkout', snapshot, '--',
+                            *client_path_list),
+                           (self._restore_big_files, self.session.path,
+                            snapshot, client_id)],
+                          next_function, error_function)
 
     def abort(self):
-        if not self._adder_process.state():
+        if not self._saving:
             return
 
         self.set_auto_snapshot(False)
 
-        self._adder_aborted = True
-        self._adder_process.terminate()
+        self._aborted = True
+        if self._git_process.state():
+            self._git_process.terminate()
+        if self._copy_engine is not None:
+            self._copy_engine.abort()
 
     def set_auto_snapshot(self, bool_snapshot):
         auto_snap_file = "%s/%s/prevent_auto_snapshot" % (self.session.path,
@@ -0,0 +1,183 @@
+
+import json
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait
+import xdg.BaseDirectory
+
+from daemon_tools import dirname
+
+instance = None
+
+
+def _stat_key(exec_path: str)->list:
+    try:
+        stat = os.stat(exec_path)
+    except:
+        return []
+    return [stat.st_ino, stat.st_mtime, stat.st_size]
+
+def _probe_nsm_bin(exec_path: str):
+    ''' search for '/nsm/server/announce' in executable binary,
+    returns None if binary can't be read '''
+    try:
+        result = subprocess.run(
+            ['grep', '-q', '/nsm/server/announce', exec_path],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except:
+        return None
+
+    if result.returncode > 1:
+        return None
+    return bool(result.returncode == 0)
+
+def _probe_version(exec_path: str):
+    ''' returns the program version found with --version,
+    or an empty string, or None if program could not be run or timed out '''
+    try:
+        # do not allow program --version to be longer than 500ms
+        result = subprocess.run(
+            [exec_path, '--version'], stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL,
+            timeout=0.500)
+    except:
+        return None
+
+    full_program_version = str(result.stdout, encoding='utf-8',
+                               errors='replace')
+
+    previous_is_digit = False
+    program_version = ''
+
+    for character in full_program_version:
+        if character.isdigit():
+            program_version += character
+            previous_is_digit = True
+        elif character == '.':
+            if previous_is_digit:
+                program_version += character
+            previous_is_digit = False
+        else:
+            if program_version:
+                break
+
+    return program_version.strip('.')
+
+
+class TemplateProbes:
+    ''' Cache of the expensive checks made on executables
+    for client templates (nsm binary grep, program version).
+    Results are kept with executable inode, mtime and size,
+    so a check is only done again if the binary changed.
+    Failed checks (timeout, unreadable binary) are not kept,
+    they are tried again at next listing.
+    Missing checks are executed in parallel with prefetch(). '''
+
+    def __init__(self):
+        self._cache_path = (xdg.BaseDirectory.xdg_cache_home
+                            + "/RaySession/template_probes.json")
+        self._execs = {}
+        self._modified = False
+        self._load_cache_file()
+
+    @staticmethod
+    def get_instance():
+        global instance
+
+        if instance is None:
+            instance = TemplateProbes()
+        return instance
+
+    def _load_cache_file(self):
+        if not os.path.isfile(self._cache_path):
+            return
+
+        try:
+            with open(self._cache_path, 'r') as f:
+                execs = json.load(f)
+        except:
+            # cache file load failed, probes will be done again
+            return
+
+        if isinstance(execs, dict):
+            self._execs = execs
+
+    def save_cache_file(self):
+        if not self._modified:
+            return
+
+        cache_dir = dirname(self._cache_path)
+        if not os.path.exists(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except:
+                return
+
+        try:
+            with open(self._cache_path, 'w') as f:
+                json.dump(self._execs, f)
+            self._modified = False
+        except:
+            pass
+
+    def _entry(self, exec_path: str)->dict:
+        stat_key = _stat_key(exec_path)
+        entry = self._execs.get(exec_path)
+
+        if entry is None or entry['stat'] != stat_key:
+            entry = {'stat': stat_key}
+            self._execs[exec_path] = entry
+            self._modified = True
+
+        return entry
+
+    def prefetch(self, nsm_bin_execs: set, version_execs: set):
+        ''' executes in parallel all needed probes not already cached.
+        arguments are sets of executable full paths. '''
+        jobs = []
+
+        for exec_path in nsm_bin_execs:
+            if 'nsm_bin' not in self._entry(exec_path):
+                jobs.append(('nsm_bin', exec_path, _probe_nsm_bin))
+
+        for exec_path in version_execs:
+            if 'version' not in self._entry(exec_path):
+                jobs.append(('version', exec_path, _probe_version))
+
+        if not jobs:
+            return
+
+        with ThreadPoolExecutor(
+                max_workers=min(len(jobs), os.cpu_count() or 1)) as executor:
+            futures = {}
+            for key, exec_path, probe in jobs:
+                futures[executor.submit(probe, exec_path)] = (key, exec_path)
+            wait(futures)
+
+        for future, (key, exec_path) in futures.items():
+            self._set_result(exec_path, key, future.result())
+
+    def _set_result(self, exec_path: str, key: str, result):
+        if result is None:
+            return
+
+        self._entry(exec_path)[key] = result
+        self._modified = True
+
+    def is_nsm_bin(self, exec_path: str)->bool:
+        entry = self._entry(exec_path)
+        if 'nsm_bin' in entry:
+            return entry['nsm_bin']
+
+        result = _probe_nsm_bin(exec_path)
+        self._set_result(exec_path, 'nsm_bin', result)
+        return bool(result)
+
+    def program_version(self, exec_path: str)->str:
+        entry = self._entry(exec_path)
+        if 'version' in entry:
+            return entry['version']
+
+        result = _probe_version(exec_path)
+        self._set_result(exec_path, 'version', result)
+        return result or ''
@@ -4,6 +4,7 @@ import liblo
 
 import ray
 from gui_tools import CommandLineArgs
+from osc_flow import ACK_REQUEST_PATH
 
 _instance = None
 
@@ -114,6 +115,12 @@ class GuiServerThread(liblo.ServerThread):
             ('/ray/gui/patchbay/port_removed', 's'),
             ('/ray/gui/patchbay/connection_added', 'ss'),
             ('/ray/gui/patchbay/connection_removed', 'ss'),
+            ('/ray/gui/patchbay/ports_added', None),
+            ('/ray/gui/patchbay/ports_removed', None),
+            ('/ray/gui/patchbay/ports_renamed', None),
+            ('/ray/gui/patchbay/connections_added', None),
+            ('/ray/gui/patchbay/connections_removed', None),
+            ('/ray/gui/patchbay/metadatas_updated', None),
             ('/ray/gui/patchbay/server_stopped', ''),
             ('/ray/gui/patchbay/update_group_position', ray.GroupPosition.sisi()),
             ('/ray/gui/patchbay/metadata_updated', 'hss'),
@@ -126,6 +133,11 @@ class GuiServerThread(liblo.ServerThread):
             ('/ray/gui/patchbay/server_lose', ''),
             ('/ray/gui/patchbay/fast_temp_file_memory', 's'),
             ('/ray/gui/patchbay/fast_temp_file_running', 's'),
+            ('/ray/gui/patchbay/graph_snapshot', 'si'),
+            ('/ray/gui/patchbay/graph_seq', 'i'),
+            ('/ray/gui/patchbay/graph_base_seq', 'i'),
+            ('/ray/gui/patchbay/graph_reset', ''),
+            ('/ray/gui/patchbay/ask_resync', ''),
             ('/ray/gui/patchbay/client_name_and_uuid', 'sh')):
                 self.add_method(path_types[0], path_types[1],
                                 self._generic_callback)
@@ -246,6 +258,10 @@ class GuiServerThread(liblo.ServerThread):
     def _session_auto_snapshot(self, path, args, types, src_addr):
         self.signaler.reply_auto_snapshot.emit(bool(args[0]))
 
+    @ray_method('/ray/gui/session/snapshot_taken', 's')
+    def _session_snapshot_taken(self, path, args, types, src_addr):
+        self.signaler.snapshot_taken.emit(*args)
+
     @ray_method('/ray/gui/session/sort_clients', None)
     def _session_sort_clients(self, path, args, types, src_addr):
         if not ray.types_are_all_strings(types):
@@ -255,6 +271,10 @@ class GuiServerThread(liblo.ServerThread):
     def _listed_session_details(self, path, args, types, src_addr):
         self.signaler.session_details.emit(*args)
 
+    @ray_method('/ray/gui/listed_session/removed', 's')
+    def _listed_session_removed(self, path, args, types, src_addr):
+        self.signaler.listed_session_removed.emit(*args)
+
     @ray_method('/ray/gui/listed_session/scripted_dir', 'si')
     def _listed_session_scripted_dir(self, path, args, types, src_addr):
         self.signaler.scripted_dir.emit(*args)
@@ -276,6 +296,13 @@ class GuiServerThread(liblo.ServerThread):
         self.signaler.client_progress.emit(*args)
         return True
 
+    @ray_method(ACK_REQUEST_PATH, 'i')
+    def _flow_ack_request(self, path, args, types, src_addr):
+        # acknowledge in the main thread,
+        # once all previous messages have been treated
+        self.signaler.flow_ack_request.emit(src_addr, args[0])
+        return False
+
     @ray_method('/ray/gui/patchbay/announce', 'iii')
     def _ray_gui_patchbay_announce(self, path, args, types, src_addr):
         self.patchbay_addr = src_addr
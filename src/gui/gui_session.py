@@ -11,6 +11,7 @@ from gui_client import Client, TrashedClient
 from gui_signaler import Signaler
 from gui_server_thread import GuiServerThread
 from gui_tools import CommandLineArgs, RS, error_text
+from osc_flow import ACK_PATH
 from main_window import MainWindow
 from nsm_child import NsmChild, NsmChildOutside
 from patchbay_manager import PatchbayManager
@@ -134,6 +135,7 @@ class SignaledSession(Session):
     def __init__(self):
         Session.__init__(self)
         self.signaler.osc_receive.connect(self._osc_receive)
+        self.signaler.flow_ack_request.connect(self._flow_ack_request)
         self.daemon_manager.start()
 
         self.canvas_groups = []
@@ -154,6 +156,11 @@ class SignaledSession(Session):
             function = self.__getattribute__(func_name)
             function(path, args)
 
+    def _flow_ack_request(self, src_addr, seq: int):
+        server = GuiServerThread.instance()
+        if server:
+            server.send(src_addr, ACK_PATH, seq)
+
     def _reply(self, path, args):
         if len(args) == 2:
             if args[0] == '/ray/session/add_executable':
@@ -462,6 +469,7 @@ class SignaledSession(Session):
 
     def _ray_gui_preview_session_size(self, path, args):
         self.preview_size = args[0]
+        self.signaler.session_preview_size.emit(args[0])
 
     def _ray_gui_script_info(self, path, args):
         text = args[0]
@@ -501,6 +509,30 @@ class SignaledSession(Session):
     def _ray_gui_patchbay_connection_removed(self, path, args):
         self.patchbay_manager.remove_connection(*args)
 
+    def _ray_gui_patchbay_ports_added(self, path, args):
+        self.patchbay_manager.apply_batch(
+            self.patchbay_manager.add_port, args, 4)
+
+    def _ray_gui_patchbay_ports_removed(self, path, args):
+        self.patchbay_manager.apply_batch(
+            self.patchbay_manager.remove_port, args, 1)
+
+    def _ray_gui_patchbay_ports_renamed(self, path, args):
+        self.patchbay_manager.apply_batch(
+            self.patchbay_manager.rename_port, args, 2)
+
+    def _ray_gui_patchbay_connections_added(self, path, args):
+        self.patchbay_manager.apply_batch(
+            self.patchbay_manager.add_connection, args, 2)
+
+    def _ray_gui_patchbay_connections_removed(self, path, args):
+        self.patchbay_manager.apply_batch(
+            self.patchbay_manager.remove_connection, args, 2)
+
+    def _ray_gui_patchbay_metadatas_updated(self, path, args):
+        self.patchbay_manager.apply_batch(
+            self.patchbay_manager.metadata_update, args, 3)
+
     def _ray_gui_patchbay_update_group_position(self, path, args):
         self.patchbay_manager.update_group_position(*args)
 
@@ -536,3 +568,18 @@ class SignaledSession(Session):
 
     def _ray_gui_patchbay_fast_temp_file_running(self, path, args):
         self.patchbay_manager.fast_temp_file_running(*args)
+
+    def _ray_gui_patchbay_graph_snapshot(self, path, args):
+        self.patchbay_manager.graph_snapshot(*args)
+
+    def _ray_gui_patchbay_graph_seq(self, path, args):
+        self.patchbay_manager.graph_seq_changed(*args)
+
+    def _ray_gui_patchbay_graph_base_seq(self, path, args):
+        self.patchbay_manager.graph_base_seq(*args)
+
+    def _ray_gui_patchbay_graph_reset(self, path, args):
+        self.patchbay_manager.graph_reset()
+
+    def _ray_gui_patchbay_ask_resync(self, path, args):
+        self.patchbay_manager.ask_resync()
@@ -4,6 +4,7 @@ from liblo import Address
 
 class Signaler(QObject):
     osc_receive = pyqtSignal(str, list)
+    flow_ack_request = pyqtSignal(object, int)
     daemon_announce = pyqtSignal(Address, str, int, int, str, int)
     daemon_announce_ok = pyqtSignal()
     daemon_nsm_locked = pyqtSignal(bool)
@@ -15,6 +16,7 @@ class Signaler(QObject):
     user_client_template_found = pyqtSignal(list)
     factory_client_template_found = pyqtSignal(list)
     snapshots_found = pyqtSignal(list)
+    snapshot_taken = pyqtSignal(str)
     reply_auto_snapshot = pyqtSignal(bool)
     server_progress = pyqtSignal(float)
     client_progress = pyqtSignal(str, float)
@@ -30,7 +32,9 @@ class Signaler(QObject):
     root_changed = pyqtSignal(str)
 
     session_preview_update = pyqtSignal()
+    session_preview_size = pyqtSignal(object)
     session_details = pyqtSignal(str, int, int, int)
+    listed_session_removed = pyqtSignal(str)
     scripted_dir = pyqtSignal(str, int)
     parrallel_copy_state = pyqtSignal(int, int)
     parrallel_copy_progress = pyqtSignal(int, float)
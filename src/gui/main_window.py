@@ -196,6 +196,12 @@ class MainWindow(QMainWindow):
             self._desktops_memory_toggled)
         self.ui.actionAutoSnapshot.triggered.connect(
             self._auto_snapshot_toggled)
+        self.ui.actionSnapshotBigFiles.triggered.connect(
+            self._snapshot_big_files_toggled)
+        self.ui.actionHardlinkReadOnly.triggered.connect(
+            self._hardlink_read_only_toggled)
+        self.ui.actionSkipCleanClients.triggered.connect(
+            self._skip_clean_clients_toggled)
         self.ui.actionSessionScripts.triggered.connect(
             self._session_scripts_toggled)
         self.ui.actionRememberOptionalGuiStates.triggered.connect(
@@ -235,6 +241,9 @@ class MainWindow(QMainWindow):
         self._control_menu.addSeparator()
         self._control_menu.addAction(self.ui.actionBookmarkSessionFolder)
         self._control_menu.addAction(self.ui.actionAutoSnapshot)
+        self._control_menu.addAction(self.ui.actionSnapshotBigFiles)
+        self._control_menu.addAction(self.ui.actionHardlinkReadOnly)
+        self._control_menu.addAction(self.ui.actionSkipCleanClients)
         self._control_menu.addAction(self.ui.actionDesktopsMemory)
         self._control_menu.addAction(self.ui.actionSessionScripts)
         self._control_menu.addAction(self.ui.actionRememberOptionalGuiStates)
@@ -560,6 +569,15 @@ class MainWindow(QMainWindow):
     def _auto_snapshot_toggled(self, state):
         self._set_option(ray.Option.SNAPSHOTS, state)
 
+    def _snapshot_big_files_toggled(self, state):
+        self._set_option(ray.Option.SNAPSHOT_BIG_FILES, state)
+
+    def _hardlink_read_only_toggled(self, state):
+        self._set_option(ray.Option.HARDLINK_READ_ONLY, state)
+
+    def _skip_clean_clients_toggled(self, state):
+        self._set_option(ray.Option.SKIP_CLEAN_SAVE, state)
+
     def _session_scripts_toggled(self, state):
         self._set_option(ray.Option.SESSION_SCRIPTS, state)
 
@@ -1244,6 +1262,12 @@ class MainWindow(QMainWindow):
             bool(options & ray.Option.DESKTOPS_MEMORY))
         self.ui.actionAutoSnapshot.setChecked(
             bool(options & ray.Option.SNAPSHOTS))
+        self.ui.actionSnapshotBigFiles.setChecked(
+            bool(options & ray.Option.SNAPSHOT_BIG_FILES))
+        self.ui.actionHardlinkReadOnly.setChecked(
+            bool(options & ray.Option.HARDLINK_READ_ONLY))
+        self.ui.actionSkipCleanClients.setChecked(
+            bool(options & ray.Option.SKIP_CLEAN_SAVE))
         self.ui.actionSessionScripts.setChecked(
             bool(options & ray.Option.SESSION_SCRIPTS))
         self.ui.actionRememberOptionalGuiStates.setChecked(
@@ -1257,11 +1281,14 @@ class MainWindow(QMainWindow):
 
         has_git = bool(options & ray.Option.HAS_GIT)
         self.ui.actionAutoSnapshot.setEnabled(has_git)
+        self.ui.actionSnapshotBigFiles.setEnabled(has_git)
         self.ui.actionReturnToAPreviousState.setVisible(has_git)
         self.ui.toolButtonSnapshots.setVisible(has_git)
         if has_git:
             self.ui.actionAutoSnapshot.setText(
                 _translate('actions', 'Auto Snapshot at Save'))
+            self.ui.actionSnapshotBigFiles.setText(
+                _translate('actions', 'Keep Big Files In Snapshots'))
 
         self.has_git = has_git
 
@@ -321,8 +321,12 @@ class OpenSessionDialog(ChildDialog):
         self.signaler.root_changed.connect(self._root_changed)
         self.signaler.session_preview_update.connect(
             self._session_preview_update)
+        self.signaler.session_preview_size.connect(
+            self._session_preview_size)
         self.signaler.session_details.connect(
             self._update_session_details)
+        self.signaler.listed_session_removed.connect(
+            self._listed_session_removed)
         self.signaler.scripted_dir.connect(
             self._scripted_dir)
         self.signaler.parrallel_copy_state.connect(
@@ -902,6 +906,18 @@ class OpenSessionDialog(ChildDialog):
                     COLUMN_NAME, Qt.UserRole)):
             self.accept()
 
+    def _session_preview_size(self, session_size: int):
+        # session size can be corrected by the daemon after preview
+        locale = QLocale()
+        self.ui.labelSessionSize.setText(
+            locale.formattedDataSize(session_size))
+
+        item = self.ui.sessionList.currentItem()
+        if item is not None:
+            item.setData(COLUMN_NAME, DATA_SIZE, session_size)
+
+        self._update_session_menu()
+
     def _session_preview_update(self):
         self.ui.plainTextEditNotes.setPlainText(self.session.preview_notes)
 
@@ -979,6 +995,17 @@ class OpenSessionDialog(ChildDialog):
 
     def _update_session_details(self, session_name:str,
                                 has_notes:int, modified:int, locked:int):
+        for folder in self.folders:
+            if folder.find_item_with(session_name) is not None:
+                break
+        else:
+            if self._listing_sessions:
+                # session will come with the listing
+                return
+
+            # session created since the listing
+            self._add_listed_session(session_name)
+
         for i in range(self.ui.sessionList.topLevelItemCount()):
             item = self.ui.sessionList.topLevelItem(i)
             session_item = item.find_item_with(session_name)
@@ -994,6 +1021,84 @@ class OpenSessionDialog(ChildDialog):
                 session_item.set_locked(bool(locked))
                 break
 
+    def _add_listed_session(self, session_name: str):
+        ''' adds only one session to the list,
+        items of other sessions are kept with their details. '''
+        folder_div = session_name.split('/')
+        folders = self.folders
+        parent = None
+
+        for i in range(len(folder_div)):
+            for folder in folders:
+                if folder.name == folder_div[i]:
+                    parent = folder
+                    folders = folder.subfolders
+                    break
+            else:
+                break
+        else:
+            # folder was already listed, it is now a session
+            parent.is_session = True
+            if parent.item is not None:
+                parent.item.is_session = True
+                parent.item.setFlags(parent.item.flags() | Qt.ItemIsSelectable)
+            return
+
+        first_folder = None
+
+        for j in range(i, len(folder_div)):
+            new_folder = SessionFolder(folder_div[j])
+            new_folder.set_path('/'.join(folder_div[:j+1]))
+            new_folder.is_session = bool(j + 1 == len(folder_div))
+            folders.append(new_folder)
+            folders = new_folder.subfolders
+
+            if first_folder is None:
+                first_folder = new_folder
+
+        item = first_folder.make_item()
+
+        if parent is None or parent.item is None:
+            self.ui.sessionList.addTopLevelItem(item)
+        else:
+            parent.item.addChild(item)
+            parent.item.setIcon(COLUMN_NAME, QIcon.fromTheme('folder'))
+
+        item.show_conditionnaly(self.ui.filterBar.displayText())
+        self.ui.sessionList.sortByColumn(COLUMN_NAME, Qt.AscendingOrder)
+
+    def _listed_session_removed(self, session_name: str):
+        folders = self.folders
+        folder_chain = []
+
+        for name in session_name.split('/'):
+            for folder in folders:
+                if folder.name == name:
+                    folder_chain.append((folders, folder))
+                    folders = folder.subfolders
+                    break
+            else:
+                return
+
+        folder_chain[-1][1].is_session = False
+
+        # remove the session, then its parent folders left empty
+        for folders, folder in reversed(folder_chain):
+            if folder.is_session or folder.subfolders:
+                break
+
+            folders.remove(folder)
+
+            if folder.item is None:
+                continue
+
+            parent_item = folder.item.parent()
+            if parent_item is None:
+                self.ui.sessionList.takeTopLevelItem(
+                    self.ui.sessionList.indexOfTopLevelItem(folder.item))
+            else:
+                parent_item.removeChild(folder.item)
+
     def _scripted_dir(self, dir_name, script_flags):
         if dir_name == '':
             # means that all the session root directory is scripted
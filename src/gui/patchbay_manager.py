@@ -8,6 +8,7 @@ from PyQt5.QtWidgets import QMenu, QAction, QLabel, QMessageBox
 from PyQt5.QtCore import pyqtSlot, QTimer, QPoint
 
 import ray
+import patchbay_snapshot
 
 from gui_tools import RS
 
@@ -43,6 +44,10 @@ GROUP_WRAPPED_INPUT = 0x10
 GROUP_WRAPPED_OUTPUT = 0x20
 GROUP_HAS_BEEN_SPLITTED = 0x40
 
+# resync is asked again after this delay (ms)
+# while no event follows the ones we know
+RESYNC_RETRY_DELAY = 2000
+
 # Portgroup Origin
 PORTGROUP_FROM_DETECTION = 0
 PORTGROUP_FROM_METADATA = 1
@@ -1266,6 +1271,15 @@ class PatchbayManager:
         self._wait_join_group_ids = []
         self.join_animation_connected = False
 
+        # seq of the last graph events applied (or in the graph snapshot),
+        # events with a lower or equal seq are ignored.
+        self._graph_seq = 0
+        self._skip_graph_events = False
+        self._resync_timer = QTimer()
+        self._resync_timer.setInterval(RESYNC_RETRY_DELAY)
+        self._resync_timer.setSingleShot(True)
+        self._resync_timer.timeout.connect(self.ask_resync)
+
     def finish_init(self):
         self.canvas_menu = CanvasMenu(self)
         self.options_dialog = canvas_options.CanvasOptionsDialog(
@@ -1704,6 +1718,9 @@ class PatchbayManager:
                 break
 
     def add_port(self, name: str, port_type: int, flags: int, uuid: int):
+        if self._skip_graph_events:
+            return
+
         port = Port(self._next_port_id, name, port_type, flags, uuid)
         self._next_port_id += 1
 
@@ -1782,6 +1799,9 @@ class PatchbayManager:
         group.check_for_display_name_on_last_port()
 
     def remove_port(self, name: str):
+        if self._skip_graph_events:
+            return
+
         port = self.get_port_from_name(name)
         if port is None:
             return
@@ -1805,6 +1825,9 @@ class PatchbayManager:
                 break
 
     def rename_port(self, name: str, new_name: str):
+        if self._skip_graph_events:
+            return
+
         port = self.get_port_from_name(name)
         if port is None:
             sys.stderr.write(
@@ -1868,6 +1891,9 @@ class PatchbayManager:
                 break
 
     def metadata_update(self, uuid: int, key: str, value: str):
+        if self._skip_graph_events:
+            return
+
         if key == JACK_METADATA_ORDER:
             port = self.get_port_from_uuid(uuid)
             if port is None:
@@ -1918,6 +1944,9 @@ class PatchbayManager:
                     group.set_client_icon(value)
 
     def add_connection(self, port_out_name: str, port_in_name: str):
+        if self._skip_graph_events:
+            return
+
         port_out = self.get_port_from_name(port_out_name)
         port_in = self.get_port_from_name(port_in_name)
 
@@ -1936,6 +1965,9 @@ class PatchbayManager:
             connection.add_to_canvas()
 
     def remove_connection(self, port_out_name: str, port_in_name: str):
+        if self._skip_graph_events:
+            return
+
         port_out = self.get_port_from_name(port_out_name)
         port_in = self.get_port_from_name(port_in_name)
 
@@ -1976,6 +2008,7 @@ class PatchbayManager:
                 break
 
     def disannounce(self):
+        self._resync_timer.stop()
         self.send_to_patchbay_daemon('/ray/patchbay/gui_disannounce')
         self.clear_all()
 
@@ -2088,6 +2121,95 @@ class PatchbayManager:
     def sample_rate_changed(self, samplerate):
         self.tools_widget.set_samplerate(samplerate)
 
+    def apply_batch(self, method, args: list, n_args: int):
+        ''' calls method for each group of n_args in args,
+            in optimized operation touched groups are redrawn only once
+            at the end. '''
+        if self._skip_graph_events:
+            return
+
+        if self.optimized_operation:
+            # already in a big operation, redraw will be done at its end
+            for i in range(0, len(args), n_args):
+                method(*args[i:i+n_args])
+            return
+
+        # as in fast_temp_file_running, if there is no group position
+        # it is prefferable to know where finish the group boxes
+        # before to add another one.
+        # Without optimized operation, each event has already
+        # updated the canvas, there is nothing to redraw.
+        if not self.group_positions:
+            for i in range(0, len(args), n_args):
+                method(*args[i:i+n_args])
+            return
+
+        # groups of removed ports are known only before,
+        # groups of added ports only after.
+        group_ids = self._batch_group_ids(method, args, n_args)
+
+        self.optimize_operation(True)
+
+        for i in range(0, len(args), n_args):
+            method(*args[i:i+n_args])
+
+        after_group_ids = self._batch_group_ids(method, args, n_args)
+        if group_ids is not None and after_group_ids is not None:
+            group_ids |= after_group_ids
+        else:
+            group_ids = None
+
+        if method == self.metadata_update:
+            # ports order and portgroups have not been updated
+            # during optimized operation
+            for group in self.groups:
+                if group_ids is None or group.group_id in group_ids:
+                    group.sort_ports_in_canvas()
+
+        self.optimize_operation(False)
+
+        if group_ids is None:
+            patchcanvas.redrawAllGroups()
+            return
+
+        # removed groups are not in canvas anymore,
+        # scene is updated once for all groups
+        patchcanvas.redrawGroups(group_ids)
+
+    def _batch_group_ids(self, method, args: list, n_args: int):
+        ''' returns the set of ids of the groups owning the known ports
+            of a batch, or None if a metadata is not on a known port
+            (it can be on a client). '''
+        if method == self.metadata_update:
+            uuid_groups = {}
+            for group in self.groups:
+                for port in group.ports:
+                    uuid_groups[port.uuid] = group.group_id
+
+            group_ids = set()
+            for i in range(0, len(args), n_args):
+                group_id = uuid_groups.get(args[i])
+                if group_id is None:
+                    return None
+                group_ids.add(group_id)
+            return group_ids
+
+        name_groups = {}
+        for group in self.groups:
+            for port in group.ports:
+                name_groups[port.full_name] = group.group_id
+
+        # other events start with one or two port names
+        n_names = 1 if method in (self.add_port, self.remove_port) else 2
+
+        group_ids = set()
+        for i in range(0, len(args), n_args):
+            for port_name in args[i:i+n_names]:
+                group_id = name_groups.get(port_name)
+                if group_id is not None:
+                    group_ids.add(group_id)
+        return group_ids
+
     def receive_big_packets(self, state: int):
         self.optimize_operation(not bool(state))
         if state:
@@ -2128,6 +2250,72 @@ class PatchbayManager:
                 % temp_path)
             return
 
+        self._load_graph(
+            [(p.get('name'), p.get('type'), p.get('flags'), p.get('uuid'))
+             for p in patchbay_data.get('ports', [])],
+            [(c.get('port_out_name'), c.get('port_in_name'))
+             for c in patchbay_data.get('connections', [])],
+            [(m.get('uuid'), m.get('key'), m.get('value'))
+             for m in patchbay_data.get('metadatas', [])],
+            [(cnu.get('name'), cnu.get('uuid'))
+             for cnu in patchbay_data.get('clients', [])])
+
+        os.remove(temp_path)
+
+    def graph_snapshot(self, snapshot_path: str, seq: int):
+        ''' receives the binary graph snapshot path from the patchbay daemon,
+            shared by all local GUIs, it must not be removed. '''
+        graph = patchbay_snapshot.read_snapshot(snapshot_path)
+        if not graph:
+            sys.stderr.write(
+                "RaySession::Failed to read graph snapshot %s\n"
+                % snapshot_path)
+            return
+
+        self._load_graph(graph['ports'], graph['connections'],
+                         graph['metadatas'], graph['clients'])
+
+        # snapshot may have been rewritten after it has been sent to us,
+        # then it already contains the next events.
+        self.graph_base_seq(max(seq, graph['seq']))
+
+    def graph_base_seq(self, seq: int):
+        # all the graph has been sent at seq
+        self._graph_seq = seq
+        self._skip_graph_events = False
+        self._resync_timer.stop()
+
+    def graph_seq_changed(self, seq: int):
+        if seq <= self._graph_seq:
+            # following events are already applied or in the graph snapshot
+            self._skip_graph_events = True
+
+        elif seq == self._graph_seq + 1:
+            self._graph_seq = seq
+            self._skip_graph_events = False
+            self._resync_timer.stop()
+
+        else:
+            # some events have been lost, patchbay daemon will send
+            # again all events since the last we know.
+            # If the resync is lost too, it is asked again later.
+            self._skip_graph_events = True
+            if not self._resync_timer.isActive():
+                self.ask_resync()
+
+    def ask_resync(self):
+        self.send_to_patchbay_daemon('/ray/patchbay/resync', self._graph_seq)
+        self._resync_timer.start()
+
+    def graph_reset(self):
+        # patchbay daemon can not resync us, all the graph will follow
+        self.clear_all()
+        self.graph_base_seq(0)
+
+    def _load_graph(self, ports: list, connections: list,
+                    metadatas: list, clients: list):
+        self._skip_graph_events = False
+
         # optimize_operation allow to not redraw group at each port added.
         # however, if there is no group position
         # (i.e. if there is no config at all), it is prefferable to
@@ -2136,32 +2324,23 @@ class PatchbayManager:
         if self.group_positions:
             self.optimize_operation(True)
 
-        for key in patchbay_data.keys():
-            if key == 'ports':
-                for p in patchbay_data[key]:
-                    self.add_port(p.get('name'), p.get('type'),
-                                  p.get('flags'), p.get('uuid'))
+        for name, port_type, flags, uuid in ports:
+            self.add_port(name, port_type, flags, uuid)
 
-            elif key == 'clients':
-                for cnu in patchbay_data[key]:
-                    self.client_name_and_uuid(cnu.get('name'), cnu.get('uuid'))
+        for client_name, uuid in clients:
+            self.client_name_and_uuid(client_name, uuid)
 
-            elif key == 'connections':
-                for c in patchbay_data[key]:
-                    self.add_connection(c.get('port_out_name'),
-                                        c.get('port_in_name'))
+        for port_out_name, port_in_name in connections:
+            self.add_connection(port_out_name, port_in_name)
 
-            elif key == 'metadatas':
-                for m in patchbay_data[key]:
-                    self.metadata_update(
-                        m.get('uuid'), m.get('key'), m.get('value'))
+        for uuid, key, value in metadatas:
+            self.metadata_update(uuid, key, value)
 
         for group in self.groups:
             group.sort_ports_in_canvas()
 
         self.optimize_operation(False)
         patchcanvas.redrawAllGroups()
-        os.remove(temp_path)
 
     def patchbay_announce(self, jack_running: int, samplerate: int,
                           buffer_size: int):
@@ -0,0 +1 @@
+../shared/patchbay_snapshot.py
\ No newline at end of file
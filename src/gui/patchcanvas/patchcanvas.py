@@ -733,12 +733,17 @@ def redrawAllGroups():
     QTimer.singleShot(0, canvas.scene.update)
 
 def redrawGroup(group_id: int):
+    redrawGroups((group_id,))
+
+def redrawGroups(group_ids):
     for group in canvas.group_list:
-        if group.group_id == group_id:
+        if group.group_id in group_ids:
             for box in group.widgets:
                 if box is not None:
                     box.updatePositions()
-            break
+
+    if canvas.scene is None:
+        return
 
     QTimer.singleShot(0, canvas.scene.update)
 
@@ -14,6 +14,8 @@ GROUP_MONTH = 2
 GROUP_YEAR = 3
 GROUP_MAIN = 4
 
+SNAPSHOTS_PAGE_SIZE = 100
+
 class Snapshot:
     valid = False
     text = ''
@@ -65,6 +67,7 @@ class Snapshot:
             rw_date_time = utc_rw_date_time.toLocalTime()
 
         snapshot = Snapshot(date_time)
+        snapshot.ref = time_str
         snapshot.text = snaptext
         snapshot.label = label
         snapshot.rewind_date_time = rw_date_time
@@ -286,6 +289,14 @@ class SnapGroup(Snapshot):
         snap_group.add(new_snapshot)
         self.add_group(snap_group)
 
+    def contains_any(self, snapshots: set)->bool:
+        for snapshot in self.snapshots:
+            if snapshot in snapshots:
+                return True
+            if snapshot.sub_type and snapshot.contains_any(snapshots):
+                return True
+        return False
+
     def add_group(self, snap_group):
         to_rem = []
 
@@ -380,6 +391,10 @@ class SnapshotsDialog(ChildDialog):
 
         self.snapshots = []
         self.main_snap_group = SnapGroup()
+        self._snapshot_refs = set()
+
+        # top level items of the list, by id of their snapshot or group
+        self._top_items = {}
 
         self.ui.snapshotsList.setHeaderHidden(True)
         self.ui.snapshotsList.currentItemChanged.connect(
@@ -387,33 +402,119 @@ class SnapshotsDialog(ChildDialog):
 
         self.ui.buttonBox.button(QDialogButtonBox.Ok).setEnabled(False)
 
+        # snapshots are asked page by page, next page is asked
+        # when user scrolls near the end of the list
+        self._list_path = ''
+        self._list_args = []
+        self._page_offset = 0
+        self._page_received = 0
+        self._page_waiting = False
+        self._list_finished = False
+
+        self.ui.snapshotsList.verticalScrollBar().valueChanged.connect(
+            self._scroll_value_changed)
+
+    def _ask_snapshots(self, path: str, *args):
+        self._list_path = path
+        self._list_args = args
+        self._ask_next_page()
+
+    def _ask_next_page(self):
+        if self._list_finished or self._page_waiting:
+            return
+
+        self._page_waiting = True
+        self._page_received = 0
+        self.to_daemon(self._list_path, *self._list_args,
+                       self._page_offset, SNAPSHOTS_PAGE_SIZE)
+
+    def _needs_next_page(self)->bool:
+        scrollbar = self.ui.snapshotsList.verticalScrollBar()
+        return bool(scrollbar.maximum() - scrollbar.value()
+                    <= scrollbar.pageStep())
+
+    def _scroll_value_changed(self, value: int):
+        if self._needs_next_page():
+            self._ask_next_page()
+
     def _current_item_changed(self, current, previous):
         self.ui.buttonBox.button(QDialogButtonBox.Ok).setEnabled(
            bool(current and current.data(0, Qt.UserRole)))
 
     def _add_snapshots(self, snaptexts):
-        if not snaptexts and not self.main_snap_group.snapshots:
-            # Snapshot list finished without any snapshot
-            self._no_snapshot_found()
+        if not snaptexts:
+            # page finished
+            self._page_waiting = False
+            self._page_offset += self._page_received
+            if self._page_received < SNAPSHOTS_PAGE_SIZE:
+                self._list_finished = True
+
+            if not self.main_snap_group.snapshots:
+                # Snapshot list finished without any snapshot
+                self._no_snapshot_found()
+            elif self._needs_next_page():
+                self._ask_next_page()
             return
 
+        self._page_received += len(snaptexts)
+        self._insert_snapshots(snaptexts)
+
+    def _snapshot_taken(self, snaptext: str):
+        # the new snapshot is the first of the daemon list,
+        # it shifts the next pages, unless the waited page
+        # has been listed after it (no reply received yet).
+        if not (self._page_waiting and not self._page_received):
+            self._page_offset += 1
+
+        self._insert_snapshots([snaptext])
+
+    def _insert_snapshots(self, snaptexts: list):
+        new_snapshots = set()
+
         for snaptext in snaptexts:
             if not snaptext:
                 continue
 
+            # a snapshot can be in a page and have been taken meanwhile
             snapshot = Snapshot.new_from_snaptext(snaptext)
-            self.main_snap_group.add(snapshot)
+            if snapshot.ref in self._snapshot_refs:
+                continue
 
-        self.main_snap_group.sort()
+            self._snapshot_refs.add(snapshot.ref)
+            self.main_snap_group.add(snapshot)
+            new_snapshots.add(snapshot)
 
-        self.ui.snapshotsList.clear()
+        if not new_snapshots:
+            return
 
-        for snapshot in self.main_snap_group.snapshots:
-            item = snapshot.make_item(GROUP_MAIN)
-            self.ui.snapshotsList.addTopLevelItem(item)
+        self.main_snap_group.sort()
 
-        self.ui.buttonBox.button(QDialogButtonBox.Ok).setEnabled(False)
-        self.ui.snapshotsList.clearSelection()
+        # only top level items containing new snapshots are made again,
+        # others stay as they are.
+        snapshots_list = self.ui.snapshotsList
+        top_items = {}
+
+        for i, snapshot in enumerate(self.main_snap_group.snapshots):
+            item = self._top_items.get(id(snapshot))
+            if (item is None or snapshot in new_snapshots
+                    or (snapshot.sub_type
+                        and snapshot.contains_any(new_snapshots))):
+                item = snapshot.make_item(GROUP_MAIN)
+            top_items[id(snapshot)] = item
+
+            if snapshots_list.topLevelItem(i) is not item:
+                index = snapshots_list.indexOfTopLevelItem(item)
+                if index >= 0:
+                    snapshots_list.takeTopLevelItem(index)
+                snapshots_list.insertTopLevelItem(i, item)
+
+        # items of snapshots now in a group, or made again
+        while (snapshots_list.topLevelItemCount()
+                > len(self.main_snap_group.snapshots)):
+            snapshots_list.takeTopLevelItem(
+                len(self.main_snap_group.snapshots))
+
+        self._top_items = top_items
 
     def _no_snapshot_found(self):
         pass
@@ -452,8 +553,9 @@ class SessionSnapshotsDialog(SnapshotsDialog):
         SnapshotsDialog.__init__(self, parent)
 
         self.ui.pushButtonSnapshotNow.clicked.connect(self._take_snapshot)
+        self.signaler.snapshot_taken.connect(self._snapshot_taken)
 
-        self.to_daemon('/ray/session/list_snapshots')
+        self._ask_snapshots('/ray/session/list_snapshots')
 
         self.ui.checkBoxAutoSnapshot.stateChanged.connect(
             self._set_auto_snapshot)
@@ -487,7 +589,7 @@ class ClientSnapshotsDialog(SnapshotsDialog):
 
         self.client = client
 
-        self.to_daemon('/ray/client/list_snapshots', client.client_id)
+        self._ask_snapshots('/ray/client/list_snapshots', client.client_id)
         self.resize(0, 0)
 
     def _no_snapshot_found(self):
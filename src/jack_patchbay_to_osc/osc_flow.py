@@ -0,0 +1 @@
+../shared/osc_flow.py
\ No newline at end of file
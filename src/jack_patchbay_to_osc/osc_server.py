@@ -1,6 +1,8 @@
 
+import os
 import sys
 import time
+from collections import deque
 #import pickle
 import tempfile
 import socket
@@ -10,6 +12,27 @@ import subprocess
 from liblo import Server, Address, make_method
 
 import jacklib
+from osc_flow import FlowQueue, ACK_PATH
+import patchbay_snapshot
+
+# graph events are sent at the end of each events pass.
+# consecutive events of the same kind are sent in one message
+# containing at most BATCH_MAX_ITEMS events.
+BATCH_MAX_ITEMS = 50
+BATCH_PATHS = {
+    '/ray/gui/patchbay/port_added': '/ray/gui/patchbay/ports_added',
+    '/ray/gui/patchbay/port_removed': '/ray/gui/patchbay/ports_removed',
+    '/ray/gui/patchbay/port_renamed': '/ray/gui/patchbay/ports_renamed',
+    '/ray/gui/patchbay/connection_added':
+        '/ray/gui/patchbay/connections_added',
+    '/ray/gui/patchbay/connection_removed':
+        '/ray/gui/patchbay/connections_removed',
+    '/ray/gui/patchbay/metadata_updated':
+        '/ray/gui/patchbay/metadatas_updated'}
+
+# sent events batches are kept for GUIs asking a resync,
+# until there are more than JOURNAL_MAX_EVENTS events in the journal.
+JOURNAL_MAX_EVENTS = 10000
 
 
 ### Code copied from shared/ray.py
@@ -107,11 +130,9 @@ def areOnSameMachine(url1, url2):
 
 
 class OscJackPatch(Server):
-    slow_wait_time = 0.020
-    slow_wait_num = 50
-    
     def __init__(self, main_object):
         Server.__init__(self)
+        self.add_method(ACK_PATH, 'i', self._ray_flow_ack)
         self.add_method('/ray/patchbay/add_gui', 's',
                         self._ray_patchbay_add_gui)
         self.add_method('/ray/patchbay/gui_disannounce', '',
@@ -128,23 +149,49 @@ class OscJackPatch(Server):
                         self._ray_patchbay_refresh)
         self.add_method('/ray/patchbay/set_metadata', 'hss',
                         self._ray_patchbay_set_metadata)
+        self.add_method('/ray/patchbay/resync', 'i',
+                        self._ray_patchbay_resync)
         
         self.main_object = main_object
         self.jack_client = main_object.jack_client
-        self.port_list = main_object.port_list
-        self.connection_list = main_object.connection_list
-        self.metadata_list = main_object.metadata_list
-        self.client_list = main_object.client_list
+        self.ports = main_object.ports
+        self.connections = main_object.connections
+        self.metadatas = main_object.metadatas
+        self.clients = main_object.clients
         self.gui_list = []
         self._tmp_gui_url = ''
         self._terminate = False
 
+        # big data sends to distant GUIs wait GUI acknowledgements
+        self.flow_queue = FlowQueue(self._flow_send)
+
+        # graph events not sent yet, (path, args) or None if cancelled
+        self._events_batch = []
+        # index in events batch of port and connection additions
+        self._batch_additions = {}
+
+        # incremented at each sent events batch and each graph reload.
+        # GUIs ignore events with a seq already in their graph snapshot.
+        self.graph_seq = 0
+        self._snapshot_path = "%s/ray-patchbay-graph-%i" % (
+            patchbay_snapshot.get_snapshot_dir(), self.port)
+        self._snapshot_seq = -1
+
+        # sent batches (seq, batch), GUIs knowing the graph
+        # at a seq from _journal_base_seq can be resynced with it.
+        self._journal = deque()
+        self._journal_n_events = 0
+        self._journal_base_seq = 0
+
     def set_tmp_gui_url(self, gui_url):
         self._tmp_gui_url = gui_url
 
     def set_jack_client(self, jack_client):
         self.jack_client = jack_client
     
+    def _ray_flow_ack(self, path, args, types, src_addr):
+        self.flow_queue.ack(src_addr.url, args[0])
+
     def _ray_patchbay_add_gui(self, path, args, types, src_addr):
         self.add_gui(args[0])
 
@@ -153,6 +200,7 @@ class OscJackPatch(Server):
             if gui_addr.url == src_addr.url:
                 # possible because we break the loop
                 self.gui_list.remove(gui_addr)
+                self.flow_queue.forget(gui_addr.url)
                 break
         
         if not self.gui_list:
@@ -161,17 +209,18 @@ class OscJackPatch(Server):
 
     def _ray_patchbay_port_set_alias(self, path, args, types, src_addr):
         port_name, alias_num, alias = args
-        for port in self.port_list:
-            if port.name == port_name:
-                # TODO
-                # better would be to use jacklib.port_set_alias(port, alias)
-                # but this is very confuse
-                # 2 aliases possibles, but only one arg to this method (after port).
-                if alias_num == 1:
-                    port.alias_1 = alias
-                elif alias_num == 2:
-                    port.alias_2 = alias
-                break
+        port = self.ports.get(port_name)
+        if port is None:
+            return
+
+        # TODO
+        # better would be to use jacklib.port_set_alias(port, alias)
+        # but this is very confuse
+        # 2 aliases possibles, but only one arg to this method (after port).
+        if alias_num == 1:
+            port.alias_1 = alias
+        elif alias_num == 2:
+            port.alias_2 = alias
 
     def _ray_patchbay_connect(self, path, args):
         port_out_name, port_in_name = args
@@ -187,13 +236,74 @@ class OscJackPatch(Server):
         buffer_size = args[0]
         self.main_object.set_buffer_size(buffer_size)
 
-    def _ray_patchbay_refresh(self, path, args):
-        self.main_object.refresh()
+    def _ray_patchbay_refresh(self, path, args, types, src_addr):
+        for gui_addr in self.gui_list:
+            if gui_addr.url == src_addr.url:
+                break
+        else:
+            self.main_object.refresh()
+            return
+
+        # JACK graph is read again, but only this GUI receives it.
+        self.main_object.refresh_gui(gui_addr)
 
     def _ray_patchbay_set_metadata(self, path, args):
         uuid, key, value = args
         self.main_object.set_metadata(uuid, key, value)
 
+    def _ray_patchbay_resync(self, path, args, types, src_addr):
+        # GUI knows the graph at seq, it needs only the next events
+        seq = args[0]
+
+        for gui_addr in self.gui_list:
+            if gui_addr.url == src_addr.url:
+                break
+        else:
+            return
+
+        if self._journal_base_seq <= seq <= self.graph_seq:
+            # a distant GUI may have lost events because it was saturated,
+            # replay is sent as fast as it can take it.
+            flow = not areOnSameMachine(self.url, gui_addr.url)
+
+            for batch_seq, batch in self._journal:
+                if batch_seq > seq:
+                    self._send_batch([gui_addr], batch_seq, batch, flow)
+
+            if seq == self.graph_seq:
+                # GUI missed nothing, it can stop asking
+                self.send(gui_addr, '/ray/gui/patchbay/graph_base_seq', seq)
+            return
+
+        # journal doesn't go back so far, GUI needs all the graph
+        self.send(gui_addr, '/ray/gui/patchbay/graph_reset')
+        self._send_graph([gui_addr])
+
+    def _flow_send(self, *args):
+        Server.send(self, *args)
+
+    def send(self, *args):
+        if (len(args) >= 2 and isinstance(args[1], str)
+                and self.flow_queue.has_pending(args[0].url)):
+            # keep messages order with a running big data send
+            self.flow_queue.add(*args)
+            return
+
+        Server.send(self, *args)
+
+    def recv_and_flow(self, timeout: int):
+        ''' receives OSC messages during timeout (in ms)
+        and sends the flow queue without blocking '''
+        end_time = time.monotonic() + timeout * 0.001
+
+        while True:
+            pending = self.flow_queue.process()
+            remaining = int((end_time - time.monotonic()) * 1000)
+            if remaining <= 0:
+                break
+
+            self.recv(min(remaining, 5) if pending else remaining)
+
     def send_gui(self, *args):
         for gui_addr in self.gui_list:
             self.send(gui_addr, *args)
@@ -202,31 +312,78 @@ class OscJackPatch(Server):
         for src_addr in src_addr_list:
             self.send(src_addr, *args)
 
+    def _write_graph_snapshot(self)->bool:
+        if self._snapshot_seq == self.graph_seq:
+            # graph didn't change since last write
+            return True
+
+        if not patchbay_snapshot.write_snapshot(
+                self._snapshot_path, self.graph_seq,
+                [(port.name, port.type, port.flags, port.uuid)
+                 for port in self.ports.values()],
+                self.connections,
+                [(uuid, key, value)
+                 for (uuid, key), value in self.metadatas.items()],
+                self.clients.items()):
+            self._snapshot_seq = -1
+            return False
+
+        self._snapshot_seq = self.graph_seq
+        return True
+
+    def clients_changed(self):
+        # clients are not sent as events, graph snapshot has to be rewritten
+        self._snapshot_seq = -1
+
+    def remove_graph_snapshot(self):
+        if not os.path.exists(self._snapshot_path):
+            return
+
+        try:
+            os.remove(self._snapshot_path)
+        except OSError:
+            pass
+
     def send_local_data(self, src_addr_list):
         # at invitation, if gui is on the same machine
-        # it's prefferable to save all data in /tmp
+        # it's prefferable to give it all data in a file
         # Indeed, to prevent OSC packet loses
         # this daemon will send a lot of OSC messages not too fast
         # so here, it is faster, and prevent OSC saturation.
+        # The graph snapshot is written once for all local GUIs,
+        # preferably in a memory filesystem, and GUIs read it with mmap.
+        if self._write_graph_snapshot():
+            self.multi_send(src_addr_list,
+                            '/ray/gui/patchbay/graph_snapshot',
+                            self._snapshot_path, self.graph_seq)
+            return
+
+        # graph snapshot can not be written, use a json file per GUI.
         # json format (and not binary with pickle) is choosen
         # this way, code language of the GUI is not a blocker
+        self.multi_send(src_addr_list, '/ray/gui/patchbay/graph_base_seq',
+                        self.graph_seq)
+
         patchbay_data = {'ports': [], 'connections': [],
                          'metadatas': [], 'clients': []}
-        for port in self.port_list:
+        for port in self.ports.values():
             port_dict = {'name': port.name, 'type': port.type,
                          'flags': port.flags, 'uuid': port.uuid}
             patchbay_data['ports'].append(port_dict)
         
-        for connection in self.connection_list:
+        for connection in self.connections:
             conn_dict = {'port_out_name': connection[0],
                          'port_in_name': connection[1]}
             patchbay_data['connections'].append(conn_dict)
 
-        for metadata in self.metadata_list:
-            patchbay_data['metadatas'].append(metadata)
+        for uuid_and_key, value in self.metadatas.items():
+            uuid, key = uuid_and_key
+            patchbay_data['metadatas'].append(
+                {'uuid': uuid, 'key': key, 'value': value})
 
-        for client_dict in self.client_list:
-            patchbay_data['clients'].append(client_dict)
+        for client_name, client_uuid in self.clients.items():
+            patchbay_data['clients'].append(
+                {'name': client_name, 'uuid': client_uuid})
 
         for src_addr in src_addr_list:
             # tmp file is deleted by the gui itself once read
@@ -238,53 +395,48 @@ class OscJackPatch(Server):
             self.send(src_addr, '/ray/gui/patchbay/fast_temp_file_running',
                     file.name)
 
+    def multi_flow_send(self, src_addr_list, *args):
+        for src_addr in src_addr_list:
+            self.flow_queue.add(src_addr, *args)
+
     def send_distant_data(self, src_addr_list):
-        # we need to slow the long process of messages sends
-        # to prevent loss packets
-        self.multi_send(src_addr_list, '/ray/gui/patchbay/big_packets', 0)
-        n = 0
-        increment = len(src_addr_list)
-
-        for port in self.port_list:
-            self.multi_send(src_addr_list, '/ray/gui/patchbay/port_added',
-                            port.name, port.type, port.flags, port.uuid)
-            
-            n += increment
-            if n % self.slow_wait_num < increment:
-                self.multi_send(src_addr_list,
-                                '/ray/gui/patchbay/big_packets', 1)
-                time.sleep(self.slow_wait_time)
-                self.multi_send(src_addr_list,
-                                '/ray/gui/patchbay/big_packets', 0)
-
-        for connection in self.connection_list:
-            self.multi_send(src_addr_list,
-                            '/ray/gui/patchbay/connection_added',
-                            connection[0], connection[1])
-            
-            n += increment
-            if n % self.slow_wait_num < increment:
-                self.multi_send(src_addr_list,
-                                '/ray/gui/patchbay/big_packets', 1)
-                time.sleep(self.slow_wait_time)
-                self.multi_send(src_addr_list,
-                                '/ray/gui/patchbay/big_packets', 0)
+        # messages are sent by the flow queue
+        # as fast as GUIs can take them, without packet loss
+        self.multi_flow_send(src_addr_list, '/ray/gui/patchbay/graph_base_seq',
+                             self.graph_seq)
+        self.multi_flow_send(src_addr_list, '/ray/gui/patchbay/big_packets', 0)
+
+        for port in self.ports.values():
+            self.multi_flow_send(src_addr_list, '/ray/gui/patchbay/port_added',
+                                 port.name, port.type, port.flags, port.uuid)
+
+        for connection in self.connections:
+            self.multi_flow_send(src_addr_list,
+                                 '/ray/gui/patchbay/connection_added',
+                                 connection[0], connection[1])
+
+        for uuid_and_key, value in self.metadatas.items():
+            uuid, key = uuid_and_key
+            self.multi_flow_send(src_addr_list,
+                                 '/ray/gui/patchbay/metadata_updated',
+                                 uuid, key, value)
+
+        self.multi_flow_send(src_addr_list, '/ray/gui/patchbay/big_packets', 1)
+
+    def _send_graph(self, src_addr_list):
+        local_guis = []
+        distant_guis = []
+        
+        for gui_addr in src_addr_list:
+            if areOnSameMachine(self.url, gui_addr.url):
+                local_guis.append(gui_addr)
+            else:
+                distant_guis.append(gui_addr)
                 
-        for metadata in self.metadata_list:
-            self.multi_send(src_addr_list,
-                            '/ray/gui/patchbay/metadata_updated',
-                            metadata['uuid'], metadata['key'],
-                            metadata['value'])
-            
-            n += increment
-            if n % self.slow_wait_num < increment:
-                self.multi_send(src_addr_list,
-                                '/ray/gui/patchbay/big_packets', 1)
-                time.sleep(self.slow_wait_time)
-                self.multi_send(src_addr_list,
-                                '/ray/gui/patchbay/big_packets', 0)
-
-        self.multi_send(src_addr_list, '/ray/gui/patchbay/big_packets', 1)
+        if local_guis:
+            self.send_local_data(local_guis)
+        if distant_guis:
+            self.send_distant_data(distant_guis)
 
     def add_gui(self, gui_url):
         gui_addr = Address(gui_url)
@@ -299,48 +451,137 @@ class OscJackPatch(Server):
         self.send(gui_addr, '/ray/gui/patchbay/dsp_load',
                   self.main_object.last_sent_dsp_load)
 
-        if areOnSameMachine(gui_url, self.url):
-            self.send_local_data([gui_addr])
-        else:
-            self.send_distant_data([gui_addr])
-        
+        for known_addr in self.gui_list:
+            if known_addr.url == gui_url:
+                # GUI announces again, it probably already has the graph
+                # it will ask only for the events it missed.
+                self.send(gui_addr, '/ray/gui/patchbay/ask_resync')
+                return
+
+        self._send_graph([gui_addr])
         self.gui_list.append(gui_addr)
 
+    def _reset_journal(self):
+        # graph has changed without events,
+        # GUIs knowing an older graph need all the graph.
+        self._journal.clear()
+        self._journal_n_events = 0
+        self._journal_base_seq = self.graph_seq
+
+    def graph_refreshed(self, gui_addr, changed: bool):
+        addr_list = [gui_addr]
+
+        if changed:
+            # graph has changed without events,
+            # no seq can tell it to other GUIs, they need all the graph.
+            self.graph_seq += 1
+            self._reset_journal()
+            for other_addr in self.gui_list:
+                if other_addr.url != gui_addr.url:
+                    addr_list.append(other_addr)
+
+        for addr in addr_list:
+            self.send(addr, '/ray/gui/patchbay/graph_reset')
+        self._send_graph(addr_list)
+
     def server_restarted(self):
+        # graph has been read again
+        self.graph_seq += 1
+        self._reset_journal()
+
         self.send_gui('/ray/gui/patchbay/server_started')
         self.send_samplerate()
         self.send_buffersize()
-        
-        local_guis = []
-        distant_guis = []
-        
-        for gui_addr in self.gui_list:
-            if areOnSameMachine(self.url, gui_addr.url):
-                local_guis.append(gui_addr)
-            else:
-                distant_guis.append(gui_addr)
-                
-        if local_guis:
-            self.send_local_data(local_guis)
-        if distant_guis:
-            self.send_distant_data(distant_guis)
+        self._send_graph(self.gui_list)
 
     def client_name_and_uuid(self, client_name: str, uuid: int):
         self.send_gui('/ray/gui/patchbay/client_name_and_uuid',
                       client_name, uuid)
 
+    def _add_to_batch(self, path: str, *args):
+        self._events_batch.append((path, args))
+
+    def _cancel_batch_addition(self, key: tuple)->bool:
+        index = self._batch_additions.pop(key, None)
+        if index is None:
+            return False
+
+        # added and removed in the same batch, GUIs don't need to know
+        self._events_batch[index] = None
+        return True
+
+    def send_events_batch(self):
+        batch = [event for event in self._events_batch if event is not None]
+        self._events_batch.clear()
+        self._batch_additions.clear()
+
+        if not batch:
+            return
+
+        self.graph_seq += 1
+
+        # a GUI receiving a replay or the graph by the flow queue
+        # has to get this batch after, else it would see a gap.
+        flowing_guis = [gui_addr for gui_addr in self.gui_list
+                        if self.flow_queue.has_pending(gui_addr.url)]
+        direct_guis = [gui_addr for gui_addr in self.gui_list
+                       if gui_addr not in flowing_guis]
+
+        if flowing_guis:
+            self._send_batch(flowing_guis, self.graph_seq, batch, flow=True)
+        if direct_guis:
+            self._send_batch(direct_guis, self.graph_seq, batch)
+
+        self._journal.append((self.graph_seq, batch))
+        self._journal_n_events += len(batch)
+
+        while self._journal_n_events > JOURNAL_MAX_EVENTS:
+            old_seq, old_batch = self._journal.popleft()
+            self._journal_n_events -= len(old_batch)
+            self._journal_base_seq = old_seq
+
+    def _send_batch(self, src_addr_list, seq: int, batch: list, flow=False):
+        # GUIs know which events follow with their seq
+        multi_send = self.multi_flow_send if flow else self.multi_send
+        multi_send(src_addr_list, '/ray/gui/patchbay/graph_seq', seq)
+
+        i = 0
+        while i < len(batch):
+            path, args = batch[i]
+            j = i + 1
+            while (j < len(batch) and j - i < BATCH_MAX_ITEMS
+                    and batch[j][0] == path):
+                j += 1
+
+            if j - i == 1:
+                multi_send(src_addr_list, path, *args)
+            else:
+                batch_args = []
+                for event_path, event_args in batch[i:j]:
+                    batch_args += event_args
+                multi_send(src_addr_list, BATCH_PATHS[path], *batch_args)
+            i = j
+
     def port_added(self, port):
-        self.send_gui('/ray/gui/patchbay/port_added',
-                      port.name, port.type, port.flags, port.uuid) 
+        self._batch_additions[('port', port.name)] = len(self._events_batch)
+        self._add_to_batch('/ray/gui/patchbay/port_added',
+                           port.name, port.type, port.flags, port.uuid)
 
     def port_renamed(self, port, ex_name):
-        self.send_gui('/ray/gui/patchbay/port_renamed', ex_name, port.name)
+        # a renamed port removal can not cancel its addition anymore
+        self._batch_additions.pop(('port', ex_name), None)
+        self._add_to_batch('/ray/gui/patchbay/port_renamed',
+                           ex_name, port.name)
     
     def port_removed(self, port):
-        self.send_gui('/ray/gui/patchbay/port_removed', port.name)
+        if self._cancel_batch_addition(('port', port.name)):
+            return
+
+        self._add_to_batch('/ray/gui/patchbay/port_removed', port.name)
     
     def metadata_updated(self, uuid: int, key: str, value: str):
-        self.send_gui('/ray/gui/patchbay/metadata_updated', uuid, key, value)
+        self._add_to_batch('/ray/gui/patchbay/metadata_updated',
+                           uuid, key, value)
     
     def port_order_changed(self, port):
         if port.order is None:
@@ -350,16 +591,28 @@ class OscJackPatch(Server):
                       port.name, port.order)
     
     def connection_added(self, connection):
-        self.send_gui('/ray/gui/patchbay/connection_added',
-                     connection[0], connection[1])    
+        self._batch_additions[('connection', connection)] = \
+            len(self._events_batch)
+        self._add_to_batch('/ray/gui/patchbay/connection_added',
+                           connection[0], connection[1])
 
     def connection_removed(self, connection):
-        self.send_gui('/ray/gui/patchbay/connection_removed',
-                     connection[0], connection[1])
+        if self._cancel_batch_addition(('connection', connection)):
+            return
+
+        self._add_to_batch('/ray/gui/patchbay/connection_removed',
+                           connection[0], connection[1])
     
     def server_stopped(self):
+        # graph events not sent yet are obsolete
+        self._events_batch.clear()
+        self._batch_additions.clear()
+        self.graph_seq += 1
+        self._reset_journal()
+
         # here server is JACK (in future maybe pipewire)
         self.send_gui('/ray/gui/patchbay/server_stopped')
+        self.send_gui('/ray/gui/patchbay/graph_base_seq', self.graph_seq)
     
     def send_dsp_load(self, dsp_load: int):
         self.send_gui('/ray/gui/patchbay/dsp_load', dsp_load)
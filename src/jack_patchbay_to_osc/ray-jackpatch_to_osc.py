@@ -8,6 +8,7 @@ import warnings
 import osc_server
 import threading
 import time
+from collections import deque
 
 import jacklib
 from jacklib.helpers import c_char_p_p_to_list, voidptr2str
@@ -16,8 +17,23 @@ PORT_TYPE_NULL = 0
 PORT_TYPE_AUDIO = 1
 PORT_TYPE_MIDI = 2
 
+# events pushed by JACK callbacks to the main loop
+EVENT_SHUTDOWN = 0
+EVENT_CLIENT_REGISTRATION = 1
+EVENT_PORT_REGISTRATION = 2
+EVENT_PORT_RENAME = 3
+EVENT_PORT_CONNECT = 4
+EVENT_PROPERTY_CHANGE = 5
+EVENT_XRUN = 6
+EVENT_SAMPLE_RATE = 7
+EVENT_BUFFER_SIZE = 8
+
 EXISTENCE_PATH = '/tmp/RaySession/patchbay_daemons/'
 
+# main loop duration (ms), JACK events received during this time
+# are sent together to GUIs
+LOOP_TIMEOUT = 20
+
 
 
 
@@ -91,11 +107,6 @@ class JackPort:
 
 
 class MainObject:
-    port_list = []
-    connection_list = []
-    metadata_list = []
-    client_list = [] # list of dicts {'name': client_name, 'uuid': client_uuid}
-    client_names_queue = []
     jack_running = False
     osc_server = None
     terminate = False
@@ -109,6 +120,17 @@ class MainObject:
         self.max_dsp_since_last_sent = 0.00
         self._waiting_jack_client_open = True
 
+        # stores are dicts and sets, a client restart with a lot of ports
+        # and connections must not scan all the graph for each event.
+        self.ports = {} # {port_name: JackPort}
+        self.connections = set() # {(port_out_name, port_in_name)}
+        self.metadatas = {} # {(uuid, key): value}
+        self.clients = {} # {client_name: client_uuid}
+
+        # tuples (EVENT_*, *args) appended by the JACK thread.
+        # deque append and popleft are thread safe.
+        self.events_queue = deque()
+
         self.osc_server = osc_server.OscJackPatch(self)
         self.osc_server.set_tmp_gui_url(gui_url)
         self.write_existence_file()
@@ -162,28 +184,6 @@ class MainObject:
         if sig in (signal.SIGINT, signal.SIGTERM):
             cls.terminate = True
             
-    def eat_client_names_queue(self):
-        while self.client_names_queue:
-            client_name = self.client_names_queue.pop(0)
-            b_uuid = jacklib.get_uuid_for_client_name(self.jack_client, client_name)
-
-            # convert bytes uuid to int
-            uuid = 0
-            if isinstance(b_uuid, bytes):
-                str_uuid = b_uuid.decode()
-                if str_uuid.isdigit():
-                    uuid = int(str_uuid)
-
-            if not uuid:
-                continue
-
-            for client_dict in self.client_list:
-                if client_dict['name'] == client_name:
-                    client_dict['uuid'] = uuid
-                    break
-            else:
-                self.client_list.append({'name': client_name, 'uuid': uuid})
-    
     def add_gui(self, gui_url: str):
         self.osc_server.add_gui(gui_url)
     
@@ -196,6 +196,7 @@ class MainObject:
             # server never answer
             self.osc_server.send_server_lose()
             self.remove_existence_file()
+            self.osc_server.remove_graph_snapshot()
             
             # JACK is not responding at all
             # probably it is started but totally bugged
@@ -206,6 +207,26 @@ class MainObject:
         if self.jack_running:
             self.get_all_ports_and_connections()
             self.osc_server.server_restarted()
+
+    def _get_graph_state(self)->tuple:
+        return ({name: (port.type, port.flags, port.uuid)
+                 for name, port in self.ports.items()},
+                set(self.connections), dict(self.metadatas),
+                dict(self.clients))
+
+    def refresh_gui(self, gui_addr):
+        ''' reads again all the JACK graph for one GUI,
+        other GUIs are resynced only if it has changed. '''
+        # events received before are sent to all GUIs
+        self.eat_events_queue()
+
+        changed = False
+        if self.jack_running:
+            old_state = self._get_graph_state()
+            self.get_all_ports_and_connections()
+            changed = bool(self._get_graph_state() != old_state)
+
+        self.osc_server.graph_refreshed(gui_addr, changed)
     
     def remember_dsp_load(self):
         self.max_dsp_since_last_sent = max(
@@ -223,21 +244,21 @@ class MainObject:
         n = 0
 
         while True:
-            self.osc_server.recv(50)
+            self.osc_server.recv_and_flow(LOOP_TIMEOUT)
             
             if self.is_terminate():
                 break
 
+            self.eat_events_queue()
+
             if self.jack_running:
-                if n % 4 == 0:
+                if n % 10 == 0:
                     self.remember_dsp_load()
-                if n % 20 == 0:
+                if n % 50 == 0:
                     self.send_dsp_load()
-                
-                self.eat_client_names_queue()
 
             else:
-                if n % 10 == 0:
+                if n % 25 == 0:
                     self.start_jack_client()
             n += 1
     
@@ -246,6 +267,7 @@ class MainObject:
             jacklib.deactivate(self.jack_client)
             jacklib.client_close(self.jack_client)
         self.remove_existence_file()
+        self.osc_server.remove_graph_snapshot()
         del self.osc_server
     
     def start_jack_client(self):
@@ -310,24 +332,21 @@ class MainObject:
         jacklib.activate(self.jack_client)
     
     def get_all_ports_and_connections(self):
-        self.port_list.clear()
-        self.connection_list.clear()
-        self.metadata_list.clear()
+        self.ports.clear()
+        self.connections.clear()
+        self.metadatas.clear()
 
         #get all currents Jack ports and connections
         port_name_list = c_char_p_p_to_list(
             jacklib.get_ports(self.jack_client, "", "", 0))
         
-        client_names = []
+        client_names = set()
         
         for port_name in port_name_list:
             port_ptr = jacklib.port_by_name(self.jack_client, port_name)
             jport = JackPort(port_name, self.jack_client)
-            self.port_list.append(jport)
-            
-            client_name = port_name.partition(':')[0]
-            if not client_name in client_names:
-                client_names.append(client_name)
+            self.ports[port_name] = jport
+            client_names.add(port_name.partition(':')[0])
 
             # get port metadatas
             for key in (jacklib.JACK_METADATA_CONNECTED,
@@ -338,11 +357,8 @@ class MainObject:
                 if prop is None:
                     continue
 
-                value = self.get_metadata_value_str(prop)
-                self.metadata_list.append(
-                    {'uuid': jport.uuid,
-                     'key': key,
-                     'value': value})
+                self.metadatas[(jport.uuid, key)] = \
+                    self.get_metadata_value_str(prop)
 
             if jport.flags & jacklib.JackPortIsInput:
                 continue
@@ -354,43 +370,143 @@ class MainObject:
                 jacklib.port_get_all_connections(self.jack_client, port_ptr))
 
             for port_con_name in port_connection_names:
-                self.connection_list.append((jport.name, port_con_name))
+                self.connections.add((jport.name, port_con_name))
         
         for client_name in client_names:
             uuid = jacklib.get_uuid_for_client_name(self.jack_client, client_name)
             if not uuid:
                 continue
 
-            self.client_list.append({'name': client_name, 'uuid': int(uuid)})
-
-        #self.port_list.sort()
+            self.clients[client_name] = int(uuid)
     
+    def eat_events_queue(self):
+        ''' applies all events received from JACK callbacks since last call.
+        This is the only place where ports, connections and metadatas
+        are modified after the first get_all_ports_and_connections. '''
+        while self.events_queue:
+            event = self.events_queue.popleft()
+            event_type = event[0]
+
+            if event_type == EVENT_SHUTDOWN:
+                self.jack_running = False
+                self.ports.clear()
+                self.connections.clear()
+                self.events_queue.clear()
+                self.osc_server.server_stopped()
+                return
+
+            if not self.jack_running:
+                continue
+
+            if event_type == EVENT_CLIENT_REGISTRATION:
+                self.client_registered(*event[1:])
+            elif event_type == EVENT_PORT_REGISTRATION:
+                self.port_registered(*event[1:])
+            elif event_type == EVENT_PORT_RENAME:
+                self.port_renamed(*event[1:])
+            elif event_type == EVENT_PORT_CONNECT:
+                self.port_connected(*event[1:])
+            elif event_type == EVENT_PROPERTY_CHANGE:
+                self.property_changed(*event[1:])
+            elif event_type == EVENT_XRUN:
+                self.osc_server.send_one_xrun()
+            elif event_type == EVENT_SAMPLE_RATE:
+                self.samplerate = event[1]
+                self.osc_server.send_samplerate()
+            elif event_type == EVENT_BUFFER_SIZE:
+                self.buffer_size = event[1]
+                self.osc_server.send_buffersize()
+
+        self.osc_server.send_events_batch()
+
+    def client_registered(self, client_name: str, register: int):
+        if not register:
+            return
+
+        b_uuid = jacklib.get_uuid_for_client_name(self.jack_client, client_name)
+
+        # convert bytes uuid to int
+        uuid = 0
+        if isinstance(b_uuid, bytes):
+            str_uuid = b_uuid.decode()
+            if str_uuid.isdigit():
+                uuid = int(str_uuid)
+
+        if uuid and self.clients.get(client_name) != uuid:
+            self.clients[client_name] = uuid
+            self.osc_server.clients_changed()
+
+    def port_registered(self, port_name: str, jport, register: int):
+        if register:
+            if port_name in self.ports:
+                # already found by get_all_ports_and_connections
+                return
+
+            self.ports[port_name] = jport
+            self.osc_server.port_added(jport)
+        else:
+            jport = self.ports.pop(port_name, None)
+            if jport is not None:
+                self.osc_server.port_removed(jport)
+
+    def port_renamed(self, old_name: str, new_name: str):
+        jport = self.ports.pop(old_name, None)
+        if jport is not None:
+            jport.name = new_name
+            self.ports[jport.name] = jport
+            self.osc_server.port_renamed(jport, old_name)
+
+    def port_connected(self, port_out_name: str, port_in_name: str,
+                       connect_yesno: int):
+        connection = (port_out_name, port_in_name)
+
+        if connect_yesno:
+            if connection not in self.connections:
+                self.connections.add(connection)
+                self.osc_server.connection_added(connection)
+        elif connection in self.connections:
+            self.connections.discard(connection)
+            self.osc_server.connection_removed(connection)
+
+    def property_changed(self, uuid: int, name: str, type_: int):
+        value = ''
+
+        if name and type_ != jacklib.PropertyDeleted:
+            prop = jacklib.get_property(uuid, name)
+            if prop is None:
+                return
+            
+            value = self.get_metadata_value_str(prop)
+        
+        self.metadatas[(uuid, name)] = value
+        
+        self.osc_server.metadata_updated(uuid, name, value)
+
+    # JACK callbacks are called from the JACK notification thread.
+    # They only push events to the queue eaten by the main loop,
+    # so the JACK thread is never blocked by the Python work
+    # and the stores are only modified from the main thread.
+
     def jack_shutdown_callback(self, arg=None)->int:
-        self.jack_running = False
-        self.port_list.clear()
-        self.connection_list.clear()
-        self.osc_server.server_stopped()
+        self.events_queue.append((EVENT_SHUTDOWN,))
         return 0
 
     def jack_xrun_callback(self, arg=None)->int:
-        self.osc_server.send_one_xrun()
+        self.events_queue.append((EVENT_XRUN,))
         return 0
 
     def jack_sample_rate_callback(self, samplerate, arg=None)->int:
-        self.samplerate = samplerate
-        self.osc_server.send_samplerate()
+        self.events_queue.append((EVENT_SAMPLE_RATE, samplerate))
         return 0
 
     def jack_buffer_size_callback(self, buffer_size, arg=None)->int:
-        self.buffer_size = buffer_size
-        self.osc_server.send_buffersize()
+        self.events_queue.append((EVENT_BUFFER_SIZE, buffer_size))
         return 0
 
     def jack_client_registration_callback(self, client_name: bytes,
                                           register: int, arg=None)->int:
-        
-        client_name = client_name.decode()
-        self.client_names_queue.append(client_name)
+        self.events_queue.append(
+            (EVENT_CLIENT_REGISTRATION, client_name.decode(), register))
         return 0
         
     def jack_port_registration_callback(self, port_id: int, register: bool,
@@ -398,77 +514,44 @@ class MainObject:
         if not self.jack_client:
             return 0
         
+        # port is read now, port could not be found by id later,
+        # and port_ptr could point to a freed port
+        # when the event is eaten.
         port_ptr = jacklib.port_by_id(self.jack_client, port_id)
         port_name = jacklib.port_name(port_ptr)
-        
+
+        jport = None
         if register:
             jport = JackPort(port_name, self.jack_client, port_ptr)
-            self.port_list.append(jport)
-            self.osc_server.port_added(jport)
-        else:
-            for jport in self.port_list:
-                if jport.name == port_name:
-                    self.port_list.remove(jport)
-                    self.osc_server.port_removed(jport)
-                    break
+
+        self.events_queue.append(
+            (EVENT_PORT_REGISTRATION, port_name, jport, register))
         return 0
     
     def jack_port_rename_callback(self, port_id: int, old_name: str,
                                   new_name: str, arg=None)->int:
-        for jport in self.port_list:
-            if jport.name == str(old_name.decode()):
-                ex_name = jport.name
-                jport.name = str(new_name.decode())
-                self.osc_server.port_renamed(jport, ex_name)
-                break
+        self.events_queue.append(
+            (EVENT_PORT_RENAME, str(old_name.decode()),
+             str(new_name.decode())))
         return 0
     
     def jack_port_connect_callback(self, port_id_A: int, port_id_B: int,
                                    connect_yesno: bool, arg=None)->int:
-        #if not self.jack_client:
-            #return 0
-        
         port_ptr_A = jacklib.port_by_id(self.jack_client, port_id_A)
         port_ptr_B = jacklib.port_by_id(self.jack_client, port_id_B)
 
-        port_str_A = jacklib.port_name(port_ptr_A)
-        port_str_B = jacklib.port_name(port_ptr_B)
-
-        connection = (port_str_A, port_str_B)
-
-        if connect_yesno:
-            self.connection_list.append(connection)
-            self.osc_server.connection_added(connection)
-        elif connection in self.connection_list:
-            self.connection_list.remove(connection)
-            self.osc_server.connection_removed(connection)
-
+        self.events_queue.append(
+            (EVENT_PORT_CONNECT, jacklib.port_name(port_ptr_A),
+             jacklib.port_name(port_ptr_B), connect_yesno))
         return 0
 
     def jack_properties_change_callback(self, uuid: int, name: bytes,
                                         type_: int, arg=None)->int:
         if name is not None:
             name = name.decode()
-        
-        value = ''
-
-        if name and type_ != jacklib.PropertyDeleted:
-            prop = jacklib.get_property(uuid, name)
-            if prop is None:
-                return 0
-            
-            value = self.get_metadata_value_str(prop)
-        
-        for metadata in self.metadata_list:
-            if metadata['uuid'] == uuid and metadata['key'] == name:
-                metadata['value'] = value
-                break
-        else:
-            self.metadata_list.append(
-                {'uuid': uuid, 'key': name, 'value': value})
-        
-        self.osc_server.metadata_updated(uuid, name, value)
 
+        # property value is read by the main loop
+        self.events_queue.append((EVENT_PROPERTY_CHANGE, uuid, name, type_))
         return 0
     
     def set_buffer_size(self, buffer_size: int):
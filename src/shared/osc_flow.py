@@ -0,0 +1,166 @@
+
+# Qt free module, also used by ray-jackpatch_to_osc
+
+import threading
+import time
+
+# path sent at each window end, the receiver has to answer
+# ACK_PATH with the same sequence number once previous messages are treated
+ACK_REQUEST_PATH = '/ray/gui/flow/ack_request'
+ACK_PATH = '/ray/flow/ack'
+
+WINDOW_MIN = 8
+WINDOW_START = 32
+WINDOW_MAX = 1024
+WINDOW_INCREMENT = 16
+
+# time to wait an acknowledgement is 4 times the smoothed round trip time,
+# bounded between these values (in seconds)
+ACK_TIMEOUT_MIN = 0.050
+ACK_TIMEOUT_MAX = 0.500
+
+# receiver never answered after this number of windows,
+# it probably doesn't know acknowledgements
+MAX_UNANSWERED = 3
+
+# with a receiver without acknowledgements,
+# windows are spaced by this time (in seconds)
+NO_ACK_PAUSE = 0.020
+
+
+class _Destination:
+    def __init__(self, addr):
+        self.addr = addr
+        self.messages = []
+        self.window = WINDOW_START
+        self.slow_start = True
+        self.n_sent = 0
+        self.seq = 0
+        self.waiting_seq = 0
+        self.waiting_since = 0.0
+        self.pause_until = 0.0
+        self.srtt = 0.0
+        self.acked_once = False
+        self.unanswered = 0
+
+    def ack_timeout(self)->float:
+        if not self.srtt:
+            return ACK_TIMEOUT_MAX
+        return min(max(4 * self.srtt, ACK_TIMEOUT_MIN), ACK_TIMEOUT_MAX)
+
+
+class FlowQueue:
+    ''' Non blocking send queue with windowed acknowledgements.
+    Messages are sent by windows, at each window end the receiver is
+    asked to acknowledge, next window is sent once it answered.
+    Window grows while the receiver answers quickly and is halved when
+    an acknowledgement is late, so a bulk transfer goes as fast
+    as the receiver can take it.
+    process() never blocks, it has to be called regularly
+    while has_pending() is True. Thread safe. '''
+
+    def __init__(self, send_function):
+        self._send_function = send_function
+        self._dests = {}
+        self._lock = threading.Lock()
+
+    def add(self, addr, *args):
+        with self._lock:
+            dest = self._dests.get(addr.url)
+            if dest is None:
+                dest = _Destination(addr)
+                self._dests[addr.url] = dest
+            dest.messages.append(args)
+
+    def has_pending(self, url='')->bool:
+        with self._lock:
+            if url:
+                dest = self._dests.get(url)
+                return bool(dest is not None and dest.messages)
+
+            for dest in self._dests.values():
+                if dest.messages:
+                    return True
+        return False
+
+    def forget(self, url: str):
+        ''' drops all waiting messages for url, for a gone receiver '''
+        with self._lock:
+            self._dests.pop(url, None)
+
+    def ack(self, url: str, seq: int):
+        with self._lock:
+            dest = self._dests.get(url)
+            if dest is None or seq != dest.waiting_seq:
+                return
+
+            rtt = time.monotonic() - dest.waiting_since
+            dest.srtt = rtt if not dest.srtt else 0.875 * dest.srtt + 0.125 * rtt
+            dest.waiting_seq = 0
+            dest.acked_once = True
+            dest.unanswered = 0
+
+            if dest.slow_start:
+                dest.window = min(dest.window * 2, WINDOW_MAX)
+            else:
+                dest.window = min(dest.window + WINDOW_INCREMENT, WINDOW_MAX)
+
+    def _check_waiting(self, dest: _Destination, now: float)->bool:
+        ''' returns True if dest can send now '''
+        if dest.waiting_seq:
+            if now - dest.waiting_since < dest.ack_timeout():
+                return False
+
+            # acknowledgement is late, receiver is probably saturated
+            dest.waiting_seq = 0
+            dest.slow_start = False
+            dest.window = max(dest.window // 2, WINDOW_MIN)
+            if not dest.acked_once:
+                dest.unanswered += 1
+
+        return bool(now >= dest.pause_until)
+
+    def process(self):
+        ''' sends all messages allowed by windows now.
+        returns True if some messages are still waiting '''
+        to_send = []
+        pending = False
+
+        with self._lock:
+            now = time.monotonic()
+
+            for url, dest in list(self._dests.items()):
+                if not dest.messages:
+                    if not dest.waiting_seq:
+                        # keep it only for its window and round trip time
+                        dest.n_sent = 0
+                    continue
+
+                if not self._check_waiting(dest, now):
+                    pending = True
+                    continue
+
+                n = min(dest.window - dest.n_sent, len(dest.messages))
+                for message in dest.messages[:n]:
+                    to_send.append((dest.addr, message))
+                del dest.messages[:n]
+                dest.n_sent += n
+
+                if dest.n_sent >= dest.window:
+                    dest.n_sent = 0
+                    if dest.unanswered >= MAX_UNANSWERED:
+                        dest.pause_until = now + NO_ACK_PAUSE
+                    else:
+                        dest.seq += 1
+                        dest.waiting_seq = dest.seq
+                        dest.waiting_since = now
+                        to_send.append(
+                            (dest.addr, (ACK_REQUEST_PATH, dest.seq)))
+
+                if dest.messages:
+                    pending = True
+
+        for addr, message in to_send:
+            self._send_function(addr, *message)
+
+        return pending
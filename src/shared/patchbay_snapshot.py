@@ -0,0 +1,153 @@
+
+# Qt free module, also used by ray-jackpatch_to_osc
+
+# The patchbay daemon writes the whole JACK graph in one binary file,
+# read by all local GUIs with mmap.
+# All strings (port names, metadata keys and values, client names)
+# are written once in a strings table, items refer to their index.
+#
+# file contents (little endian):
+#   header
+#   strings: n_strings * (u32 length + utf-8 bytes)
+#   ports: n_ports * (u32 name, u32 type, u32 flags, u64 uuid)
+#   connections: n_connections * (u32 port_out_name, u32 port_in_name)
+#   metadatas: n_metadatas * (u64 uuid, u32 key, u32 value)
+#   clients: n_clients * (u32 name, u64 uuid)
+
+import mmap
+import os
+import struct
+import tempfile
+
+MAGIC = b'RAYPBGS\0'
+VERSION = 1
+
+# magic, version, seq, n_strings, n_ports,
+# n_connections, n_metadatas, n_clients
+_HEADER = struct.Struct('<8sIQIIIII')
+_STRING_LEN = struct.Struct('<I')
+_PORT = struct.Struct('<IIIQ')
+_CONNECTION = struct.Struct('<II')
+_METADATA = struct.Struct('<QII')
+_CLIENT = struct.Struct('<IQ')
+
+
+def get_snapshot_dir()->str:
+    # prefer a memory filesystem
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+def write_snapshot(path: str, seq: int, ports, connections,
+                   metadatas, clients)->bool:
+    ''' writes the graph at seq in path, atomically.
+        ports: iterable of (name, type, flags, uuid)
+        connections: iterable of (port_out_name, port_in_name)
+        metadatas: iterable of (uuid, key, value)
+        clients: iterable of (client_name, client_uuid)
+        returns False if file can not be written. '''
+    strings = {}
+
+    def intern(string: str)->int:
+        index = strings.get(string)
+        if index is None:
+            index = strings[string] = len(strings)
+        return index
+
+    try:
+        port_data = [_PORT.pack(intern(name), port_type, flags, uuid)
+                     for name, port_type, flags, uuid in ports]
+        connection_data = [_CONNECTION.pack(intern(port_out), intern(port_in))
+                           for port_out, port_in in connections]
+        metadata_data = [_METADATA.pack(uuid, intern(key), intern(value))
+                         for uuid, key, value in metadatas
+                         if key is not None]
+        client_data = [_CLIENT.pack(intern(name), uuid)
+                       for name, uuid in clients]
+    except struct.error:
+        return False
+
+    string_data = []
+    for string in strings:
+        b_string = string.encode()
+        string_data.append(_STRING_LEN.pack(len(b_string)))
+        string_data.append(b_string)
+
+    header = _HEADER.pack(MAGIC, VERSION, seq, len(strings), len(port_data),
+                          len(connection_data), len(metadata_data),
+                          len(client_data))
+
+    # temp file name is not predictable, even in a shared folder
+    try:
+        fd, tmp_path = tempfile.mkstemp(
+            prefix='.%s.' % os.path.basename(path),
+            dir=os.path.dirname(path) or None)
+    except OSError:
+        return False
+
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(header)
+            for data in (string_data, port_data, connection_data,
+                         metadata_data, client_data):
+                file.write(b''.join(data))
+
+        # GUIs still reading the previous file keep it until they close it
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+
+    return True
+
+def read_snapshot(path: str)->dict:
+    ''' returns a dict with seq and graph items as in write_snapshot,
+        or an empty dict if file is not a valid snapshot. '''
+    try:
+        with open(path, 'rb') as file:
+            with mmap.mmap(file.fileno(), 0,
+                           access=mmap.ACCESS_READ) as snap:
+                return _read_mmap(snap)
+    except (OSError, ValueError, IndexError, struct.error,
+            UnicodeDecodeError):
+        return {}
+
+def _read_mmap(snap: mmap.mmap)->dict:
+    (magic, version, seq, n_strings, n_ports, n_connections,
+     n_metadatas, n_clients) = _HEADER.unpack_from(snap, 0)
+
+    if magic != MAGIC or version != VERSION:
+        return {}
+
+    offset = _HEADER.size
+
+    strings = []
+    for i in range(n_strings):
+        length, = _STRING_LEN.unpack_from(snap, offset)
+        offset += _STRING_LEN.size
+        strings.append(snap[offset:offset + length].decode())
+        offset += length
+
+    def items(struct_: struct.Struct, n_items: int):
+        nonlocal offset
+        end = offset + struct_.size * n_items
+        if end > len(snap):
+            raise ValueError
+        data = snap[offset:end]
+        offset = end
+        return struct_.iter_unpack(data)
+
+    ports = [(strings[name], port_type, flags, uuid)
+             for name, port_type, flags, uuid in items(_PORT, n_ports)]
+    connections = [(strings[port_out], strings[port_in])
+                   for port_out, port_in in items(_CONNECTION, n_connections)]
+    metadatas = [(uuid, strings[key], strings[value])
+                 for uuid, key, value in items(_METADATA, n_metadatas)]
+    clients = [(strings[name], uuid)
+               for name, uuid in items(_CLIENT, n_clients)]
+
+    return {'seq': seq, 'ports': ports, 'connections': connections,
+            'metadatas': metadatas, 'clients': clients}
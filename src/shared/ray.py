@@ -107,6 +107,9 @@ class Option:
     SNAPSHOTS = 0x040
     SESSION_SCRIPTS = 0x080
     GUI_STATES = 0x100
+    SNAPSHOT_BIG_FILES = 0x200
+    HARDLINK_READ_ONLY = 0x400
+    SKIP_CLEAN_SAVE = 0x800
 
 
 class Err: